@@ -0,0 +1,334 @@
+"""
+Alert engine - evaluates the alert rules (see analytics.alert_rules) on the rows appended to a site's dataset
+files and stores the alerts in a SQLite table.
+
+The raw sensor files are already tailed by the ingestion service (ingest.py), the engine subscribes to the rows
+it parses. For the other files used by a rule it keeps a TailReader and a watchdog observer on their folders: when
+a file changes, only the rows appended since the last read are parsed and fed to the rules of that dataset. The
+history is evaluated on a background thread, not on the script run that starts the engine. Rules are
+set in a JSON file (`DASHBOARD_ALERT_RULES`, a list of rule specs) or DEFAULT_RULES. New alerts are logged; the
+history read when the engine starts is stored but logged as a count only. Replay a rule set over the history
+for tuning without the app:
+
+    python alerts.py --replay --rules my_rules.json --start 2024-01-01
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import partial
+
+import pandas as pd
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+import ingest
+import loaders
+import sites
+from analytics import alert_rules, storage
+
+ALERTS_ENABLED = os.environ.get("DASHBOARD_ALERTS", "1") == "1"
+ALERTS_DB = os.environ.get("DASHBOARD_ALERTS_DB", os.path.join("logs", "alerts.sqlite"))
+ALERT_RULES = os.environ.get("DASHBOARD_ALERT_RULES")
+
+# a rule bound set to this is the critical tank level (ft) recorded in the site's storage file
+CRITICAL_LEVEL = "critical_level"
+
+DEFAULT_RULES = [
+    {"type": "band", "name": "tank level below critical", "dataset": "storage", "column": "water_level_ft",
+     "low": CRITICAL_LEVEL, "minutes": 60},
+    {"type": "band", "name": "pressure out of band", "dataset": "pressure",
+     "column": "Distribution System Pressure, psi", "low": 20, "high": 80, "minutes": 30},
+    {"type": "above_normal", "name": "backwash volume above normal", "dataset": "backwash", "column": "volume_m3",
+     "where": {"event_type": "backwash_event_start"}, "sigmas": 1.5, "min_events": 10},
+    {"type": "drift", "name": "demand drift", "dataset": "system_flow", "column": loaders.DEMAND_COL,
+     "threshold": 0.3, "fast_hours": 24, "slow_hours": 24 * 14},
+]
+
+logger = logging.getLogger("alerts")
+
+
+def critical_level_ft(site: sites.Site) -> float | None:
+    """ Critical tank level of the site from the first row of its storage file, None without one """
+    path = site.path("storage")
+    if not os.path.exists(path):
+        return None
+    return storage.critical_threshold_ft(pd.read_csv(path, nrows=1))
+
+
+def load_rules(path: str | None = ALERT_RULES, site: sites.Site | None = None) -> list:
+    """
+    Rules of a JSON file with a list of rule specs, DEFAULT_RULES without one. Bounds set to CRITICAL_LEVEL take
+    the site's critical tank level, rules needing one the site does not record are left out
+    """
+    site = site or sites.get_site(sites.DEFAULT_SITE)
+    specs = DEFAULT_RULES
+    if path:
+        with open(path) as f:
+            specs = json.load(f)
+    rules = []
+    for spec in specs:
+        bounds = [k for k in ("low", "high") if spec.get(k) == CRITICAL_LEVEL]
+        if bounds:
+            level = critical_level_ft(site)
+            if level is None:
+                logger.info("%s: rule %r skipped, no critical tank level", site.name, spec.get("name"))
+                continue
+            spec = {**spec, **{k: level for k in bounds}}
+        rules.append(alert_rules.make_rule(spec))
+    return rules
+
+
+def dataset_frame(site: sites.Site, dataset: str) -> pd.DataFrame:
+    """ The whole dataset from the cached loaders, indexed by time as the appended rows are """
+    if dataset == "storage":
+        return loaders.load_storage_levels(site=site)
+    if dataset == "backwash":
+        return loaders.load_backwash(site=site).set_index("timestamp")
+    return loaders.load_sensor(dataset, site)
+
+
+class AlertStore:
+    """ SQLite table of the alerts, one row per site, rule and time """
+    def __init__(self, path: str = ALERTS_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS alerts (
+                    site TEXT, rule TEXT, time TEXT, since TEXT, value REAL, message TEXT, created TEXT,
+                    PRIMARY KEY (site, rule, time)
+                )""")
+
+    def add(self, site: str, new_alerts: list[alert_rules.Alert]) -> list[alert_rules.Alert]:
+        """ Store the alerts, returns those not stored before """
+        created = pd.Timestamp.now().isoformat(timespec="seconds")
+        stored = []
+        with self._lock, self._conn:
+            for a in new_alerts:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO alerts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (site, a.rule, a.time.isoformat(), a.since.isoformat(), a.value, a.message, created))
+                if cursor.rowcount:
+                    stored.append(a)
+        return stored
+
+    def recent(self, site: str | None = None, limit: int = 100) -> pd.DataFrame:
+        """ The latest alerts, newest first """
+        query = "SELECT * FROM alerts" + (" WHERE site = ?" if site else "") + " ORDER BY time DESC LIMIT ?"
+        with self._lock:
+            return pd.read_sql_query(query, self._conn, params=(site, limit) if site else (limit,),
+                                     parse_dates=["time", "since"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.engine.check_path(event.src_path)
+
+    on_created = on_modified
+
+
+class AlertEngine:
+    """
+    Feeds the rows appended to the site's files to the rules of their dataset. Files the ingestion service already
+    tails come from its parsed rows, the others from a TailReader of their own. The history is evaluated on a
+    background thread started by `start()`, `ready` is set once it is done.
+    """
+    def __init__(self, site: sites.Site, rules: list, store: AlertStore):
+        self.site = site
+        self.store = store
+        self.rules = {}
+        for rule in rules:
+            self.rules.setdefault(rule.dataset, []).append(rule)
+        self.readers = {}  # dataset -> TailReader, for the datasets not fed by the ingestion service
+        self.paths = {}  # absolute path -> dataset, of the readers
+        self.last = {}  # dataset -> last timestamp fed to the rules
+        self.counts = {"rows": 0, "alerts": 0}
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()  # the readers are read by the observer and the start thread
+        self._subscriptions = []  # (ingestion series, listener)
+        self._thread = None
+        self._observer = None
+
+    def _evaluate(self, dataset: str, df: pd.DataFrame) -> list[alert_rules.Alert]:
+        """ Evaluate the rows in time order past the last ones evaluated, returns the new alerts """
+        with self._lock:
+            catching_up = dataset not in self.last
+            if not catching_up:
+                df = df[df.index > self.last[dataset]]  # rules take rows in time order, like the ingestion
+            df = df.sort_index(kind="stable")
+            if df.empty:
+                return []
+            self.last[dataset] = df.index[-1]
+            found = [a for rule in self.rules[dataset] for a in alert_rules.evaluate(rule, df)]
+            new = self.store.add(self.site.name, found)
+            self.counts["rows"] += len(df)
+            self.counts["alerts"] += len(new)
+        if catching_up:
+            if new:
+                logger.info("%s: %d alerts in the history of %s", self.site.name, len(new), dataset)
+        else:
+            for a in new:
+                logger.warning("%s: %s at %s - %s", self.site.name, a.rule, a.time, a.message)
+        return new
+
+    def _reset(self, dataset: str):
+        """ The file was rewritten: evaluate it from scratch """
+        with self._lock:
+            for rule in self.rules[dataset]:
+                rule.reset()
+            self.last.pop(dataset, None)
+
+    def _on_rows(self, dataset: str, df: pd.DataFrame | None):
+        """ Listener of an ingestion service series """
+        if df is None:
+            self._reset(dataset)
+        else:
+            self._evaluate(dataset, df)
+
+    def check(self, dataset: str) -> list[alert_rules.Alert]:
+        """ Evaluate the rows appended to a dataset read by the engine since the last check, returns the new alerts """
+        with self._read_lock:
+            reader = self.readers[dataset]
+            if not os.path.exists(reader.path):
+                return []
+            try:
+                df = reader.read_new()
+            except ingest.FileTruncated:
+                reader = self.readers[dataset] = ingest.TailReader(reader.path)
+                self._reset(dataset)
+                df = reader.read_new()
+            if df is None or df.empty:
+                return []
+            return self._evaluate(dataset, df)
+
+    def check_path(self, path: str):
+        dataset = self.paths.get(os.path.abspath(path))
+        if dataset is not None:
+            self.check(dataset)
+
+    def _start(self):
+        service = ingest.active_service()
+        for dataset in self.rules:
+            path = self.site.path(dataset)
+            if service is not None and service.tracks(path):
+                series, listener = service.get(path), partial(self._on_rows, dataset)
+                self._subscriptions.append((series, listener))
+                series.subscribe(listener)  # feeds the history first
+            else:
+                self.readers[dataset] = ingest.TailReader(path)
+                self.paths[os.path.abspath(path)] = dataset
+        if self.readers:
+            # the observer is started before the history is read, rows appended meanwhile are read by one of both
+            self._observer = PollingObserver(timeout=5) if ingest.USE_POLLING else Observer()
+            for folder in {os.path.dirname(p) for p in self.paths}:
+                self._observer.schedule(_Handler(self), folder, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+            for dataset in self.readers:
+                self.check(dataset)
+        self.ready.set()
+        logger.info("%s: alert engine ready, %d rows evaluated", self.site.name, self.counts["rows"])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._start, name="alert-engine", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for series, listener in self._subscriptions:
+            with series.lock:
+                series.listeners.remove(listener)
+        self._subscriptions = []
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and (self._observer is None or self._observer.is_alive())
+
+
+def replay(site: sites.Site, rules: list, start=None, end=None) -> pd.DataFrame:
+    """ Alerts of the rules over the history of the site (from fresh state), evaluated one block per rule """
+    frames = []
+    for rule in rules:
+        df = dataset_frame(site, rule.dataset).loc[start:end]
+        frames.append(alert_rules.replay(rule, df))
+    return pd.concat(frames, ignore_index=True).sort_values("time", ignore_index=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def start_engine() -> AlertEngine | None:
+    """ Start the process-wide alert engine of the default site (once), unless DASHBOARD_ALERTS=0 """
+    global _engine
+    if not ALERTS_ENABLED:
+        return None
+    with _engine_lock:
+        if _engine is None:
+            site = sites.get_site(sites.DEFAULT_SITE)
+            _engine = AlertEngine(site, load_rules(site=site), AlertStore()).start()
+        return _engine
+
+
+def active_engine() -> AlertEngine | None:
+    return _engine
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay alert rules over the history of a site")
+    parser.add_argument("--replay", action="store_true", help="evaluate the rules over the history")
+    parser.add_argument("--rules", default=ALERT_RULES, help="JSON file with a list of rule specs")
+    parser.add_argument("--site", default=sites.DEFAULT_SITE)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--store", action="store_true", help=f"also store the alerts in {ALERTS_DB}")
+    parser.add_argument("--recent", type=int, default=0, help="show the latest stored alerts")
+    args = parser.parse_args()
+
+    site = sites.get_site(args.site)
+    if args.replay:
+        rules = load_rules(args.rules, site)
+        t0 = time.perf_counter()
+        found = replay(site, rules, args.start, args.end)
+        elapsed = time.perf_counter() - t0
+        with pd.option_context("display.max_rows", None, "display.width", 200, "display.max_colwidth", 80):
+            print(found[["time", "rule", "since", "message"]].to_string(index=False))
+        counts = found["rule"].value_counts()
+        for rule in rules:
+            print(f"{rule.name:<32} {counts.get(rule.name, 0):>5} alerts")
+        print(f"replayed {len(rules)} rules in {elapsed:.2f}s")
+        if args.store:
+            store = AlertStore()
+            stored = store.add(site.name, [alert_rules.Alert(*row) for row in found.itertuples(index=False)])
+            print(f"{len(stored)} new alerts stored in {ALERTS_DB}")
+    if args.recent:
+        print(AlertStore().recent(site.name, args.recent).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+"""
+Computations behind the dashboard pages, free of any Streamlit dependency so they can be reused by
+batch jobs, caches and benchmarks. Inputs and outputs are NumPy / pandas structures.
+"""
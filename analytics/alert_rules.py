@@ -0,0 +1,250 @@
+"""
+Alert rules evaluated on blocks of readings as they are appended to a dataset.
+
+Every rule keeps a constant-size state between blocks (the open run, running sums, the current hour and two
+averages) and evaluates a whole block with array operations, so feeding a dataset block by block as rows arrive
+or as one block over the whole history (`replay`) gives the same alerts.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from analytics.units import DERIVED_COLUMNS, derived_column
+
+NS_PER_MIN = 60 * 10 ** 9
+NS_PER_HOUR = 60 * NS_PER_MIN
+
+
+class Alert(NamedTuple):
+    time: pd.Timestamp  # when the rule fired
+    rule: str
+    value: float
+    since: pd.Timestamp  # start of the condition
+    message: str
+
+
+def column_values(df: pd.DataFrame, column: str) -> pd.Series | None:
+    """ A stored or derived (see units.DERIVED_COLUMNS) column of a frame, None if the frame has neither """
+    if column in df.columns:
+        return df[column]
+    if column in DERIVED_COLUMNS and DERIVED_COLUMNS[column][0] in df.columns:
+        return derived_column(df, column)
+    return None
+
+
+def _finite(ts: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ int64 ns timestamps and float64 values of the readings with a value """
+    values = np.asarray(values, dtype=float)
+    valid = np.isfinite(values)
+    return np.asarray(ts, dtype="datetime64[ns]").view("i8")[valid], values[valid]
+
+
+def _ts(ns) -> pd.Timestamp:
+    return pd.Timestamp(int(ns))
+
+
+class Rule:
+    """ Rule on the `column` of the rows of `dataset` matching `where` (column -> value, all rows by default) """
+    def __init__(self, name: str, dataset: str, column: str, where: dict | None = None, **params):
+        self.params = dict(name=name, dataset=dataset, column=column, where=where, **params)
+        self.name, self.dataset, self.column, self.where = name, dataset, column, where or {}
+
+
+class BandRule(Rule):
+    """
+    Value below `low` or above `high` for at least `minutes`. A reading gap longer than `max_gap_minutes` ends the
+    run. Fires once per run. State: whether a run is open, its start, whether it fired, the last timestamp.
+    """
+    def __init__(self, name: str, dataset: str, column: str, where: dict | None = None, low: float = -np.inf,
+                 high: float = np.inf, minutes: float = 0, max_gap_minutes: float = 60):
+        super().__init__(name, dataset, column, where, low=low, high=high, minutes=minutes,
+                         max_gap_minutes=max_gap_minutes)
+        self.low, self.high = low, high
+        self.duration = int(minutes * NS_PER_MIN)
+        self.max_gap = int(max_gap_minutes * NS_PER_MIN)
+        self.reset()
+
+    def reset(self):
+        self.in_run = False
+        self.run_start = 0
+        self.fired = False
+        self.last_ts = None
+
+    def _describe(self, value: float) -> str:
+        if value < self.low:
+            return f"{self.column} {value:.2f} below {self.low:g}"
+        return f"{self.column} {value:.2f} above {self.high:g}"
+
+    def update(self, ts: np.ndarray, values: np.ndarray) -> list[Alert]:
+        ts, v = _finite(ts, values)
+        if not len(v):
+            return []
+        out = (v < self.low) | (v > self.high)
+        prev_ts = np.concatenate([[ts[0] if self.last_ts is None else self.last_ts], ts[:-1]])
+        prev_out = np.concatenate([[self.in_run], out[:-1]])
+        new_run = out & (~prev_out | (ts - prev_ts > self.max_gap))
+        run_id = np.cumsum(new_run)  # 0: the run carried over from the previous block
+        first = np.maximum.accumulate(np.where(new_run, np.arange(len(v)), -1))
+        start = np.where(first >= 0, ts[np.maximum(first, 0)], self.run_start)
+
+        candidate = out & (ts - start >= self.duration)
+        if self.fired:
+            candidate &= run_id != 0
+        fired_runs, first_hit = np.unique(run_id[candidate], return_index=True)
+        hits = np.flatnonzero(candidate)[first_hit]
+
+        # state for the next block
+        self.fired = bool(out[-1]) and (run_id[-1] in fired_runs or (run_id[-1] == 0 and self.fired))
+        self.in_run = bool(out[-1])
+        self.run_start = int(start[-1])
+        self.last_ts = int(ts[-1])
+
+        minutes = self.duration / NS_PER_MIN
+        return [Alert(_ts(ts[i]), self.name, float(v[i]), _ts(start[i]),
+                      f"{self._describe(v[i])} for {minutes:g} min" if minutes else self._describe(v[i]))
+                for i in hits]
+
+
+class AboveNormalRule(Rule):
+    """
+    Value above the mean of the previous values by more than `sigmas` standard deviations, once at least
+    `min_events` values were seen. State: count, sum and sum of squares.
+    """
+    def __init__(self, name: str, dataset: str, column: str, where: dict | None = None, sigmas: float = 3.0,
+                 min_events: int = 10):
+        super().__init__(name, dataset, column, where, sigmas=sigmas, min_events=min_events)
+        self.sigmas, self.min_events = sigmas, min_events
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.s1 = 0.0
+        self.s2 = 0.0
+
+    def update(self, ts: np.ndarray, values: np.ndarray) -> list[Alert]:
+        ts, v = _finite(ts, values)
+        if not len(v):
+            return []
+        # statistics of the values before each one
+        n = self.n + np.arange(len(v))
+        s1 = self.s1 + np.concatenate([[0.0], np.cumsum(v)[:-1]])
+        s2 = self.s2 + np.concatenate([[0.0], np.cumsum(v * v)[:-1]])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = s1 / n
+            std = np.sqrt(np.maximum(s2 - s1 * mean, 0.0) / (n - 1))
+        hits = np.flatnonzero((n >= self.min_events) & (v > mean + self.sigmas * std))
+
+        self.n += len(v)
+        self.s1 += float(v.sum())
+        self.s2 += float((v * v).sum())
+        return [Alert(_ts(ts[i]), self.name, float(v[i]), _ts(ts[i]),
+                      f"{self.column} {v[i]:.2f} above normal ({mean[i]:.2f} +/- {std[i]:.2f})")
+                for i in hits]
+
+
+class DriftRule(Rule):
+    """
+    Hourly mean drifting from its long-term level: an exponential average over `fast_hours` departs from one over
+    `slow_hours` by more than `threshold` (relative), after `warmup_hours` hours. Fires when the departure starts
+    and again only after it fell back below half the threshold. Hours are closed when a reading of a later hour
+    arrives. State: the open hour's sum and count, the two averages, the number of hours, whether drifting.
+    """
+    def __init__(self, name: str, dataset: str, column: str, where: dict | None = None, threshold: float = 0.3,
+                 fast_hours: float = 24, slow_hours: float = 24 * 14, warmup_hours: int | None = None):
+        super().__init__(name, dataset, column, where, threshold=threshold, fast_hours=fast_hours,
+                         slow_hours=slow_hours, warmup_hours=warmup_hours)
+        self.threshold = threshold
+        self.fast_alpha = 1 - np.exp(-1 / fast_hours)
+        self.slow_alpha = 1 - np.exp(-1 / slow_hours)
+        self.warmup_hours = int(slow_hours) if warmup_hours is None else warmup_hours
+        self.reset()
+
+    def reset(self):
+        self.hour = None
+        self.hour_sum = 0.0
+        self.hour_count = 0
+        self.fast = None
+        self.slow = None
+        self.hours = 0
+        self.drifting = False
+
+    @staticmethod
+    def _ewm(x: np.ndarray, alpha: float, last: float | None) -> np.ndarray:
+        """ Exponential average of x continuing from `last` """
+        if last is None:
+            return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+        return pd.Series(np.concatenate([[last], x])).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+    def update(self, ts: np.ndarray, values: np.ndarray) -> list[Alert]:
+        ts, v = _finite(ts, values)
+        hour = ts // NS_PER_HOUR
+        if self.hour is not None:
+            keep = hour >= self.hour  # late readings of closed hours are dropped
+            hour, v = np.concatenate([[self.hour], hour[keep]]), np.concatenate([[self.hour_sum], v[keep]])
+            count = np.concatenate([[self.hour_count], np.ones(keep.sum(), dtype=np.int64)])
+        else:
+            count = np.ones(len(v), dtype=np.int64)
+        if not len(v):
+            return []
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(hour)) + 1])
+        hours, sums, counts = hour[starts], np.add.reduceat(v, starts), np.add.reduceat(count, starts)
+        # the last hour stays open
+        self.hour, self.hour_sum, self.hour_count = int(hours[-1]), float(sums[-1]), int(counts[-1])
+        if len(hours) == 1:
+            return []
+        means = sums[:-1] / counts[:-1]
+        hours = hours[:-1]
+
+        fast = self._ewm(means, self.fast_alpha, self.fast)
+        slow = self._ewm(means, self.slow_alpha, self.slow)
+        seen = self.hours + np.arange(1, len(means) + 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            departure = np.abs(fast / slow - 1)
+        warm = (seen >= self.warmup_hours) & np.isfinite(departure)
+        # drifting from above the threshold until below half of it, unchanged in between
+        state = np.where(warm & (departure > self.threshold), 1.0,
+                         np.where(~warm | (departure < self.threshold / 2), 0.0, np.nan))
+        state = pd.Series(np.concatenate([[float(self.drifting)], state])).ffill().to_numpy()
+        hits = np.flatnonzero((state[1:] == 1) & (state[:-1] == 0))
+
+        self.fast, self.slow = float(fast[-1]), float(slow[-1])
+        self.hours = int(seen[-1])
+        self.drifting = bool(state[-1])
+        return [Alert(_ts((hours[i] + 1) * NS_PER_HOUR), self.name, float(fast[i]), _ts(hours[i] * NS_PER_HOUR),
+                      f"{self.column} {fast[i]:.2f} is {departure[i]:.0%} "
+                      f"{'above' if fast[i] > slow[i] else 'below'} its long-term level {slow[i]:.2f}")
+                for i in hits]
+
+
+RULE_TYPES = {"band": BandRule, "above_normal": AboveNormalRule, "drift": DriftRule}
+
+
+def make_rule(spec: dict):
+    """
+    Rule of a spec {"type": "band" | "above_normal" | "drift", "name": ..., "dataset": ..., "column": ...,
+    "where": {...}, ...}, the other keys are the arguments of the rule type
+    """
+    spec = dict(spec)
+    kind = spec.pop("type")
+    if kind not in RULE_TYPES:
+        raise ValueError(f"Unknown alert rule type {kind!r}, one of {', '.join(RULE_TYPES)}")
+    return RULE_TYPES[kind](**spec)
+
+
+def evaluate(rule, df: pd.DataFrame) -> list[Alert]:
+    """ Feed a block of a dataset (time-indexed, in order) to a rule """
+    for column, value in rule.where.items():
+        if column not in df.columns:
+            return []
+        df = df[df[column] == value]
+    values = column_values(df, rule.column)
+    if values is None:
+        return []
+    return rule.update(df.index.to_numpy(), values.to_numpy(dtype=float))
+
+
+def replay(rule, df: pd.DataFrame) -> pd.DataFrame:
+    """ Alerts of a fresh copy of the rule over a whole dataset, evaluated as one block """
+    fresh = type(rule)(**rule.params)
+    return pd.DataFrame(evaluate(fresh, df), columns=Alert._fields)
@@ -0,0 +1,52 @@
+"""
+Alignment of independently timestamped sensor series onto one regular time grid.
+"""
+import numpy as np
+import pandas as pd
+
+# label -> pandas frequency of the common grid
+RESOLUTIONS = {
+    "15 min": "15min",
+    "1 hour": "60min",
+    "1 day": "1D",
+}
+AGGREGATIONS = ["mean", "median", "min", "max"]
+
+
+def align_sensors(series: dict[str, pd.Series], freq: str, how: str | dict = "mean") -> pd.DataFrame:
+    """
+    Snap every series onto a regular grid of `freq` covering all of them. Readings falling into one grid slot are
+    aggregated with `how` (one aggregation for all series or a dict per series name), empty slots are NaN.
+    """
+    series = {name: ser for name, ser in series.items() if not ser.empty}
+    if not series:
+        return pd.DataFrame(columns=list(series))
+    start = min(ser.index.min() for ser in series.values()).floor(freq)
+    end = max(ser.index.max() for ser in series.values()).floor(freq)
+    grid = pd.date_range(start, end, freq=freq)
+
+    columns = {}
+    for name, ser in series.items():
+        agg = how[name] if isinstance(how, dict) else how
+        binned = ser.astype(float).groupby(ser.index.floor(freq)).agg(agg)
+        columns[name] = binned.reindex(grid).to_numpy()
+    return pd.DataFrame(columns, index=grid)
+
+
+def coverage(aligned: pd.DataFrame, names) -> pd.DataFrame:
+    """
+    Per sensor: first / last filled grid slot and the share of the grid slots with a value.
+    Sensors in `names` without a column in the aligned frame (missing files) are reported with zero coverage.
+    """
+    rows = []
+    slots = len(aligned)
+    for name in names:
+        if name in aligned.columns:
+            filled = aligned[name].notna().to_numpy()
+            idx = np.flatnonzero(filled)
+            first = aligned.index[idx[0]] if len(idx) else pd.NaT
+            last = aligned.index[idx[-1]] if len(idx) else pd.NaT
+            rows.append((name, first, last, int(filled.sum()), slots, filled.sum() / slots if slots else 0.0))
+        else:
+            rows.append((name, pd.NaT, pd.NaT, 0, slots, 0.0))
+    return pd.DataFrame(rows, columns=["sensor", "first", "last", "filled", "slots", "coverage"]).set_index("sensor")
@@ -0,0 +1,44 @@
+"""
+Backwash analytics - process / event intervals and volume metrics of the filter backwash records.
+"""
+from typing import NamedTuple
+
+import pandas as pd
+
+
+class BackwashMetrics(NamedTuple):
+    events: int
+    total_volume_ft3: float
+    average_volume_ft3: float
+    average_duration_min: float
+
+
+def backwash_pairs(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split the backwash records into (start, end, volume) pairs of the backwash events (phase 2)
+    and (start, end) pairs of the whole backwash process (phase 1)
+    """
+    events = df[df["data_type"] == "backwash_event"]
+    process = df[df["data_type"] == "process_duration"]
+
+    # Build lists of (start, end, volume) pairs
+    event_pairs = events[events["event_type"] == "backwash_event_start"][[
+        "timestamp", "paired_timestamp", "volume_ft3"
+    ]]
+    duration_pairs = process[process["event_type"] == "process_start"][[
+        "timestamp", "paired_timestamp"
+    ]]
+    return event_pairs, duration_pairs
+
+
+def backwash_metrics(df: pd.DataFrame) -> BackwashMetrics:
+    events = df.query("data_type == 'backwash_event' and event_type == 'backwash_event_start'")
+
+    # duration per event (minutes)
+    duration_min = (events["paired_timestamp"] - events["timestamp"]).dt.total_seconds() / 60
+    return BackwashMetrics(
+        events=int(len(events)),
+        total_volume_ft3=float(events["volume_ft3"].sum()),
+        average_volume_ft3=float(events["volume_ft3"].mean()),
+        average_duration_min=float(duration_min.mean()),
+    )
@@ -0,0 +1,99 @@
+"""
+Outlier filtering of raw sensor series.
+
+Three filters, each flagging readings rather than changing them:
+- range: readings outside the physically plausible range of the sensor
+- Hampel: readings further than `n_sigmas` robust standard deviations from the rolling median. The rolling medians
+  use pandas' skip-list implementation, O(n log w) for a window of w readings
+- rate of change: isolated spikes - a jump in and a jump back out both faster than `max_rate` per minute
+
+`clean_series` returns the flags as a bit mask so that pages can show why a reading was removed.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+FLAG_RANGE = 1
+FLAG_HAMPEL = 2
+FLAG_RATE = 4
+MAD_TO_SIGMA = 1.4826  # MAD of normally distributed data x 1.4826 = standard deviation
+
+
+class CleaningConfig(NamedTuple):
+    valid_range: tuple[float, float] | None = None
+    window: int = 9  # readings, centered
+    n_sigmas: float | None = 5.0  # None disables the Hampel filter
+    min_deviation: float = 0.0  # deviations below this are never outliers (quantized / flat signals)
+    max_rate: float | None = None  # units per minute, None disables the spike filter
+
+
+# per column of the sensor files
+CLEANING = {
+    "Filtered Water Flow Rate, GPM": CleaningConfig(valid_range=(0, 500), n_sigmas=None),
+    "Master Meter Flow Rate, GPM": CleaningConfig(valid_range=(0, 500), min_deviation=25.0),
+    "Distribution System Pressure, psi": CleaningConfig(valid_range=(0, 150), min_deviation=5.0, max_rate=5.0),
+    "WST Height, ft": CleaningConfig(valid_range=(0, 40), n_sigmas=4.0, min_deviation=0.5, max_rate=0.5),
+    "water_level_m": CleaningConfig(valid_range=(0, 12), n_sigmas=4.0, min_deviation=0.15, max_rate=0.15),
+}
+
+
+def range_flags(values: np.ndarray, valid_range) -> np.ndarray:
+    lo, hi = valid_range
+    return (values < lo) | (values > hi)
+
+
+def hampel_flags(values: pd.Series, window: int, n_sigmas: float, min_deviation: float = 0.0) -> np.ndarray:
+    """
+    Hampel filter with the windowed MAD approximated by the rolling median of the absolute deviations from
+    the rolling median (two O(n log w) passes instead of a median per window and reading)
+    """
+    median = values.rolling(window, center=True, min_periods=1).median()
+    deviation = (values - median).abs()
+    mad = deviation.rolling(window, center=True, min_periods=1).median()
+    threshold = np.maximum(n_sigmas * MAD_TO_SIGMA * mad.to_numpy(), min_deviation)
+    return (deviation.to_numpy() > threshold)
+
+
+def spike_flags(values: np.ndarray, ts: np.ndarray, max_rate: float) -> np.ndarray:
+    """ Readings reached and left with a rate above max_rate (per minute) in opposite directions """
+    flags = np.zeros(len(values), dtype=bool)
+    if len(values) < 3:
+        return flags
+    minutes = np.diff(ts).astype("timedelta64[s]").astype(float) / 60.0
+    rate = np.diff(values) / np.where(minutes > 0, minutes, np.nan)
+    into, out = rate[:-1], rate[1:]
+    flags[1:-1] = (np.abs(into) > max_rate) & (np.abs(out) > max_rate) & (np.sign(into) != np.sign(out))
+    return flags
+
+
+def clean_series(ser: pd.Series, config: CleaningConfig) -> tuple[pd.Series, pd.Series]:
+    """ (series with the flagged readings set to NaN, flag bit mask per reading) """
+    values = ser.astype(float)
+    flags = np.zeros(len(values), dtype=np.uint8)
+    valid = values.notna().to_numpy()
+
+    if config.valid_range is not None:
+        flags[valid & range_flags(values.to_numpy(), config.valid_range)] |= FLAG_RANGE
+
+    # the windowed filters run on the readings left by the range check, so gross errors do not widen the MAD
+    keep = valid & (flags == 0)
+    kept = values[keep]
+    if config.n_sigmas is not None and len(kept):
+        flags[np.flatnonzero(keep)[hampel_flags(kept, config.window, config.n_sigmas, config.min_deviation)]] \
+            |= FLAG_HAMPEL
+    if config.max_rate is not None and len(kept):
+        flags[np.flatnonzero(keep)[spike_flags(kept.to_numpy(), kept.index.to_numpy(), config.max_rate)]] \
+            |= FLAG_RATE
+
+    cleaned = values.where(flags == 0)
+    return cleaned, pd.Series(flags, index=ser.index, name=f"{ser.name} flags")
+
+
+def clean_frame(df: pd.DataFrame, configs: dict = CLEANING) -> pd.DataFrame:
+    """ Copy of the frame with the configured columns cleaned and a '<column> flags' column added for each """
+    out = df.copy()
+    for col in df.columns:
+        if col in configs:
+            out[col], out[f"{col} flags"] = clean_series(df[col], configs[col])
+    return out
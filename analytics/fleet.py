@@ -0,0 +1,56 @@
+"""
+Fleet KPIs - the per-site summary numbers of the comparison page, computed from a site's parsed datasets.
+"""
+import numpy as np
+import pandas as pd
+
+from analytics import backwash, pumps, storage
+
+KPI_COLUMNS = [
+    "months",
+    "avg_monthly_gal",
+    "last_month_gal",
+    "reliability",
+    "resilience",
+    "vulnerability",
+    "backwash_events",
+    "backwash_ft3_per_month",
+    "avg_backwash_ft3",
+    "top_cluster",
+    "top_cluster_share",
+    "clusters_used",
+]
+
+
+def consumption_kpis(hourly_gpm: pd.Series) -> dict:
+    """ Average and latest monthly consumption in gallons, months with at least one reading """
+    hourly_gpm = hourly_gpm.astype(float)
+    counts = hourly_gpm.resample("MS").count()
+    totals = (hourly_gpm * 60.0).resample("MS").sum()[counts > 0]
+    if totals.empty:
+        return {"months": 0, "avg_monthly_gal": np.nan, "last_month_gal": np.nan}
+    return {"months": int(len(totals)), "avg_monthly_gal": float(totals.mean()),
+            "last_month_gal": float(totals.iloc[-1])}
+
+
+def storage_kpis(levels: pd.DataFrame) -> dict:
+    threshold = storage.critical_threshold_ft(levels)
+    rel, res, vul = storage.storage_metrics(levels["water_level_m"], threshold)
+    return {"reliability": float(rel), "resilience": float(res), "vulnerability": float(vul)}
+
+
+def backwash_kpis(df: pd.DataFrame) -> dict:
+    metrics = backwash.backwash_metrics(df)
+    months = max((df["timestamp"].max() - df["timestamp"].min()).days / 30.44, 1.0) if len(df) else np.nan
+    return {"backwash_events": metrics.events, "backwash_ft3_per_month": metrics.total_volume_ft3 / months,
+            "avg_backwash_ft3": metrics.average_volume_ft3}
+
+
+def pump_kpis(hourly_points: pd.DataFrame) -> dict:
+    """ Share of the operating hours in the most used speed cluster, numbered as on the Pump Curves page """
+    usage = hourly_points["cluster"].value_counts(normalize=True)
+    if usage.empty:
+        return {"top_cluster": np.nan, "top_cluster_share": np.nan, "clusters_used": 0}
+    cluster = int(usage.index[0])
+    return {"top_cluster": pumps.LEGEND_ITEMS.get(cluster, cluster), "top_cluster_share": float(usage.iloc[0]),
+            "clusters_used": int(len(usage))}
@@ -0,0 +1,209 @@
+"""
+Short-term demand forecast of the master meter - a weekday x hour seasonal baseline plus a scikit-learn model of
+the residuals (ridge or gradient boosting) for the next week of hourly demand.
+
+The residual features only use residuals at least HORIZON hours old, so the whole horizon is predicted in one
+vectorized call without feeding predictions back.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+HORIZON = 7 * 24  # hours
+WEEK = 7 * 24
+# residual model trained on this many trailing hours
+TRAIN_HOURS = 2 * 365 * 24
+# the prediction band is +/- this many standard deviations of the training errors of the last 4 weeks
+BAND_SIGMAS = 1.96
+
+
+# scikit-learn is imported with the first model, not by every process importing the loaders
+def _ridge():
+    from sklearn.linear_model import Ridge
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    return make_pipeline(StandardScaler(), Ridge(alpha=1.0))
+
+
+def _gbr():
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    return HistGradientBoostingRegressor(max_iter=200, learning_rate=0.1, max_leaf_nodes=15)
+
+
+MODELS = {"ridge": _ridge, "gbr": _gbr}
+FEATURES = ["baseline", "residual 1 week ago", "residual day mean 1 week ago", "residual week mean 1 week ago",
+            "hour sin", "hour cos", "day of year sin", "day of year cos"]
+
+
+def week_slot(index: pd.DatetimeIndex) -> np.ndarray:
+    """ Hour of the week 0..167 (Monday 0:00 = 0) """
+    return index.dayofweek.to_numpy() * 24 + index.hour.to_numpy()
+
+
+def _shift(x: np.ndarray, k: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    out[k:] = x[:len(x) - k]
+    return out
+
+
+def _trailing_mean(x: np.ndarray, width: int) -> np.ndarray:
+    """ Mean of the finite values of x[t - width + 1 .. t] """
+    valid = np.isfinite(x)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, x, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    hi = np.arange(1, len(x) + 1)
+    lo = np.maximum(hi - width, 0)
+    n = counts[hi] - counts[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, (sums[hi] - sums[lo]) / n, np.nan)
+
+
+def features(index: pd.DatetimeIndex, baseline: np.ndarray, residual: np.ndarray) -> np.ndarray:
+    """
+    Feature matrix (rows = hours of `index`, columns = FEATURES) of an hourly grid, from the baseline and the
+    residuals (actual - baseline, NaN where unknown) on the same grid. Missing residual features are 0.
+    """
+    lagged = _shift(residual, WEEK)
+    hour = 2 * np.pi * index.hour.to_numpy() / 24
+    day = 2 * np.pi * index.dayofyear.to_numpy() / 365.25
+    X = np.column_stack([
+        baseline,
+        lagged,
+        _trailing_mean(lagged, 24),
+        _trailing_mean(lagged, WEEK),
+        np.sin(hour), np.cos(hour),
+        np.sin(day), np.cos(day),
+    ])
+    return np.nan_to_num(X, nan=0.0)
+
+
+class DemandForecaster:
+    """
+    Seasonal baseline + residual model of an hourly demand series, updated with the hours appended to the series.
+    The baseline sums and counts per hour of the week take the new complete hours only, the residual model is
+    refit on the trailing TRAIN_HOURS once `refit_hours` new hours came in. A series that does not extend the one
+    seen last (rewritten history) starts over.
+    """
+    def __init__(self, model: str = "ridge", refit_hours: int = 24):
+        if model not in MODELS:
+            raise ValueError(f"Unknown forecast model {model!r}, one of {', '.join(MODELS)}")
+        self.model_name = model
+        self.refit_hours = refit_hours
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.sums = np.zeros(WEEK)
+        self.counts = np.zeros(WEEK, dtype=np.int64)
+        self.start = None  # first hour of the series
+        self.end = None  # last complete hour added to the baseline
+        self.model = None
+        self.fitted_end = None
+        self.sigma = np.nan
+        self.fit_sec = np.nan
+        self._forecast = None
+        self._forecast_key = None
+
+    def baseline(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """ Mean demand of the hour of the week of every hour of `index` """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            profile = self.sums / self.counts
+        profile[self.counts == 0] = self.sums.sum() / max(self.counts.sum(), 1)
+        return profile[week_slot(index)]
+
+    def update(self, demand: pd.Series) -> int:
+        """ Add the complete hours of `demand` (hourly) past the last update, refit if due; number of new hours """
+        with self._lock:
+            return self._update(demand.asfreq("h"))
+
+    def _update(self, demand: pd.Series) -> int:
+        if demand.empty:
+            return 0
+        if self.start is not None and (demand.index[0] != self.start or demand.index[-1] < self.end):
+            self._reset()
+        self.start = demand.index[0]
+        complete = demand.iloc[:-1]  # the last hour may still get readings
+        new = complete if self.end is None else complete.loc[self.end + pd.Timedelta(hours=1):]
+        if len(new):
+            values = new.to_numpy(dtype=float)
+            valid = np.isfinite(values)
+            slots = week_slot(new.index)[valid]
+            self.sums += np.bincount(slots, weights=values[valid], minlength=WEEK)
+            self.counts += np.bincount(slots, minlength=WEEK)
+            self.end = new.index[-1]
+        if self.end is not None and (self.model is None
+                                     or (self.end - self.fitted_end) / pd.Timedelta(hours=1) >= self.refit_hours):
+            self._fit(complete)
+        return len(new)
+
+    def _fit(self, demand: pd.Series):
+        t0 = time.perf_counter()
+        demand = demand.iloc[-(TRAIN_HOURS + 2 * WEEK):]  # the first two weeks only feed the lagged features
+        y = demand.to_numpy(dtype=float)
+        base = self.baseline(demand.index)
+        X = features(demand.index, base, y - base)
+        rows = np.isfinite(y)
+        rows[:2 * WEEK] = False
+        if rows.sum() < WEEK:  # too short for the residual model, baseline only
+            self.model, self.sigma = None, np.nanstd(y - base)
+        else:
+            self.model = MODELS[self.model_name]()
+            self.model.fit(X[rows], y[rows] - base[rows])
+            errors = (y - base - self.model.predict(X))[rows][-4 * WEEK:]
+            self.sigma = float(np.std(errors))
+        self.fitted_end = self.end
+        self.fit_sec = time.perf_counter() - t0
+
+    def predict(self, demand: pd.Series, horizon: int = HORIZON) -> pd.DataFrame:
+        """ baseline, forecast, lower and upper of the `horizon` hours after the end of `demand` """
+        demand = demand.asfreq("h")
+        with self._lock:
+            self._update(demand)
+            key = (demand.index[-1], float(np.nan_to_num(demand.iloc[-WEEK:].sum())), horizon)
+            if self._forecast_key != key:  # the same series is forecast once for every session
+                self._forecast = self._predict(demand, horizon)
+                self._forecast_key = key
+            return self._forecast
+
+    def _predict(self, demand: pd.Series, horizon: int) -> pd.DataFrame:
+        future = pd.date_range(demand.index[-1] + pd.Timedelta(hours=1), periods=horizon, freq="h")
+        history = demand.iloc[-2 * WEEK:]  # enough for the lagged features of the horizon
+        index = history.index.append(future)
+        base = self.baseline(index)
+        y = np.concatenate([history.to_numpy(dtype=float), np.full(horizon, np.nan)])
+        prediction = base[-horizon:]
+        if self.model is not None:
+            X = features(index, base, y - base)[-horizon:]
+            prediction = prediction + self.model.predict(X)
+        prediction = np.maximum(prediction, 0.0)
+        band = BAND_SIGMAS * self.sigma
+        return pd.DataFrame({
+            "baseline": base[-horizon:],
+            "forecast": prediction,
+            "lower": np.maximum(prediction - band, 0.0),
+            "upper": prediction + band,
+        }, index=future)
+
+
+def backtest(demand: pd.Series, model: str = "ridge", weeks: int = 8) -> pd.DataFrame:
+    """
+    Mean absolute error of the baseline and of the forecast over the last `weeks` weeks, each week forecast from
+    the data before it (the baseline and model refit at every origin)
+    """
+    demand = demand.asfreq("h")
+    rows = []
+    for k in range(weeks, 0, -1):
+        origin = len(demand) - k * WEEK
+        forecaster = DemandForecaster(model, refit_hours=0)
+        fc = forecaster.predict(demand.iloc[:origin])
+        actual = demand.iloc[origin:origin + HORIZON].reindex(fc.index).to_numpy(dtype=float)
+        valid = np.isfinite(actual)
+        rows.append({
+            "origin": demand.index[origin],
+            "baseline_mae": np.abs(fc["baseline"].to_numpy() - actual)[valid].mean(),
+            "forecast_mae": np.abs(fc["forecast"].to_numpy() - actual)[valid].mean(),
+            "fit_sec": forecaster.fit_sec,
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,64 @@
+"""
+Pump analytics - the fitted Q-H curves of the pump speed clusters and the lookup of the cluster required
+for a given operating point.
+"""
+import numpy as np
+import pandas as pd
+
+from analytics.units import PSI_TO_FT
+
+# display number of each speed cluster
+LEGEND_ITEMS = {7: 1, 8: 2, 9: 3, 10: 4, 11: 5, 12: 6, 13: 7, 14: 8, 15: 9}
+
+CURVES = pd.DataFrame({'a': [-0.006755334, -0.006755334, -0.006755334, -0.006755334, -0.006755334, -0.006755334,
+                             -0.006755334, -0.006755334, -0.006755334
+                             ],
+                       'b': [0.306215982, 0.322547501, 0.33887902, 0.355210539, 0.371542058, 0.387873577,
+                             0.404205096, 0.420536615, 0.436868135
+                             ],
+                       'c': [31.18835733, 34.60382899, 38.19672776, 41.96705362, 45.91480658, 50.03998664,
+                             54.34259381, 58.82262807, 63.48008943
+                             ],
+                       'cluster': [7, 8, 9, 10, 11, 12, 13, 14, 15]})
+
+
+def hard_coded_curves_pred(q: float, p: float, l: float) -> int:
+    """ Speed cluster whose fitted curve best delivers flow q (GPM) at pressure p (PSI) with tank level l (ft) """
+    target_pressure_head = p * PSI_TO_FT  # psi to ft
+    estimated_head = CURVES['a'] * (q ** 2) + CURVES['b'] * q + CURVES['c']
+    calculated_required_head = target_pressure_head - l
+    adjusted_head = abs(estimated_head - calculated_required_head)
+    min_index = adjusted_head.idxmin()
+    closest_curve = CURVES.loc[min_index, 'cluster']
+
+    return int(closest_curve)
+
+
+# bins of the Q-H density along each axis
+DENSITY_BINS = 40
+
+
+def fitted_head(cluster: int, flow) -> np.ndarray:
+    """ Pump head (ft) of the fitted curve of a speed cluster at the flows (GPM) """
+    a, b, c = CURVES.loc[CURVES["cluster"] == cluster, ["a", "b", "c"]].iloc[0]
+    flow = np.asarray(flow, dtype=float)
+    return a * flow ** 2 + b * flow + c
+
+
+def density_edges(df: pd.DataFrame, bins: int = DENSITY_BINS) -> tuple[np.ndarray, np.ndarray]:
+    """ Flow and head bin edges spanning the whole series, so the bins stay put when the window changes """
+    flow, head = df["flow_gpm"].to_numpy(), df["pump_head_ft"].to_numpy()
+    return (np.linspace(np.nanmin(flow), np.nanmax(flow), bins + 1),
+            np.linspace(np.nanmin(head), np.nanmax(head), bins + 1))
+
+
+def qh_density(df: pd.DataFrame, edges: tuple[np.ndarray, np.ndarray]) -> dict[int, np.ndarray]:
+    """ Cluster -> 2-D histogram of its operating points, counts[flow bin, head bin] """
+    flow, head = df["flow_gpm"].to_numpy(), df["pump_head_ft"].to_numpy()
+    cluster = df["cluster"].to_numpy()
+    valid = np.isfinite(flow) & np.isfinite(head)
+    density = {}
+    for cl in np.unique(cluster[valid]):
+        sel = valid & (cluster == cl)
+        density[int(cl)], _, _ = np.histogram2d(flow[sel], head[sel], bins=edges)
+    return density
@@ -0,0 +1,123 @@
+"""
+Data quality index of a sensor series - gaps, dropouts, stuck values and coverage.
+
+The index is computed once per series and is small compared to the series: interval tables for the gaps,
+dropouts and stuck runs, and float32 coverage per day and per month. Coverage is the share of the expected
+readings (one per sampling interval) that are present and usable, i.e. not part of a dropout or stuck run.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+class QualityConfig(NamedTuple):
+    gap_factor: float = 2.0  # a gap is a time step longer than gap_factor x the sampling interval
+    dropout_below: float | None = None  # readings below this value are sensor dropouts (e.g. near-zero pressure)
+    stuck_min_readings: int = 12  # runs of identical readings at least this long are a stuck sensor
+    zero_runs_valid: bool = False  # runs of zeros are real (e.g. no flow while a pump is off), not a stuck sensor
+
+
+# per column of the sensor files
+QUALITY = {
+    "Filtered Water Flow Rate, GPM": QualityConfig(zero_runs_valid=True),
+    "Master Meter Flow Rate, GPM": QualityConfig(zero_runs_valid=True),
+    "Distribution System Pressure, psi": QualityConfig(dropout_below=1.0),
+    "WST Height, ft": QualityConfig(dropout_below=0.1),
+}
+
+
+class QualityIndex(NamedTuple):
+    interval: pd.Timedelta
+    gaps: pd.DataFrame  # start, end (last reading before / first reading after the gap), hours
+    dropouts: pd.DataFrame  # start, end, readings
+    stuck: pd.DataFrame  # start, end, readings, value
+    daily_coverage: pd.Series  # date -> share of expected readings usable
+    monthly_coverage: pd.Series  # month start -> share of expected readings usable
+
+
+def _runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Start and end (inclusive) positions of the runs of True values """
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2] - 1
+
+
+def quality_index(ser: pd.Series, config: QualityConfig = QualityConfig()) -> QualityIndex:
+    ser = ser.dropna().sort_index()
+    ts = ser.index.to_numpy()
+    values = ser.to_numpy(dtype=float)
+    if len(ser) < 2:
+        empty = pd.Series(dtype="float32")
+        return QualityIndex(pd.Timedelta(0), pd.DataFrame(columns=["start", "end", "hours"]),
+                            pd.DataFrame(columns=["start", "end", "readings"]),
+                            pd.DataFrame(columns=["start", "end", "readings", "value"]), empty, empty)
+
+    steps = np.diff(ts)
+    interval = pd.Timedelta(np.median(steps))
+
+    # gaps between consecutive readings
+    gap_pos = np.flatnonzero(steps > config.gap_factor * interval.to_timedelta64())
+    gaps = pd.DataFrame({"start": ts[gap_pos], "end": ts[gap_pos + 1],
+                         "hours": steps[gap_pos] / np.timedelta64(1, "h")})
+
+    unusable = np.zeros(len(values), dtype=bool)
+    dropout_mask = np.zeros(len(values), dtype=bool)
+    if config.dropout_below is not None:
+        dropout_mask = values < config.dropout_below
+    starts, ends = _runs(dropout_mask)
+    dropouts = pd.DataFrame({"start": ts[starts], "end": ts[ends], "readings": ends - starts + 1})
+    unusable |= dropout_mask
+
+    # runs of identical consecutive readings (outside dropouts)
+    same = np.concatenate([[False], values[1:] == values[:-1]]) & ~dropout_mask
+    if config.zero_runs_valid:
+        same &= values != 0
+    starts, ends = _runs(same)
+    starts = starts - 1  # a run of n repeats starts at the reading before the first repeat
+    long_runs = ends - starts + 1 >= config.stuck_min_readings
+    starts, ends = starts[long_runs], ends[long_runs]
+    stuck = pd.DataFrame({"start": ts[starts], "end": ts[ends], "readings": ends - starts + 1,
+                          "value": values[starts]})
+    for s, e in zip(starts, ends):
+        unusable[s:e + 1] = True
+
+    # coverage: usable readings / expected readings per day and month
+    usable = pd.Series((~unusable).astype(np.float32), index=ser.index)
+    per_day = pd.Timedelta("1D") / interval
+    daily = usable.resample("D").sum() / per_day
+    monthly_usable = usable.resample("MS").sum()
+    monthly_expected = monthly_usable.index.days_in_month * per_day
+    return QualityIndex(
+        interval=interval,
+        gaps=gaps,
+        dropouts=dropouts,
+        stuck=stuck,
+        daily_coverage=daily.clip(upper=1.0).astype("float32"),
+        monthly_coverage=(monthly_usable / monthly_expected).clip(upper=1.0).astype("float32"),
+    )
+
+
+def coverage_between(daily_coverage: pd.Series, start, end) -> float:
+    """ Mean daily coverage of the days start..end (inclusive), days without readings count as zero """
+    days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+    if len(days) == 0:
+        return np.nan
+    return float(daily_coverage.reindex(days, fill_value=0.0).mean())
+
+
+def monthly_coverage_pivot(monthly_coverage: pd.Series) -> pd.DataFrame:
+    """ Monthly coverage in the layout of system_flow.monthly_totals: rows = months, columns = years """
+    df = pd.DataFrame({"month": monthly_coverage.index.month, "year": monthly_coverage.index.year,
+                       "coverage": monthly_coverage.to_numpy()})
+    return df.pivot(index="month", columns="year", values="coverage")
+
+
+def intervals_frame(index: QualityIndex, min_hours: float = 0.0) -> pd.DataFrame:
+    """ Gaps and dropouts as one x0 / x1 table (for plot annotations), shorter than min_hours left out """
+    parts = [df[["start", "end"]] for df in (index.gaps, index.dropouts) if len(df)]
+    if not parts:
+        return pd.DataFrame(columns=["x0", "x1"])
+    df = pd.concat(parts, ignore_index=True).rename(columns={"start": "x0", "end": "x1"})
+    df = df[(df["x1"] - df["x0"]) >= pd.Timedelta(hours=min_hours)]
+    return df.sort_values("x0").reset_index(drop=True)
@@ -0,0 +1,136 @@
+"""
+Storage tank analytics - critical level violations and the reliability / resilience / vulnerability metrics.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from analytics.units import M_TO_FT
+
+
+class StorageMetrics(NamedTuple):
+    reliability: float
+    resilience: float
+    vulnerability: float
+
+
+def violation_intervals(level_ft: pd.Series, threshold: float) -> pd.DataFrame:
+    """ Start (x0) and end (x1) timestamps of each contiguous stretch with the level below the threshold """
+    # Identify contiguous True stretches
+    # Every time the mask flips (True to False or False to True) we start a new group
+    mask = level_ft < threshold
+    group = (mask != mask.shift()).cumsum()
+
+    timestamps = pd.Series(level_ft.index[mask.to_numpy()])
+    return (
+        timestamps
+        .groupby(group[mask].to_numpy())
+        .agg(x0="min", x1="max")
+    )
+
+
+class IntervalTracker:
+    """
+    Contiguous stretches with values below a threshold, updated with each appended block.
+    State is the list of closed intervals plus the start / last timestamp of the currently open one.
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.closed = []
+        self.open_start = None
+        self.open_last = None
+
+    def update(self, ts: np.ndarray, values: np.ndarray):
+        if len(ts) == 0:
+            return
+        below = values < self.threshold
+        # boundaries where the below/above state flips inside the new block
+        flips = np.flatnonzero(below[1:] != below[:-1]) + 1
+        starts = np.concatenate([[0], flips])
+        ends = np.concatenate([flips, [len(ts)]]) - 1
+
+        for s, e in zip(starts, ends):
+            if below[s]:
+                if self.open_start is None:
+                    self.open_start = ts[s]
+                self.open_last = ts[e]
+            elif self.open_start is not None:
+                self.closed.append((self.open_start, self.open_last))
+                self.open_start = self.open_last = None
+
+    def intervals(self) -> pd.DataFrame:
+        rows = list(self.closed)
+        if self.open_start is not None:
+            rows.append((self.open_start, self.open_last))
+        df = pd.DataFrame(rows, columns=["x0", "x1"])
+        return df.apply(pd.to_datetime) if len(df) else df
+
+
+def critical_threshold_ft(levels: pd.DataFrame) -> float:
+    """ Critical level (ft) recorded with the storage levels, the default threshold of the analyses """
+    return float(levels["critical_threshold_m"].iloc[0]) * M_TO_FT
+
+
+def storage_metrics(level_m: pd.Series, threshold: float) -> StorageMetrics:
+    """ Reliability, resilience and vulnerability of the tank level for a threshold given in ft """
+    # level_m may be shared between sessions - compute the deficits without adding columns to it
+    threshold_m = threshold / M_TO_FT  # ft to m
+    D = (threshold_m - level_m.dropna()).clip(lower=0.0)  # readings removed as outliers are not time steps
+
+    reliability = compute_reliability(D)
+    resilience = compute_resilience(D)
+    vulnerability = compute_vulnerability(D, target=threshold)
+    return StorageMetrics(reliability, resilience, vulnerability)
+
+
+def compute_reliability(deficits: pd.Series) -> float:
+    """
+    Time-based reliability (Eq. 2):
+        Rel = (# of time steps with D_t = 0) / n
+    where deficits D_t >= 0.
+    """
+    deficits = pd.Series(deficits).astype(float)
+    n = len(deficits)
+    if n == 0:
+        return np.nan
+
+    return (deficits == 0).sum() / n
+
+
+def compute_resilience(deficits: pd.Series) -> float:
+    """
+    Resilience (Eq. 3):
+        Res = (# of times D_t = 0 follows D_t > 0) / (# of times D_t > 0 occurred)
+    i.e., probability that a success directly follows a failure.
+    """
+    deficits = pd.Series(deficits).astype(float)
+    failures = deficits > 0
+
+    n_fail = failures.sum()
+    if n_fail == 0:
+        # No failures -> resilience w.r.t. failures is undefined; often set to 1 or NaN by convention.
+        return 0
+
+    # A recovery is when we are successful now AND we were in failure at previous step.
+    recoveries = (~failures & failures.shift(1, fill_value=False)).sum()
+
+    return recoveries / n_fail
+
+
+def compute_vulnerability(deficits: pd.Series, target: float) -> float:
+    """
+    Vulnerability (Eq. 4, 'dimensionless' version):
+        Vul = (average deficit over failure periods) / target
+
+    In Eq. (4) of the paper, 'Water demand_i' plays the role of a
+    normalizing constant. Here we call it `target` (e.g., average threshold).
+    """
+    deficits = pd.Series(deficits).astype(float)
+    failing_deficits = deficits[deficits > 0]
+
+    if len(failing_deficits) == 0 or target == 0:
+        return 0.0
+
+    avg_deficit = failing_deficits.mean()
+    return avg_deficit / target
\ No newline at end of file
@@ -0,0 +1,354 @@
+"""
+System flow analytics - hourly profiles of selected periods, period statistics and monthly totals
+of the master meter series.
+"""
+import numpy as np
+import pandas as pd
+
+# number of hourly points of each aligned profile
+PROFILE_LENGTHS = {
+    "Daily": 24,
+    "Weekly": 24 * 7,
+    "Monthly": 31 * 24,
+    "Annually": 365 * 24,
+}
+
+
+def period_label(freq_label: str, period: str) -> str:
+    """ Display name of a period option, e.g. '2023-01' -> 'Jan 2023' """
+    if freq_label == "Daily":
+        return pd.Timestamp(period).strftime("%Y-%m-%d")
+    if freq_label == "Monthly":
+        return pd.Period(period, freq="M").to_timestamp().strftime("%b %Y")
+    return period
+
+
+def period_profile(s: pd.Series, freq_label: str, period: str) -> pd.Series:
+    """
+    Hourly profile of one period option (as returned by build_period_options),
+    indexed by the hour within the period: 0..23, 0..167, 0..743 or 0..8759
+    """
+    if freq_label == "Daily":
+        return series_for_daily(s, period, how="mean")
+    if freq_label == "Weekly":
+        start, end = period.split(" - ")
+        return hourly_series_for_week(s, start, end)
+    if freq_label == "Monthly":
+        ts = pd.Period(period, freq="M").to_timestamp()
+        return hourly_series_for_month_aligned(s, ts.year, ts.month)
+    if freq_label == "Annually":
+        return hourly_series_for_year_aligned(s, int(period))
+    raise ValueError(f"Unknown period type: {freq_label}")
+
+
+def period_bounds(freq_label: str, period: str) -> tuple[pd.Timestamp, pd.Timestamp]:
+    """ First and last day of a period option """
+    if freq_label == "Daily":
+        day = pd.Timestamp(period)
+        return day, day
+    if freq_label == "Weekly":
+        start, end = period.split(" - ")
+        return pd.Timestamp(start), pd.Timestamp(end)
+    if freq_label == "Monthly":
+        month = pd.Period(period, freq="M")
+        return month.start_time.normalize(), month.end_time.normalize()
+    if freq_label == "Annually":
+        return pd.Timestamp(year=int(period), month=1, day=1), pd.Timestamp(year=int(period), month=12, day=31)
+    raise ValueError(f"Unknown period type: {freq_label}")
+
+
+def period_profiles(s: pd.Series, freq_label: str, periods) -> dict[str, pd.Series]:
+    """ Hourly profiles of the selected periods keyed by period option, empty profiles are skipped """
+    profiles = {}
+    for p in periods:
+        ser = period_profile(s, freq_label, p)
+        if not ser.empty:
+            profiles[p] = ser
+    return profiles
+
+
+def summarize_period(ser: pd.Series) -> pd.Series:
+    s = ser.dropna()
+    return pd.Series({
+        "Average": s.mean(),
+        "Min": s.min(),
+        "Max": s.max(),
+        "Total": s.sum(),
+    })
+
+
+def period_statistics(profiles: dict[str, pd.Series], coverage: dict[str, float] | None = None) -> pd.DataFrame:
+    """
+    Rows = selected periods (labels), Columns = stats.
+    With the data coverage of each period (0..1) a Coverage column is added, and the Total scaled up to
+    the full period as 'Adjusted Total'.
+    """
+    df = pd.DataFrame({label: summarize_period(ser) for label, ser in profiles.items()}).T
+    if coverage is not None and len(df):
+        df["Coverage"] = [coverage.get(label, np.nan) for label in df.index]
+        df["Adjusted Total"] = df["Total"] / df["Coverage"].where(df["Coverage"] > 0)
+    return df
+
+
+def monthly_totals(hourly_gpm: pd.Series) -> pd.DataFrame:
+    """
+    Total gallons per month, rows are months (1..12) and columns are years.
+    The series must be at hourly resolution
+    """
+    # convert data to hourly units: from GPM to gallons per hour
+    hourly_gallons = hourly_gpm.astype(float) * 60.0
+    # Now we sum hours per month-year thereby getting total gallons per month in Gallons units
+    totals = hourly_gallons.groupby([hourly_gpm.index.month, hourly_gpm.index.year]).sum()
+    totals = totals.reset_index()
+    totals.columns = ["month", "year", "total"]
+    return totals.pivot(index="month", columns="year", values="total")
+
+
+def build_period_options(idx: pd.DatetimeIndex, mode: str):
+    idx = idx.sort_values()
+    if mode == "Daily":
+        # unique calendar dates present in data
+        dates = pd.to_datetime(idx.date).unique()
+        # return label and value both as date for simplicity
+        options = [(d.strftime("%Y-%m-%d")) for d in dates]
+        return options
+
+    if mode == "Weekly":
+        # ISO weeks aligned to Monday. For each week, show [start..end]
+        weeks = idx.to_series().dt.to_period("W-MON").unique()
+        options = []
+        for w in weeks:
+            start = w.start_time.normalize()
+            end = w.end_time.normalize()
+            label = f"{start.date()} - {end.date()}"
+            options.append((label))
+        return options
+
+    if mode == "Monthly":
+        # unique month-year periods present in the data
+        months = idx.to_period("M").unique()
+        # store as YYYY-MM; we can pretty-print later as "Jan 2023"
+        options = [m.strftime("%Y-%m") for m in months]
+        return options
+
+    if mode == "Annually":
+        years = pd.Index(idx.year.unique()).sort_values()
+        options = [f"{int(y)}" for y in years]
+        return options
+
+    return []
+
+
+def get_x_domain(mode: str):
+    if mode == "Daily":
+        # hours 0..23
+        return list(range(24)), "hour"
+    if mode == "Weekly":
+        # Monday - Sunday mapped to 0..6
+        days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+        return days, "dow"  # day-of-week label
+    if mode == "Monthly":
+        return list(range(1, 32)), "dom"
+    if mode == "Annually":
+        # Months of the year Jan - Dec
+        months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+        return months, "month"
+    return [], ""
+
+
+def series_for_daily(s: pd.Series, the_date, how):
+    mask = s.index.date == pd.Timestamp(the_date).date()
+    ss = s.loc[mask]
+    if ss.empty:
+        return pd.Series(index=range(24), dtype=float)
+    grouped = ss.groupby(ss.index.hour)
+    if how == "sum":
+        out = grouped.sum()
+    elif how == "mean":
+        out = grouped.mean()
+    elif how == "max":
+        out = grouped.max()
+    elif how == "min":
+        out = grouped.min()
+    elif how == "median":
+        out = grouped.median()
+    return out.reindex(range(24), fill_value=np.nan)
+
+
+def series_for_weekly(s: pd.Series, start_date, end_date, how="sum"):
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    ss = s.loc[(s.index >= start) & (s.index <= end)]
+    if ss.empty:
+        return pd.Series(index=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"], dtype=float)
+    # map to Mon..Sun
+    dow_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    grouped = ss.groupby(ss.index.dayofweek)
+    if how == "sum":
+        out = grouped.sum()
+    elif how == "mean":
+        out = grouped.mean()
+    elif how == "max":
+        out = grouped.max()
+    elif how == "min":
+        out = grouped.min()
+    elif how == "median":
+        out = grouped.median()
+    out.index = [dow_names[i] for i in out.index]
+    return out.reindex(dow_names, fill_value=np.nan)
+
+
+def series_for_monthly(s: pd.Series, year: int, month: int, how="sum"):
+    """
+    Aggregate a given month-year into a day-of-month profile.
+
+    Returns a Series indexed by day-of-month 1..31.
+    """
+    mask = (s.index.year == year) & (s.index.month == month)
+    ss = s.loc[mask]
+    days = range(1, 32)
+    if ss.empty:
+        return pd.Series(index=days, dtype=float)
+
+    grouped = ss.groupby(ss.index.day)
+    if how == "sum":
+        out = grouped.sum()
+    elif how == "mean":
+        out = grouped.mean()
+    elif how == "max":
+        out = grouped.max()
+    elif how == "min":
+        out = grouped.min()
+    elif how == "median":
+        out = grouped.median()
+    else:
+        raise ValueError(f"Unknown aggregation: {how}")
+
+    # ensure we always have 1..31 for consistent x_domain
+    return out.reindex(days, fill_value=np.nan)
+
+
+def series_for_monthly_by_year(s: pd.Series, year: int, how="sum"):
+    ss = s.loc[(s.index.year == int(year))]
+    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    if ss.empty:
+        return pd.Series(index=months, dtype=float)
+    grouped = ss.groupby(ss.index.month)
+    if how == "sum":
+        out = grouped.sum()
+    elif how == "mean":
+        out = grouped.mean()
+    elif how == "max":
+        out = grouped.max()
+    elif how == "min":
+        out = grouped.min()
+    elif how == "median":
+        out = grouped.median()
+    # map 1..12 -> month names
+    out.index = [months[m - 1] for m in out.index]
+    return out.reindex(months, fill_value=np.nan)
+
+
+def hourly_series_for_week(s: pd.Series, start_date, end_date) -> pd.Series:
+    """
+    Return a 1D hourly series for a given [start_date, end_date] week,
+    aligned to a 0..167 'hour of week' index.
+    """
+    start = pd.Timestamp(start_date)
+    # include the full last day up to 23:00
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(hours=1)
+
+    ss = s.loc[(s.index >= start) & (s.index <= end)]
+    if ss.empty:
+        return pd.Series(index=pd.RangeIndex(24 * 7), dtype=float)
+
+    # ensure hourly frequency
+    ss = ss.resample("h").mean()
+
+    expected_len = 24 * 7
+    ss = ss.iloc[:expected_len]  # just in case there is extra data
+    # normalize index to 0..len-1 so we can align weeks on top of each other
+    ss.index = pd.RangeIndex(len(ss))
+
+    # pad if we have fewer than 168 points
+    if len(ss) < expected_len:
+        ss = ss.reindex(pd.RangeIndex(expected_len))
+
+    return ss
+
+
+def hourly_series_for_month(s: pd.Series, year: int, month: int) -> pd.Series:
+    ss = s[(s.index.year == year) & (s.index.month == month)]
+    if ss.empty:
+        return pd.Series(dtype=float)
+    return ss.resample("h").mean()
+
+
+def hourly_series_for_year(s: pd.Series, year: int) -> pd.Series:
+    """
+    Return an hourly series for a given year, indexed by the actual timestamps.
+    """
+    ss = s.loc[s.index.year == int(year)]
+    if ss.empty:
+        return pd.Series(dtype=float)
+
+    ss = ss.resample("h").mean()
+    return ss
+
+
+def hourly_series_for_month_aligned(s: pd.Series, year: int, month: int) -> pd.Series:
+    """
+    Return a 1D hourly series for a given month-year,
+    aligned to a 0..(31*24-1) 'hour of month' index.
+    """
+    start = pd.Timestamp(year=year, month=month, day=1)
+
+    # first day of the next month
+    if month == 12:
+        next_month = pd.Timestamp(year=year + 1, month=1, day=1)
+    else:
+        next_month = pd.Timestamp(year=year, month=month + 1, day=1)
+
+    # include full last day up to 23:00
+    end = next_month - pd.Timedelta(hours=1)
+
+    ss = s.loc[(s.index >= start) & (s.index <= end)]
+    if ss.empty:
+        return pd.Series(index=pd.RangeIndex(31 * 24), dtype=float)
+
+    ss = ss.resample("h").mean().sort_index()
+
+    expected_len = 31 * 24
+    ss = ss.iloc[:expected_len]          # just in case
+    ss.index = pd.RangeIndex(len(ss))    # 0..len-1
+
+    if len(ss) < expected_len:
+        ss = ss.reindex(pd.RangeIndex(expected_len))
+
+    return ss
+
+
+def hourly_series_for_year_aligned(s: pd.Series, year: int) -> pd.Series:
+    """
+    Return a 1D hourly series for a given year,
+    aligned to a 0..(365*24-1) 'hour of year' index.
+
+    For leap years, the extra day is truncated.
+    """
+    start = pd.Timestamp(year=year, month=1, day=1)
+    end = pd.Timestamp(year=year + 1, month=1, day=1) - pd.Timedelta(hours=1)
+
+    ss = s.loc[(s.index >= start) & (s.index <= end)]
+    if ss.empty:
+        return pd.Series(index=pd.RangeIndex(365 * 24), dtype=float)
+
+    ss = ss.resample("h").mean().sort_index()
+
+    expected_len = 365 * 24
+    ss = ss.iloc[:expected_len]        # truncate if leap year or extra data
+    ss.index = pd.RangeIndex(len(ss))  # 0..len-1
+
+    if len(ss) < expected_len:
+        ss = ss.reindex(pd.RangeIndex(expected_len))
+
+    return ss
\ No newline at end of file
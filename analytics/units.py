@@ -0,0 +1,33 @@
+"""
+Unit conversion factors and the unit columns derived from the stored ones.
+
+The loaders keep one unit per quantity; the other unit is computed on demand with `derived_column`,
+e.g. `derived_column(levels, "water_level_ft")`.
+"""
+import pandas as pd
+
+M_TO_FT = 3.28084
+M3HR_TO_GPM = 4.40287
+M3_TO_FT3 = 35.3147
+PSI_TO_FT = 2.31
+PSI_TO_M = 0.70307
+
+# derived column -> (stored column, factor)
+DERIVED_COLUMNS = {
+    "Filtered Water Flow Rate, m3/hr": ("Filtered Water Flow Rate, GPM", 1 / M3HR_TO_GPM),
+    "Master Meter Flow Rate, m3/hr": ("Master Meter Flow Rate, GPM", 1 / M3HR_TO_GPM),
+    "Distribution System Pressure Head, m": ("Distribution System Pressure, psi", PSI_TO_M),
+    "WST Height, m": ("WST Height, ft", 1 / M_TO_FT),
+    "water_level_ft": ("water_level_m", M_TO_FT),
+    "critical_threshold_ft": ("critical_threshold_m", M_TO_FT),
+    "flow_m3hr": ("flow_gpm", 1 / M3HR_TO_GPM),
+    "pump_head_m": ("pump_head_ft", 1 / M_TO_FT),
+    "pressure_head_m": ("pressure_psi", PSI_TO_M),
+    "volume_m3": ("volume_ft3", 1 / M3_TO_FT3),
+}
+
+
+def derived_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """ The derived unit column `name` (see DERIVED_COLUMNS) of a loaded frame, as float64 """
+    source, factor = DERIVED_COLUMNS[name]
+    return (df[source].astype(float) * factor).rename(name)
@@ -0,0 +1,72 @@
+import hashlib
+import os
+from functools import lru_cache
+
+from PIL import Image
+
+import utils
+
+# Streamlit serves everything under ./static at "app/static/..." when server.enableStaticServing is on
+STATIC_DIR = "static"
+STATIC_URL = "app/static"
+THUMBNAILS_DIR = os.path.join(STATIC_DIR, "thumbnails")
+
+
+def _file_signature(path: str):
+    st_ = os.stat(path)
+    return st_.st_mtime_ns, st_.st_size
+
+
+@lru_cache(maxsize=128)
+def _source_digest(path: str, mtime_ns: int, size: int) -> str:
+    # mtime and size are part of the cache key so an edited image gets a new digest
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+@lru_cache(maxsize=128)
+def _thumbnail(path: str, digest: str, target_h: int) -> str:
+    stem, ext = os.path.splitext(os.path.basename(path))
+    out_path = os.path.join(THUMBNAILS_DIR, f"{stem}-{digest}-h{target_h}{ext.lower()}")
+    if os.path.exists(out_path):
+        return out_path
+
+    os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+    with Image.open(path) as img:
+        fmt = img.format
+        resized = utils.resize_to_height(img, target_h)
+        # write to a temp file first - several server processes may generate the same thumbnail
+        tmp_path = f"{out_path}.{os.getpid()}.tmp"
+        resized.save(tmp_path, format=fmt)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def thumbnail_path(path: str, target_h: int) -> str:
+    """
+    Return the path of a resized copy of `path` with height `target_h`.
+    Thumbnails are generated once and keyed by the source content hash and target height,
+    so they survive restarts and are regenerated only when the source image changes.
+    """
+    digest = _source_digest(path, *_file_signature(path))
+    return _thumbnail(path, digest, target_h)
+
+
+@lru_cache(maxsize=128)
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def thumbnail_bytes(path: str, target_h: int) -> bytes:
+    """ Encoded thumbnail bytes, held in a process-level cache shared by all sessions """
+    return _read_bytes(thumbnail_path(path, target_h))
+
+
+def static_url(path: str, target_h: int) -> str:
+    """ URL of the thumbnail as served by Streamlit static file serving """
+    rel = os.path.relpath(thumbnail_path(path, target_h), STATIC_DIR)
+    return f"{STATIC_URL}/{rel.replace(os.sep, '/')}"
@@ -0,0 +1,70 @@
+"""
+Alert rules on the history of the default site: the vectorized replay of every rule over its whole dataset
+against feeding the same rows in small blocks as they would arrive (mean block of `--block-rows` rows), with the
+check that both give the same alerts:
+
+    python -m benchmarks.alerts --block-rows 4 --output bench_alerts.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import alerts
+import sites
+from analytics import alert_rules
+
+
+def measure(rule, df: pd.DataFrame, block_rows: int, seed: int) -> dict:
+    t0 = time.perf_counter()
+    replayed = alert_rules.replay(rule, df)
+    replay_sec = time.perf_counter() - t0
+
+    rng = np.random.default_rng(seed)
+    cuts = np.sort(rng.choice(np.arange(1, len(df)), size=max(len(df) // block_rows - 1, 0), replace=False))
+    blocks = [df.iloc[a:b] for a, b in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [len(df)]]))]
+    live = type(rule)(**rule.params)
+    t0 = time.perf_counter()
+    found = [a for block in blocks for a in alert_rules.evaluate(live, block)]
+    live_sec = time.perf_counter() - t0
+    return {
+        "rule": rule.name,
+        "rows": len(df),
+        "alerts": len(replayed),
+        "replay_ms": 1000 * replay_sec,
+        "blocks": len(blocks),
+        "per_block_us": 1e6 * live_sec / len(blocks),
+        "same_alerts": [tuple(a) for a in replayed.itertuples(index=False)] == [tuple(a) for a in found],
+    }
+
+
+def run(block_rows: int, seed: int = 0) -> list:
+    site = sites.get_site(sites.DEFAULT_SITE)
+    results = []
+    for rule in alerts.load_rules():
+        df = alerts.dataset_frame(site, rule.dataset)
+        r = measure(rule, df, block_rows, seed)
+        results.append(r)
+        print(f"{r['rule']:<32} {r['rows']:>7} rows {r['alerts']:>4} alerts  replay {r['replay_ms']:6.1f} ms  "
+              f"{r['blocks']:>6} blocks {r['per_block_us']:6.0f} us/block  same alerts: {r['same_alerts']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized replay vs incremental evaluation of the alert rules")
+    parser.add_argument("--block-rows", type=int, default=4, help="mean rows per incremental block")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = run(args.block_rows, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
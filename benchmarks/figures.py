@@ -0,0 +1,141 @@
+"""
+Payload size and serialization time of the heaviest figures of the pages, on the data of the default site.
+
+Every view is built from the cached loaders as the page builds it for its widest selection (the whole series, every
+period) and serialized the way st.plotly_chart does (plotly.io.to_json):
+
+    python -m benchmarks.figures --repeat 5 --output bench_figures.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+import plotly.io as pio
+
+import graph_utils
+import loaders
+from analytics import backwash, pumps, quality, storage, system_flow, units
+
+
+def _profiles(freq_label: str):
+    demand = loaders.load_hourly_system_flow()
+    periods = system_flow.build_period_options(demand.index, freq_label)
+    return loaders.load_period_profiles(freq_label, periods), periods
+
+
+def raw_data_view():
+    data = loaders.load_aligned_sensors("15min", "mean", True)
+    fig = graph_utils.plot_time_series(data=data.copy(), height_single=300, vertical_spacing=0.08,
+                                       line_kw=dict(line_width=1.6))
+    for row, label in enumerate(data.columns, start=1):
+        gaps = quality.intervals_frame(loaders.load_quality_index(loaders.RAW_SENSORS[label][0]), min_hours=24)
+        graph_utils.shade_intervals(fig, gaps, row=row)
+    return fig
+
+
+def annual_profiles_view():
+    profiles, _ = _profiles("Annually")
+    return graph_utils.hourly_profiles_figure(profiles, "Annually")
+
+
+def monthly_profiles_view():
+    profiles, _ = _profiles("Monthly")
+    return graph_utils.hourly_profiles_figure(profiles, "Monthly")
+
+
+def daily_statistics_view():
+    profiles, _ = _profiles("Daily")
+    index = loaders.load_quality_index("system_flow")
+    coverage = {p: quality.coverage_between(index.daily_coverage, *system_flow.period_bounds("Daily", p))
+                for p in profiles}
+    return graph_utils.stats_table_figure(system_flow.period_statistics(profiles, coverage))
+
+
+def monthly_totals_view():
+    index = loaders.load_quality_index("system_flow")
+    return graph_utils.monthly_totals_figure(loaders.load_monthly_totals(),
+                                             quality.monthly_coverage_pivot(index.monthly_coverage))
+
+
+def backwash_view():
+    event_pairs, duration_pairs = backwash.backwash_pairs(loaders.load_backwash())
+    return graph_utils.backwash_figure(event_pairs, duration_pairs)
+
+
+def storage_view():
+    data = loaders.load_storage_levels()
+    threshold = storage.critical_threshold_ft(data)
+    level_ft = units.derived_column(data, "water_level_ft")
+    return graph_utils.storage_level_figure(level_ft.to_frame(), threshold,
+                                            storage.violation_intervals(level_ft, threshold))
+
+
+def pump_curves_view():
+    df = loaders.load_hourly_pump_points(1)
+    return graph_utils.pump_curves_figure(df, df)
+
+
+def pump_density_view():
+    df = loaders.load_hourly_pump_points(1)
+    edges = pumps.density_edges(df)
+    return graph_utils.pump_curves_figure(df, df, pumps.qh_density(df, edges), edges, fitted_curves=True)
+
+
+VIEWS = {
+    "raw data 15 min": raw_data_view,
+    "hourly profiles, every year": annual_profiles_view,
+    "hourly profiles, every month": monthly_profiles_view,
+    "statistics, every day": daily_statistics_view,
+    "monthly totals": monthly_totals_view,
+    "backwash": backwash_view,
+    "storage level": storage_view,
+    "pump curves": pump_curves_view,
+    "pump curves, density": pump_density_view,
+}
+
+
+def measure(name: str, build, repeat: int) -> dict:
+    build()  # loads the data into the cache
+    build_sec, serialize_sec = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fig = build()
+        t1 = time.perf_counter()
+        payload = pio.to_json(fig, validate=False)
+        build_sec.append(t1 - t0)
+        serialize_sec.append(time.perf_counter() - t1)
+    return {
+        "view": name,
+        "traces": len(fig.data),
+        "json_kb": len(payload.encode("utf-8")) / 1e3,
+        "build_ms": 1000 * statistics.median(build_sec),
+        "serialize_ms": 1000 * statistics.median(serialize_sec),
+    }
+
+
+def run(repeat: int) -> list:
+    results = []
+    for name, build in VIEWS.items():
+        r = measure(name, build, repeat)
+        results.append(r)
+        print(f"{name:<30} {r['traces']:>4} traces  {r['json_kb']:9.1f} kB  build {r['build_ms']:8.1f} ms  "
+              f"serialize {r['serialize_ms']:7.1f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload size and serialization time of the heaviest figures")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
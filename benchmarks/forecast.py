@@ -0,0 +1,67 @@
+"""
+Cost and accuracy of the demand forecast on the master meter series of the default site, for every residual model:
+the first fit, an update with a day of new hours (refit), an update with an hour (no refit), the 7-day inference,
+and the mean absolute error of the baseline and of the forecast over the last weeks, each forecast from the data
+before it:
+
+    python -m benchmarks.forecast --weeks 8 --output bench_forecast.json
+"""
+import argparse
+import json
+import time
+
+import loaders
+from analytics import forecast
+
+
+def measure(demand, model: str, weeks: int) -> dict:
+    def timed(forecaster, series):
+        t0 = time.perf_counter()
+        forecaster.predict(series)
+        return 1000 * (time.perf_counter() - t0)
+
+    forecaster = forecast.DemandForecaster(model)
+    first_ms = timed(forecaster, demand.iloc[:-25])
+    day_ms = timed(forecaster, demand.iloc[:-1])
+    hour_ms = timed(forecaster, demand)
+    forecaster._forecast_key = None  # inference only, the model is up to date
+    inference_ms = timed(forecaster, demand)
+    errors = forecast.backtest(demand, model, weeks)
+    return {
+        "model": model,
+        "first_fit_ms": first_ms,
+        "update_day_ms": day_ms,
+        "update_hour_ms": hour_ms,
+        "inference_ms": inference_ms,
+        "baseline_mae": float(errors["baseline_mae"].mean()),
+        "forecast_mae": float(errors["forecast_mae"].mean()),
+    }
+
+
+def run(weeks: int) -> list:
+    demand = loaders.load_hourly_system_flow()[loaders.DEMAND_COL]
+    results = []
+    for model in forecast.MODELS:
+        r = measure(demand, model, weeks)
+        results.append(r)
+        print(f"{model:<6} first fit {r['first_fit_ms']:7.1f} ms  +1 day {r['update_day_ms']:7.1f} ms  "
+              f"+1 hour {r['update_hour_ms']:6.1f} ms  inference {r['inference_ms']:6.1f} ms  "
+              f"MAE baseline {r['baseline_mae']:6.2f}  forecast {r['forecast_mae']:6.2f} GPM")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost and accuracy of the demand forecast")
+    parser.add_argument("--weeks", type=int, default=8, help="weeks of the backtest")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = run(args.weeks)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Peak memory of the hourly aggregation of a long sensor archive, full load vs chunked reader.
+
+Every measurement runs in a fresh interpreter, as the peak RSS of a process only grows:
+
+    python -m benchmarks.memory --years 5 20 --chunk-rows 100000 --output bench_memory.json
+
+Peak RSS is read from /proc/self/status on Linux and with `resource.getrusage` on macOS.
+
+`--datasets` reports the in-memory size of every dataset of the default site instead, as parsed by a plain
+`pd.read_csv` and as held by the loaders (float32, categoricals, no duplicated unit columns):
+
+    python -m benchmarks.memory --datasets
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+DEMAND_COL = "Master Meter Flow Rate, GPM"
+
+
+def _peak_rss_mb() -> float:
+    # on Linux ru_maxrss survives fork + exec (it would report the parent's peak), VmHWM belongs to this process
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e3  # kB
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # bytes on macOS, kB on Linux
+
+
+def worker(mode: str, path: str, chunk_rows: int) -> dict:
+    """ Runs in the measured process """
+    import pandas as pd
+
+    import chunked
+    from analytics import system_flow
+
+    baseline = _peak_rss_mb()  # interpreter + imports
+    t0 = time.perf_counter()
+    if mode == "full":
+        data = pd.read_csv(path, index_col=0)
+        data.index = pd.to_datetime(data.index)
+        hourly = data.resample("60min").mean()
+    else:
+        hourly = chunked.aggregate_file(path, chunk_rows=chunk_rows).hourly
+    totals = system_flow.monthly_totals(hourly[DEMAND_COL])
+    return {
+        "mode": mode,
+        "seconds": time.perf_counter() - t0,
+        "baseline_mb": baseline,
+        "peak_rss_mb": _peak_rss_mb(),
+        "hours": len(hourly),
+        "months": int(totals.notna().sum().sum()),
+    }
+
+
+def measure(mode: str, path: str, chunk_rows: int) -> dict:
+    cmd = [sys.executable, "-m", "benchmarks.memory", "--worker", mode, path, "--chunk-rows", str(chunk_rows)]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=os.getcwd()).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(years_list, chunk_rows: int, seed: int = 0) -> list:
+    from benchmarks import synthetic  # not imported by the measured workers
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for years in years_list:
+            paths = synthetic.generate_site(os.path.join(tmp, f"{years:g}y"), years, seed=seed)
+            path = paths["system_flow"]
+            size_mb = os.path.getsize(path) / 1e6
+            for mode in ("full", "chunked"):
+                r = measure(mode, path, chunk_rows)
+                r.update(years=years, file_mb=size_mb, chunk_rows=chunk_rows)
+                results.append(r)
+                print(f"{years:>4g}y {size_mb:7.1f} MB  {mode:<8} peak {r['peak_rss_mb']:7.1f} MB "
+                      f"(+{r['peak_rss_mb'] - r['baseline_mb']:.1f} MB over imports)  {r['seconds']:.2f}s")
+    return results
+
+
+def dataset_report(site=None) -> list:
+    """ Memory of each dataset file of a site: plain read_csv vs the compact frame of the loaders """
+    import pandas as pd
+
+    import loaders
+    import sites
+    from cache import sizeof
+
+    site = sites.get_site(site)
+    parsers = {"storage": loaders.read_storage_levels, "pump_curves": loaders.read_pump_curves,
+               "backwash": loaders.read_backwash}
+    results = []
+    for dataset in sites.LAYOUT:
+        path = site.path(dataset)
+        if not os.path.exists(path):
+            continue
+        plain_mb = sizeof(pd.read_csv(path)) / 1e6
+        loaded = parsers.get(dataset, loaders.read_sensor_csv)(path)
+        loaded_mb = sizeof(loaded) / 1e6
+        results.append({"dataset": dataset, "rows": len(loaded), "read_csv_mb": plain_mb, "loaded_mb": loaded_mb,
+                        "dtypes": loaded.dtypes.astype(str).value_counts().to_dict()})
+        print(f"{dataset:<12} {len(loaded):>8} rows  read_csv {plain_mb:6.2f} MB  loaded {loaded_mb:6.2f} MB "
+              f"({loaded_mb / plain_mb:.0%})")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of full vs chunked aggregation")
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--datasets", action="store_true", help="memory of the default site's datasets")
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(*args.worker, args.chunk_rows)))
+        return
+
+    results = dataset_report() if args.datasets else run(args.years, args.chunk_rows, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Latency of the first navigation from the home page to every page, cold vs after the predictive prefetch.
+
+Every measurement runs the app headlessly (streamlit.testing AppTest) in a fresh interpreter with the disk cache and
+the cache warmer off, so only the prefetch can have loaded the page's data: the home page is opened, the prefetch
+(with a navigation history that predicts the page) is waited for, and the page is opened with its home page button.
+Runs on the data of the default site:
+
+    python -m benchmarks.prefetch --output bench_prefetch.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# page title -> `clicked` query parameter of its home page button in main.py
+BUTTONS = {
+    "Raw Data": "raw",
+    "System Flow": "system_flow",
+    "Pump Curves": "pumps",
+    "Water Losses": "backwash",
+    "Storage": "tank",
+}
+
+
+def worker(page: str, mode: str) -> dict:
+    """ Runs in the measured process """
+    from streamlit.testing.v1 import AppTest
+
+    import prefetch
+
+    at = AppTest.from_file("main.py", default_timeout=300).run()
+    prefetcher = prefetch.active_prefetcher()
+    t0 = time.perf_counter()
+    while prefetcher is not None and prefetcher.status()["queued"]:
+        time.sleep(0.01)
+    prefetch_sec = time.perf_counter() - t0
+    at.query_params["clicked"] = BUTTONS[page]
+    t0 = time.perf_counter()
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"{page}: {at.exception[0].value}")
+    return {
+        "page": page,
+        "mode": mode,
+        "navigation_ms": 1000 * (time.perf_counter() - t0),
+        "prefetch_wait_ms": 1000 * prefetch_sec,
+    }
+
+
+def measure(page: str, mode: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        history = os.path.join(tmp, "navigation.json")
+        with open(history, "w") as f:
+            json.dump({"Home": {page: 1}}, f)
+        env = dict(os.environ, DASHBOARD_PREFETCH="1" if mode == "prefetch" else "0", DASHBOARD_NAV_HISTORY=history,
+                   DASHBOARD_PREFETCH_PAGES="1", DASHBOARD_DISK_CACHE="0", DASHBOARD_WARM="0", DASHBOARD_ALERTS="0")
+        cmd = [sys.executable, "-m", "benchmarks.prefetch", "--worker", page, mode]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=os.getcwd(), env=env).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(pages) -> list:
+    results = []
+    for page in pages:
+        cold = measure(page, "cold")
+        warm = measure(page, "prefetch")
+        results += [cold, warm]
+        print(f"{page:<13} first navigation cold {cold['navigation_ms']:8.1f} ms   "
+              f"prefetched {warm['navigation_ms']:8.1f} ms   (prefetch took {warm['prefetch_wait_ms']:7.1f} ms)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="First navigation latency, cold vs prefetched")
+    parser.add_argument("--pages", nargs="+", default=list(BUTTONS), choices=list(BUTTONS))
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--worker", nargs=2, metavar=("PAGE", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(*args.worker)))
+        return
+
+    results = run(args.pages)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
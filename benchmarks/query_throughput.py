@@ -0,0 +1,117 @@
+"""
+Throughput of the local query service, Arrow IPC vs Parquet responses.
+
+Client threads send window queries of random position over the data of the default site, for every combination of
+resolution and format, and the requests/s, rows/s, MB/s and latencies are reported. The service is started in this
+process on a free port unless `--url` points to a running one (which keeps the clients' work off its interpreter):
+
+    python -m benchmarks.query_throughput --clients 4 --requests 50 --window-days 30 --output bench_query.json
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+
+import pandas as pd
+
+import query_client
+import query_service
+
+RESOLUTIONS = ["raw", "15min", "60min", "1D"]
+FORMATS = ["arrow", "parquet"]
+
+
+def _windows(client: query_client.QueryClient, window_days: float, n: int, seed: int) -> list:
+    """ n (start, end) windows inside the span of the site's data """
+    ts = client.table(resolution="1D").column("timestamp").to_pandas()
+    first, last = ts.iloc[0], ts.iloc[-1]
+    window = pd.Timedelta(days=window_days)
+    span = max((last - first - window).total_seconds(), 0)
+    rng = random.Random(seed)
+    starts = [first + pd.Timedelta(seconds=rng.uniform(0, span)) for _ in range(n)]
+    return [(s.floor("h"), (s + window).floor("h")) for s in starts]
+
+
+def measure(url: str, resolution: str, fmt: str, clients: int, windows: list) -> dict:
+    latencies, rows, nbytes = [], [0], [0]  # latencies include decoding the response
+    lock = threading.Lock()
+
+    def worker(ws):
+        client = query_client.QueryClient(url)
+        for start, end in ws:
+            t0 = time.perf_counter()
+            resp = client._get("/api/v1/series", start=str(start), end=str(end), resolution=resolution,
+                               format=fmt)
+            table = query_client.decode(resp.content, fmt)
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed)
+                rows[0] += table.num_rows
+                nbytes[0] += len(resp.content)
+
+    # warm up: every resolution is loaded into the cache before timing
+    query_client.QueryClient(url).table(resolution=resolution, fmt=fmt, start=windows[0][0], end=windows[0][1])
+    threads = [threading.Thread(target=worker, args=(windows[i::clients],)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "resolution": resolution,
+        "format": fmt,
+        "clients": clients,
+        "requests": len(latencies),
+        "requests_per_sec": len(latencies) / total,
+        "rows_per_sec": rows[0] / total,
+        "mb_per_sec": nbytes[0] / 1e6 / total,
+        "mb_per_request": nbytes[0] / 1e6 / len(latencies),
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def run(url: str | None, clients: int, requests: int, window_days: float, seed: int = 0) -> list:
+    service = None
+    if url is None:
+        service = query_service.QueryService(port=0).start()
+        url = service.url
+    try:
+        windows = _windows(query_client.QueryClient(url), window_days, requests, seed)
+        results = []
+        for resolution in RESOLUTIONS:
+            for fmt in FORMATS:
+                r = measure(url, resolution, fmt, clients, windows)
+                results.append(r)
+                print(f"{resolution:<6} {fmt:<8} {r['requests_per_sec']:7.1f} req/s  "
+                      f"{r['rows_per_sec'] / 1e3:8.1f} k rows/s  {r['mb_per_sec']:7.1f} MB/s  "
+                      f"{r['mb_per_request']:6.3f} MB/req  p50 {r['p50_ms']:6.1f} ms  p95 {r['p95_ms']:6.1f} ms")
+        return results
+    finally:
+        if service is not None:
+            service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the local query service")
+    parser.add_argument("--url", default=None, help="running service, started in this process by default")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="per resolution and format")
+    parser.add_argument("--window-days", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = run(args.url, args.clients, args.requests, args.window_days, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
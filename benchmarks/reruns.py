@@ -0,0 +1,123 @@
+"""
+Rerun latency of the page interactions, whole-page rerun vs fragment rerun.
+
+Every interaction changes one widget of a page and reruns the page headlessly (streamlit.testing AppTest), which
+reruns the whole page script as every widget change did before the pages were split into fragments; the time of the
+main.py script around the page is measured once and added. The time of the fragment holding the widget is taken
+from the run's timing records: it is what a fragment-scoped rerun executes in the app. Runs on the data of the
+default site:
+
+    python -m benchmarks.reruns --repeat 5 --output bench_reruns.json
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+PAGES = {
+    "raw_data": "raw_data_page",
+    "system_flow": "system_flow_page",
+    "pump_curves": "pump_curves_page",
+    "water_losses": "water_losses_page",
+    "storage": "storage_page",
+}
+
+
+def _shift_window(slider, i: int):
+    """ Move the end of a date range slider back and forth by a week """
+    lo, hi = slider.value
+    slider.set_value((lo, hi + datetime.timedelta(days=7 if i % 2 else -7)))
+
+
+def _select_periods(at, i: int):
+    widget = at.multiselect(key="selected_periods")
+    widget.set_value(widget.options[:2 + i % 2])
+
+
+# (page, interaction, fragment stage, action(at, i))
+INTERACTIONS = [
+    ("raw_data", "date window", "raw data window", lambda at, i: _shift_window(at.slider[0], i)),
+    ("system_flow", "period selection", "system flow periods", _select_periods),
+    ("pump_curves", "date window", "pump curves window", lambda at, i: _shift_window(at.slider[0], i)),
+    ("pump_curves", "flow input", "pump cluster query",
+     lambda at, i: at.number_input(key="q_input").set_value(40.0 + i % 2)),
+    ("water_losses", "date window", "backwash window", lambda at, i: _shift_window(at.slider[0], i)),
+    ("storage", "date window", "storage window", lambda at, i: _shift_window(at.slider[0], i)),
+    ("storage", "threshold", "storage window", lambda at, i: at.number_input[0].set_value(7.0 + 0.5 * (i % 2))),
+]
+
+
+def page_test(page: str) -> AppTest:
+    # like main.py: a new timing run per script run
+    script = (f"import sys; sys.path.insert(0, {os.getcwd()!r})\n"
+              f"import instrumentation\ninstrumentation.start_run({page!r})\n"
+              f"from pages.{page} import {PAGES[page]}\n{PAGES[page]}()\n")
+    return AppTest.from_string(script, default_timeout=300)
+
+
+def measure(page: str, interaction: str, stage: str, action, repeat: int) -> dict:
+    at = page_test(page).run()  # first run loads and caches the data
+    if at.exception:
+        raise RuntimeError(f"{page}: {at.exception[0].value}")
+    full, fragment = [], []
+    for i in range(repeat):
+        action(at, i)
+        t0 = time.perf_counter()
+        at.run()
+        full.append(time.perf_counter() - t0)
+        records = at.session_state["_timings_run"]["records"]
+        fragment.append(sum(r["seconds"] for r in records if r["kind"] == "fragment" and r["stage"] == stage))
+    return {
+        "page": page,
+        "interaction": interaction,
+        "fragment": stage,
+        "page_rerun_ms": 1000 * statistics.median(full),
+        "fragment_rerun_ms": 1000 * statistics.median(fragment),
+    }
+
+
+def app_overhead(repeat: int) -> float:
+    """ Time (ms) of the main.py script around the page - navigation, site selector, icon buttons """
+    at = AppTest.from_file("main.py", default_timeout=300).run()
+    overhead = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        at.run()
+        total = time.perf_counter() - t0
+        page = sum(r["seconds"] for r in at.session_state["_timings_run"]["records"] if r["kind"] == "page")
+        overhead.append(total - page)
+    return 1000 * statistics.median(overhead)
+
+
+def run(repeat: int) -> list:
+    results = []
+    overhead_ms = app_overhead(repeat)
+    print(f"app script around the page (skipped by every fragment rerun): {overhead_ms:.1f} ms")
+    for page, interaction, stage, action in INTERACTIONS:
+        r = measure(page, interaction, stage, action, repeat)
+        r["page_rerun_ms"] += overhead_ms
+        results.append(r)
+        print(f"{page:<13} {interaction:<17} page rerun {r['page_rerun_ms']:8.1f} ms   "
+              f"fragment rerun {r['fragment_rerun_ms']:8.1f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rerun latency of the page interactions")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Headless benchmarks of the computations behind each dashboard page.
+
+Generates synthetic sites of increasing length, times the core computations of each page on them and writes a
+JSON report that can be compared across commits:
+
+    python -m benchmarks.run_benchmarks --years 1 5 20 --sites 2 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import loaders
+from analytics import align, backwash, cleaning, pumps, quality, storage, system_flow, units
+from benchmarks import synthetic
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_call(fn, repeat: int):
+    """ Run fn `repeat` times and return the per-run durations in seconds and the last result """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - t0)
+    return durations, result
+
+
+def site_benchmarks(paths: dict):
+    """
+    Yield (name, page, fn) for every benchmarked computation of one site.
+    Inputs of later stages are parsed once up-front so that each benchmark times a single stage.
+    """
+    flow = loaders.read_sensor_csv(paths["system_flow"])
+    hourly = flow.resample("60min").mean()
+    demand = hourly[loaders.DEMAND_COL].astype(float)
+    weeks = system_flow.build_period_options(hourly.index, "Weekly")
+    months = system_flow.build_period_options(hourly.index, "Monthly")
+    years = system_flow.build_period_options(hourly.index, "Annually")
+
+    levels = loaders.read_storage_levels(paths["storage"])
+    level_ft = units.derived_column(levels, "water_level_ft")
+    threshold = storage.critical_threshold_ft(levels)
+
+    pump_points = loaders.read_pump_curves(paths["pump_curves"])
+    rng = np.random.default_rng(0)
+    queries = np.column_stack([rng.uniform(20, 65, 500), rng.uniform(25, 40, 500), rng.uniform(5, 22, 500)])
+
+    backwash_df = loaders.read_backwash(paths["backwash"])
+    sensors = {label: loaders.read_sensor_csv(paths[dataset])[col]
+               for label, (dataset, col) in loaders.RAW_SENSORS.items()}
+
+    def weekly_profiles():
+        return [system_flow.hourly_series_for_week(demand, *w.split(" - ")) for w in weeks]
+
+    def monthly_profiles():
+        return [system_flow.hourly_series_for_month_aligned(demand, pd.Period(m, freq="M").year,
+                                                            pd.Period(m, freq="M").month) for m in months]
+
+    def annual_profiles():
+        return [system_flow.hourly_series_for_year_aligned(demand, int(y)) for y in years]
+
+    yield "parse_system_flow", "system_flow", lambda: loaders.read_sensor_csv(paths["system_flow"])
+    yield "parse_treated_flow", "raw_data", lambda: loaders.read_sensor_csv(paths["treated_flow"])
+    yield "parse_pressure", "raw_data", lambda: loaders.read_sensor_csv(paths["pressure"])
+    pressure = loaders.read_sensor_csv(paths["pressure"])
+    yield "clean_pressure", "raw_data", lambda: cleaning.clean_frame(pressure)
+    yield "clean_system_flow", "system_flow", lambda: cleaning.clean_frame(flow)
+    yield "quality_index_pressure", "raw_data", lambda: quality.quality_index(
+        pressure["Distribution System Pressure, psi"], quality.QUALITY["Distribution System Pressure, psi"])
+    yield "align_sensors_15min", "raw_data", lambda: align.align_sensors(sensors, "15min")
+    yield "align_sensors_daily", "raw_data", lambda: align.align_sensors(sensors, "1D")
+    yield "hourly_resample", "system_flow", lambda: flow.resample("60min").mean()
+    yield "period_options_weekly", "system_flow", lambda: system_flow.build_period_options(hourly.index, "Weekly")
+    yield "profiles_weekly", "system_flow", weekly_profiles
+    yield "profiles_monthly", "system_flow", monthly_profiles
+    yield "profiles_annual", "system_flow", annual_profiles
+    yield "monthly_totals", "system_flow", lambda: system_flow.monthly_totals(hourly[loaders.DEMAND_COL])
+    yield "parse_storage", "storage", lambda: loaders.read_storage_levels(paths["storage"])
+    yield "storage_metrics", "storage", lambda: storage.storage_metrics(levels["water_level_m"], threshold)
+    yield "violation_intervals", "storage", lambda: storage.violation_intervals(level_ft, threshold)
+    yield "parse_pump_points", "pump_curves", lambda: loaders.read_pump_curves(paths["pump_curves"])
+    yield "hourly_pump_points", "pump_curves", lambda: loaders.hourly_pump_points(pump_points)
+    yield "pump_cluster_lookup_500", "pump_curves", \
+        lambda: [pumps.hard_coded_curves_pred(q, p, l) for q, p, l in queries]
+    yield "parse_backwash", "water_losses", lambda: loaders.read_backwash(paths["backwash"])
+    yield "backwash_pairs", "water_losses", lambda: backwash.backwash_pairs(backwash_df)
+
+
+def run(years_list, n_sites: int, repeat: int, seed: int = 0, data_dir: str | None = None) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for years in years_list:
+            root = os.path.join(data_dir or tmp, f"{years:g}y")
+            t0 = time.perf_counter()
+            sites = synthetic.generate(root, years, sites=n_sites, seed=seed)
+            print(f"generated {n_sites} site(s) x {years:g} years in {time.perf_counter() - t0:.1f}s")
+
+            timings = {}
+            rows = len(loaders.read_sensor_csv(sites[0]["system_flow"]))
+            for paths in sites:
+                for name, page, fn in site_benchmarks(paths):
+                    durations, _ = time_call(fn, repeat)
+                    timings.setdefault((name, page), []).append(durations)
+
+            for (name, page), per_site in timings.items():
+                # a run of a benchmark is the time to compute it for every site
+                runs = [sum(d) for d in zip(*per_site)]
+                results.append({
+                    "name": name,
+                    "page": page,
+                    "years": years,
+                    "sites": n_sites,
+                    "rows_per_site": rows,
+                    "repeat": repeat,
+                    "min_s": min(runs),
+                    "median_s": statistics.median(runs),
+                    "mean_s": statistics.fmean(runs),
+                })
+                print(f"  {name:<28} {min(runs) * 1000:10.1f} ms")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {"years": list(years_list), "sites": n_sites, "repeat": repeat, "seed": seed},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard computations on synthetic data")
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 5])
+    parser.add_argument("--sites", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=None, help="keep the generated data here instead of a temp folder")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    if any(y < 1 or y > 20 for y in args.years):
+        parser.error("--years must be between 1 and 20")
+
+    report = run(args.years, args.sites, args.repeat, args.seed, args.data_dir)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Synthetic sensor data generator for benchmarking.
+
+Writes a site folder in the same file formats as the dashboard's data folder:
+15-minute treated flow, system flow, pressure and tank level series, hourly pump operating points
+and a backwash event table. Series contain the irregularities of the real data - dropped readings,
+gaps, pressure spikes and near-zero readings at startup.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import sites
+
+TIMESTAMP_FORMAT = "%m/%d/%Y %H:%M"
+READINGS_PER_DAY = 96  # 15-minute resolution
+
+SITE_FILES = sites.LAYOUT  # a generated site is a valid dashboard site folder
+
+# fitted curve coefficients of the nine speed clusters (same as the pump curves page)
+CURVE_A = -0.006755334
+CURVE_B = np.linspace(0.306215982, 0.436868135, 9)
+CURVE_C = np.array([31.18835733, 34.60382899, 38.19672776, 41.96705362, 45.91480658, 50.03998664,
+                    54.34259381, 58.82262807, 63.48008943])
+CLUSTERS = np.arange(7, 16)
+
+
+def _drop_readings(rng, n: int, drop_frac: float, n_gaps: int, max_gap: int) -> np.ndarray:
+    """ Boolean mask of the readings to keep: random single dropouts plus a few longer gaps """
+    keep = rng.random(n) > drop_frac
+    for start in rng.integers(0, n, n_gaps):
+        keep[start:start + rng.integers(4, max_gap)] = False
+    return keep
+
+
+def demand_gpm(idx: pd.DatetimeIndex, rng, base: float = 40.0) -> np.ndarray:
+    hour = idx.hour.to_numpy() + idx.minute.to_numpy() / 60
+    doy = idx.dayofyear.to_numpy()
+    diurnal = 1 + 0.25 * np.exp(-((hour - 8) ** 2) / 6) + 0.3 * np.exp(-((hour - 19) ** 2) / 8) - 0.2 * (hour < 5)
+    weekly = np.where(idx.dayofweek.to_numpy() >= 5, 1.08, 1.0)
+    seasonal = 1 + 0.15 * np.cos(2 * np.pi * (doy - 200) / 365.25)  # summer peak
+    noise = rng.normal(0, 0.08, len(idx))
+    return np.clip(base * diurnal * weekly * seasonal * (1 + noise), 0, None)
+
+
+def treated_flow_gpm(idx: pd.DatetimeIndex, rng, rate: float = 60.0) -> np.ndarray:
+    # the treatment plant runs in blocks of a few hours
+    n = len(idx)
+    run_lengths = rng.integers(8, 32, n // 8 + 1)
+    on = np.repeat(np.arange(len(run_lengths)) % 2 == 0, run_lengths)[:n]
+    return np.where(on, rate + rng.normal(0, 2, n), rng.uniform(0, 0.5, n))
+
+
+def pressure_psi(idx: pd.DatetimeIndex, demand: np.ndarray, rng) -> np.ndarray:
+    psi = 32 - 0.05 * (demand - demand.mean()) + rng.normal(0, 0.6, len(idx))
+    psi[:READINGS_PER_DAY // 4] = rng.uniform(0, 0.05, READINGS_PER_DAY // 4)  # sensor warm-up
+    spikes = rng.random(len(idx)) < 0.0005
+    psi[spikes] = rng.uniform(150, 400, spikes.sum())
+    return psi
+
+
+def tank_level_m(demand: np.ndarray, supply: np.ndarray, rng, area_m2: float = 45.0) -> np.ndarray:
+    # mass balance of the storage tank, 1 GPM for 15 minutes = 0.0568 m3
+    net_m3 = (supply - demand) * 0.0568
+    level = 4.0 + np.cumsum(net_m3) / area_m2
+    # operators keep the tank between bounds - fold the drift back into range
+    level = 1.8 + np.abs((level - 1.8) % 8.0 - 4.0)
+    return level + rng.normal(0, 0.01, len(level))
+
+
+def pump_points(idx: pd.DatetimeIndex, demand: np.ndarray, rng) -> pd.DataFrame:
+    hourly = pd.Series(demand, index=idx).resample("h").mean().dropna()
+    q_gpm = hourly.to_numpy()
+    k = rng.integers(0, len(CLUSTERS), len(hourly))
+    # the speed cluster changes every few weeks, not every hour
+    k = pd.Series(k).groupby(np.arange(len(k)) // (24 * 14)).transform("first").to_numpy()
+    head_ft = CURVE_A * q_gpm ** 2 + CURVE_B[k] * q_gpm + CURVE_C[k] + rng.normal(0, 0.8, len(q_gpm))
+    head_m = head_ft / 3.28084
+    psi = (head_ft + 20) / 2.31
+    return pd.DataFrame({
+        "Timestamp": hourly.index.strftime(TIMESTAMP_FORMAT),
+        "Master Meter Flow Rate_m3hr": q_gpm / 4.40287,
+        "Distribution System Pressure Head, m": psi / 1.42197,
+        "Distribution System Pressure Head, psi": psi,
+        "cluster": CLUSTERS[k],
+        "pump_head_m": head_m,
+        "pump_head_ft": head_ft,
+    })
+
+
+def backwash_events(start: pd.Timestamp, end: pd.Timestamp, rng) -> pd.DataFrame:
+    rows = []
+    t = start + pd.Timedelta(hours=12)
+    while t < end:
+        process_end = t + pd.Timedelta(minutes=15 * int(rng.integers(8, 120)))
+        bw_start = process_end - pd.Timedelta(minutes=15 * int(rng.integers(4, 8)))
+        bw_end = bw_start + pd.Timedelta(minutes=30)
+        vol = rng.normal(6.5, 0.6)
+        rows += [
+            (t, "process_start", np.nan, "Phase 1: Backwash Process Duration", "#9cadb7", "process_duration",
+             process_end),
+            (bw_start, "backwash_event_start", vol, "Phase 2: Backwash Event", "#bf5700", "backwash_event", bw_end),
+            (bw_end, "backwash_event_end", vol, "Phase 2: Backwash Event", "#bf5700", "backwash_event", bw_start),
+            (process_end, "process_end", np.nan, "Phase 1: Backwash Process Duration", "#9cadb7",
+             "process_duration", t),
+        ]
+        t = process_end + pd.Timedelta(days=float(rng.uniform(2, 8)))
+    df = pd.DataFrame(rows, columns=["timestamp", "event_type", "volume_m3", "phase", "color", "data_type",
+                                     "paired_timestamp"])
+    return df.sort_values("timestamp", kind="stable")
+
+
+def generate_site(out_dir: str, years: float, seed: int = 0, start: str = "2022-01-01") -> dict:
+    """
+    Generate one site's datasets under `out_dir` and return the paths of the written files keyed by dataset.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(years * 365 * READINGS_PER_DAY)
+    idx = pd.date_range(start, periods=n, freq="15min")
+    base = 30 + 20 * rng.random()
+
+    demand = demand_gpm(idx, rng, base=base)
+    supply = treated_flow_gpm(idx, rng, rate=demand.mean() * 1.6)
+    series = {
+        "treated_flow": ("Filtered Water Flow Rate, GPM", "Filtered Water Flow Rate, m3/hr", supply, 1 / 4.40287),
+        "system_flow": ("Master Meter Flow Rate, GPM", "Master Meter Flow Rate, m3/hr", demand, 1 / 4.40287),
+        "pressure": ("Distribution System Pressure, psi", "Distribution System Pressure Head, m",
+                     pressure_psi(idx, demand, rng), 0.70307),
+        "tank_level": ("WST Height, ft", "WST Height, m", tank_level_m(demand, supply, rng) * 3.28084, 1 / 3.28084),
+    }
+
+    paths = {name: os.path.join(out_dir, rel) for name, rel in SITE_FILES.items()}
+    for d in {os.path.dirname(p) for p in paths.values()}:
+        os.makedirs(d, exist_ok=True)
+
+    for name, (col, col_si, values, to_si) in series.items():
+        keep = _drop_readings(rng, n, drop_frac=0.01, n_gaps=max(1, int(years * 6)), max_gap=READINGS_PER_DAY * 2)
+        df = pd.DataFrame({col: values[keep], col_si: values[keep] * to_si},
+                          index=idx[keep].strftime(TIMESTAMP_FORMAT))
+        df.to_csv(paths[name])
+
+    level_m = series["tank_level"][2] / 3.28084
+    threshold_m = 2.2352
+    storage = pd.DataFrame({
+        "Timestamp": idx.strftime(TIMESTAMP_FORMAT),
+        "water_level_m": level_m,
+        "critical_threshold_m": threshold_m,
+        "below_critical": np.where(level_m < threshold_m, "TRUE", "FALSE"),
+        "above_critical": np.where(level_m < threshold_m, "FALSE", "TRUE"),
+    })
+    storage.to_csv(paths["storage"], index=False)
+
+    pump_points(idx, demand, rng).to_csv(paths["pump_curves"])
+    backwash_events(idx[0], idx[-1], rng).to_csv(paths["backwash"], index=False, date_format="%Y-%m-%d %H:%M:%S")
+    return paths
+
+
+def generate(out_dir: str, years: float, sites: int = 1, seed: int = 0) -> list:
+    """ Generate `sites` independent sites under out_dir/site_<i>, return the list of path dicts """
+    return [generate_site(os.path.join(out_dir, f"site_{i}"), years, seed=seed + i) for i in range(sites)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic 15-minute sensor data")
+    parser.add_argument("out_dir")
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--sites", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for p in generate(args.out_dir, args.years, args.sites, args.seed):
+        print(os.path.dirname(p["system_flow"]))
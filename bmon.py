@@ -0,0 +1,200 @@
+"""
+Fetcher for the ANTHC BMON remote monitoring feed (https://anthc.bmon.org).
+
+Pulls the readings of every configured sensor of every community concurrently - a thread pool sharing one pooled
+`requests.Session` - and appends them to the raw sensor CSV files, where the ingestion service picks them up.
+Pulls are incremental: each sensor only asks for readings after the last timestamp already in its file.
+Failed requests (connection errors, 429 and 5xx responses) are retried with exponential backoff.
+
+    python -m bmon --url http://localhost:8765 --workers 8
+
+`bmon_server.py` serves the same API from local CSV files for offline use.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import sites
+
+BMON_URL = os.environ.get("DASHBOARD_BMON_URL", "https://anthc.bmon.org")
+READINGS_API = "/api/v1/readings/{sensor_id}/"
+MAX_WORKERS = 8
+TIMEOUT_SEC = 30
+RETRIES = 4
+BACKOFF_SEC = 0.5  # waits 0.5, 1, 2, 4 s between attempts
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+
+class Sensor(NamedTuple):
+    """ One BMON sensor and the CSV file (relative to the community folder) its readings are appended to """
+    key: str
+    file: str
+    column: str
+    si_column: str
+    to_si: float
+
+
+SENSORS = [
+    Sensor("treated_flow", "1_treated_water.csv", "Filtered Water Flow Rate, GPM",
+           "Filtered Water Flow Rate, m3/hr", 1 / 4.40287),
+    Sensor("tank_level", "2_tank_water_level.csv", "WST Height, ft", "WST Height, m", 1 / 3.28084),
+    Sensor("system_flow", "3_system_flow.csv", "Master Meter Flow Rate, GPM", "Master Meter Flow Rate, m3/hr",
+           1 / 4.40287),
+    Sensor("pressure", "4_system_pressure.csv", "Distribution System Pressure, psi",
+           "Distribution System Pressure Head, m", 0.70307),
+]
+
+
+def sensor_id(community: str, sensor: Sensor) -> str:
+    """ BMON sensor ID, e.g. 'arctic_village_system_flow' """
+    return f"{community.lower().replace(' ', '_')}_{sensor.key}"
+
+
+class FetchResult(NamedTuple):
+    sensor_id: str
+    path: str
+    rows: int
+    seconds: float
+    error: str | None = None
+
+
+def make_session(pool_size: int = MAX_WORKERS, retries: int = RETRIES, backoff: float = BACKOFF_SEC) \
+        -> requests.Session:
+    """ Session with a connection pool large enough for every worker and retries with exponential backoff """
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS, allowed_methods=["GET"],
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def last_timestamp(path: str) -> pd.Timestamp | None:
+    """ Timestamp of the last row of a sensor CSV file, reading only the end of the file """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 4096))
+        lines = f.read().splitlines()
+    for line in reversed(lines[1:]):  # the first line is the header or cut by the seek
+        ts = line.split(b",", 1)[0].strip()
+        if ts:
+            return pd.to_datetime(ts.decode())
+    return None
+
+
+def fetch_readings(session: requests.Session, base_url: str, sid: str, start: pd.Timestamp | None = None,
+                   timeout: float = TIMEOUT_SEC) -> pd.Series:
+    """ Readings of one sensor after `start` (all readings if None) as a time-indexed Series """
+    params = {"start_ts": start.strftime("%Y-%m-%d %H:%M:%S")} if start is not None else {}
+    response = session.get(base_url.rstrip("/") + READINGS_API.format(sensor_id=sid), params=params,
+                           timeout=timeout)
+    response.raise_for_status()
+    payload = response.json()
+    if payload.get("status") != "success":
+        raise ValueError(f"{sid}: {payload.get('message', 'request failed')}")
+
+    readings = payload["data"]["readings"]
+    if not readings:
+        return pd.Series(dtype=float)
+    ts, values = zip(*readings)
+    ser = pd.Series(values, index=pd.to_datetime(list(ts)), dtype=float)
+    if start is not None:
+        ser = ser[ser.index > start]  # start_ts is inclusive
+    return ser[~ser.index.duplicated(keep="last")].sort_index()
+
+
+def format_timestamps(index: pd.DatetimeIndex) -> pd.Index:
+    """ Timestamps in the format of the exported CSV files, e.g. '7/23/2022 1:15' """
+    return index.month.astype(str) + "/" + index.day.astype(str) + "/" + index.year.astype(str) + " " \
+        + index.hour.astype(str) + index.strftime(":%M")
+
+
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+
+def _file_lock(path: str) -> threading.Lock:
+    with _file_locks_lock:
+        return _file_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def append_readings(path: str, sensor: Sensor, readings: pd.Series) -> int:
+    """
+    Append the readings to the sensor file in its CSV format, creating it if needed.
+    The rows are written with a single write so that readers tailing the file never see a partial block.
+    """
+    if readings.empty:
+        return 0
+    with _file_lock(path):
+        last = last_timestamp(path)
+        if last is not None:
+            readings = readings[readings.index > last]
+            if readings.empty:
+                return 0
+        df = pd.DataFrame({sensor.column: readings, sensor.si_column: readings * sensor.to_si})
+        df.index = format_timestamps(df.index)
+        new_file = not os.path.exists(path)
+        text = df.to_csv(header=new_file, lineterminator="\n")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", newline="") as f:
+            f.write(text)
+    return len(df)
+
+
+def fetch_sensor(session: requests.Session, base_url: str, community: str, sensor: Sensor,
+                 raw_dir: str | None = None) -> FetchResult:
+    sid = sensor_id(community, sensor)
+    path = os.path.join(raw_dir or sites.all_sites()[community].raw_dir, sensor.file)
+    t0 = time.perf_counter()
+    try:
+        readings = fetch_readings(session, base_url, sid, last_timestamp(path))
+        rows = append_readings(path, sensor, readings)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        return FetchResult(sid, path, 0, time.perf_counter() - t0, f"{type(e).__name__}: {e}")
+    return FetchResult(sid, path, rows, time.perf_counter() - t0)
+
+
+def fetch_all(base_url: str = BMON_URL, communities: dict | None = None, sensors=SENSORS,
+              workers: int = MAX_WORKERS, session: requests.Session | None = None) -> list[FetchResult]:
+    """
+    Pull the new readings of every sensor of every community (community -> raw folder, all registered sites by
+    default) concurrently. Failures are reported per sensor in the results instead of aborting the other pulls.
+    """
+    if communities is None:
+        communities = {name: site.raw_dir for name, site in sites.all_sites().items()}
+    session = session or make_session(workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fetch_sensor, session, base_url, community, sensor, raw_dir)
+                   for community, raw_dir in communities.items() for sensor in sensors]
+        return [f.result() for f in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pull new sensor readings from BMON into the raw data files")
+    parser.add_argument("--url", default=BMON_URL)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    results = fetch_all(args.url, workers=args.workers)
+    for r in results:
+        status = r.error or f"{r.rows} new rows"
+        print(f"{r.sensor_id:<40} {r.seconds * 1000:8.0f} ms  {status}")
+    print(f"{sum(r.rows for r in results)} rows from {len(results)} sensors in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Local stand-in for the BMON readings API, serving sensor CSV files so that the fetcher can be used offline.
+
+    python bmon_server.py --source "Arctic Village=benchmarks_data/site_0/1_raw sensor data" --port 8765
+
+Every community maps to a folder with the raw sensor files (e.g. generated with `benchmarks.synthetic`), the sensor
+IDs are the ones of `bmon.SENSORS`. `--fail-rate` makes a share of the requests fail with 503 and `--latency`
+delays every response, to exercise the fetcher's retries and concurrency.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+import bmon
+
+
+class ReadingsStore:
+    """ sensor ID -> readings Series, each file is parsed on the first request for it """
+    def __init__(self, sources: dict):
+        self.files = {
+            bmon.sensor_id(community, sensor): (os.path.join(folder, sensor.file), sensor.column)
+            for community, folder in sources.items() for sensor in bmon.SENSORS
+        }
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def readings(self, sid: str) -> pd.Series | None:
+        if sid not in self.files:
+            return None
+        with self._lock:
+            if sid not in self._series:
+                path, column = self.files[sid]
+                if not os.path.exists(path):
+                    return None
+                df = pd.read_csv(path, index_col=0, usecols=[0, 1])
+                ser = df[column].set_axis(pd.to_datetime(df.index))
+                self._series[sid] = ser[~ser.index.duplicated(keep="last")].sort_index()
+            return self._series[sid]
+
+
+def _handler(store: ReadingsStore, fail_rate: float, latency: float):
+    prefix, suffix = bmon.READINGS_API.split("{sensor_id}")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            if fail_rate and random.random() < fail_rate:
+                self._send(503, {"status": "error", "message": "service unavailable"})
+                return
+
+            url = urlparse(self.path)
+            if not (url.path.startswith(prefix) and url.path.endswith(suffix)):
+                self._send(404, {"status": "error", "message": "not found"})
+                return
+            sid = url.path[len(prefix):len(url.path) - len(suffix)]
+            ser = store.readings(sid)
+            if ser is None:
+                self._send(404, {"status": "error", "message": f"unknown sensor {sid}"})
+                return
+
+            query = parse_qs(url.query)
+            if "start_ts" in query:
+                ser = ser[ser.index >= pd.Timestamp(query["start_ts"][0])]
+            if "end_ts" in query:
+                ser = ser[ser.index <= pd.Timestamp(query["end_ts"][0])]
+            ser = ser.dropna()
+            readings = list(zip(ser.index.strftime("%Y-%m-%d %H:%M:%S"), ser))
+            self._send(200, {"status": "success", "data": {"readings": readings, "sensor_info": {"sensor_id": sid}}})
+
+        def _send(self, code: int, payload: dict):
+            body = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep the console quiet, the fetcher reports every request
+
+    return Handler
+
+
+def serve(sources: dict, host: str = "127.0.0.1", port: int = 0, fail_rate: float = 0.0,
+          latency: float = 0.0) -> ThreadingHTTPServer:
+    """ Start the server in a daemon thread (port 0 picks a free port), stop it with server.shutdown() """
+    server = ThreadingHTTPServer((host, port), _handler(ReadingsStore(sources), fail_rate, latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve local sensor files through the BMON readings API")
+    parser.add_argument("--source", action="append", required=True, metavar="COMMUNITY=FOLDER")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    args = parser.parse_args()
+
+    sources = dict(s.split("=", 1) for s in args.source)
+    server = serve(sources, args.host, args.port, args.fail_rate, args.latency)
+    print(f"serving {', '.join(sources)} on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
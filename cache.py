@@ -0,0 +1,198 @@
+import functools
+import os
+import sys
+import threading
+import time
+
+import cachetools
+import numpy as np
+import pandas as pd
+
+import disk_cache
+
+# memory budget and time-to-live of the process-wide cache, shared by all sessions
+CACHE_MAX_MB = float(os.environ.get("DASHBOARD_CACHE_MB", 512))
+CACHE_TTL_SEC = float(os.environ.get("DASHBOARD_CACHE_TTL", 6 * 3600))
+
+
+def sizeof(value) -> int:
+    """ Approximate memory footprint of a cached value in bytes """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+def freeze(value):
+    """
+    Mark the NumPy arrays of a cached value read-only. The arrays are shared by all sessions without copies,
+    an in-place change by one session raises instead of silently changing the data of the others.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        for arr in value._mgr.arrays:
+            arr = getattr(arr, "_ndarray", arr)  # datetime arrays wrap an ndarray
+            if isinstance(arr, np.ndarray):
+                arr.flags.writeable = False
+    elif isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            freeze(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            freeze(v)
+    return value
+
+
+def file_signature(path: str):
+    """ (mtime, size) of a source file, None if the file does not exist """
+    try:
+        st_ = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st_.st_mtime_ns, st_.st_size
+
+
+class DatasetCache:
+    """
+    Process-wide cache for parsed datasets and derived aggregates.
+
+    Entries are evicted least-recently-used first once the memory budget is exceeded, and expire after `ttl`
+    seconds. Every entry records the signatures of the source files it was built from, a changed source file
+    makes the entry stale and it is rebuilt on the next access.
+    Cached objects are shared by all sessions, their arrays are made read-only (see `freeze`).
+    With a `disk` cache a missing entry is read from disk before it is computed, and a computed one is written
+    there, so entries survive restarts (see disk_cache).
+    """
+    def __init__(self, max_bytes: int, ttl: float, disk: disk_cache.DiskCache | None = None):
+        self.max_bytes = int(max_bytes)
+        self.ttl = ttl
+        self.disk = disk
+        self._entries = cachetools.TTLCache(maxsize=self.max_bytes, ttl=ttl, getsizeof=lambda e: e[2])
+        self._lock = threading.RLock()
+        self._key_locks = {}  # key -> [lock, number of callers holding or waiting for it], only while computing
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key, sources, fn):
+        signatures = tuple(file_signature(p) for p in sources)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == signatures:
+                self.hits += 1
+                return entry[0]
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+
+        # one session computes a missing entry while concurrent sessions asking for the same key wait for it
+        try:
+            with key_lock[0]:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[1] == signatures:
+                        self.hits += 1
+                        return entry[0]
+                    self.misses += 1
+                    if entry is not None:
+                        self.invalidations += 1
+
+                value = self._load_or_compute(key, sources, signatures, fn)
+                entry = (value, signatures, sizeof(value), tuple(sources))
+                with self._lock:
+                    if entry[2] <= self.max_bytes:
+                        self._entries[key] = entry
+                return value
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:  # the last caller of the key drops its lock, the dict stays small
+                    del self._key_locks[key]
+
+    def _load_or_compute(self, key, sources, signatures, fn):
+        entry_id = self.disk.entry_id(key, sources, signatures) if self.disk is not None else None
+        if entry_id is not None:
+            found, value = self.disk.get(entry_id)
+            if found:
+                return freeze(value)
+        t0 = time.perf_counter()
+        value = freeze(fn())
+        if entry_id is not None:
+            self.disk.put(entry_id, value, key, time.perf_counter() - t0)
+        return value
+
+    def invalidate(self, path: str | None = None):
+        """ Drop all entries built from `path`, or every entry if no path is given """
+        path = os.path.normpath(path) if path is not None else None
+        with self._lock:
+            keys = [k for k, e in self._entries.items()
+                    if path is None or path in (os.path.normpath(p) for p in e[3])]
+            for k in keys:
+                self._entries.pop(k, None)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def report(self) -> pd.DataFrame:
+        """ Memory footprint of every cached entry, largest first """
+        with self._lock:
+            self._entries.expire()
+            rows = [(_describe(key), _shape(e[0]), e[2] / 1e6, ", ".join(os.path.basename(p) for p in e[3]))
+                    for key, e in self._entries.items()]
+        df = pd.DataFrame(rows, columns=["entry", "shape", "mb", "sources"])
+        return df.sort_values("mb", ascending=False, ignore_index=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._entries.expire()
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "used_mb": self._entries.currsize / 1e6,
+                "budget_mb": self.max_bytes / 1e6,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                **(self.disk.stats() if self.disk is not None else {}),
+            }
+
+
+def _describe(key) -> str:
+    """ Short label of a cache key: the function name and its arguments without the module """
+    if len(key) > 1 and key[0] in sys.modules:
+        key = key[1:]  # keys of the decorated loaders start with the module
+    return " ".join(os.path.basename(k) if isinstance(k, str) else repr(k) for k in key if k != ())
+
+
+def _shape(value) -> str:
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return "x".join(str(n) for n in value.shape)
+    return type(value).__name__
+
+
+_cache = DatasetCache(max_bytes=CACHE_MAX_MB * 1e6, ttl=CACHE_TTL_SEC,
+                      disk=disk_cache.DiskCache() if disk_cache.DISK_CACHE_ENABLED else None)
+
+
+def get_cache() -> DatasetCache:
+    return _cache
+
+
+def cached(*sources: str):
+    """
+    Decorator caching the result of a loader / aggregate function in the process-wide cache.
+    The cache key is the function name and its arguments, the entry is rebuilt when any of `sources` changes.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+            return _cache.get_or_compute(key, sources, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
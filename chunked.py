@@ -0,0 +1,102 @@
+"""
+Bounded-memory aggregation of long sensor archives.
+
+The CSV file is parsed in fixed-size chunks and every chunk is pushed through the aggregation stages, which carry
+the state that spans chunk boundaries (the partially filled last hour, an open below-threshold interval). Only the
+aggregates are kept, so peak memory depends on the chunk size and not on the length of the archive:
+
+    result = chunked.aggregate_file(path, thresholds={"WST Height, ft": 7.33})
+    result.hourly, result.monthly_totals(col), result.intervals[col]
+
+This module does not import Streamlit, so that it can be used (and its memory measured) in plain processes.
+"""
+from typing import NamedTuple
+
+import pandas as pd
+
+from analytics import system_flow
+from analytics.storage import IntervalTracker
+
+CHUNK_ROWS = 100_000
+
+
+def iter_chunks(path: str, chunk_rows: int = CHUNK_ROWS, usecols=None):
+    """ Parsed chunks of a sensor CSV file (first column = timestamps), each indexed by timestamp """
+    with pd.read_csv(path, index_col=0, usecols=usecols, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            chunk.index = pd.to_datetime(chunk.index)
+            yield chunk
+
+
+class HourlyAccumulator:
+    """
+    Hourly means of a stream of chunks in time order. The sums and counts of the last hour of a chunk are carried
+    over, as the next chunk may continue that hour.
+    """
+    def __init__(self):
+        self._blocks = []
+        self._carry_sum = None
+        self._carry_count = None
+
+    def update(self, chunk: pd.DataFrame):
+        values = chunk.astype(float)
+        hours = values.index.floor("h")
+        sums = values.groupby(hours).sum(min_count=1)
+        counts = values.groupby(hours).count()
+        if self._carry_sum is not None:
+            if sums.index[0] == self._carry_sum.index[0]:
+                sums.iloc[:1] = sums.iloc[:1].add(self._carry_sum, fill_value=0).to_numpy()
+                counts.iloc[:1] = counts.iloc[:1].add(self._carry_count, fill_value=0).to_numpy()
+            else:
+                self._blocks.append(self._carry_sum / self._carry_count.replace(0, float("nan")))
+        # every hour but the last one is complete
+        self._blocks.append(sums.iloc[:-1] / counts.iloc[:-1].replace(0, float("nan")))
+        self._carry_sum, self._carry_count = sums.iloc[-1:], counts.iloc[-1:]
+
+    def result(self) -> pd.DataFrame:
+        """ Hourly means on a regular hourly index, same as the full frame's resample("60min").mean() """
+        blocks = list(self._blocks)
+        if self._carry_sum is not None:
+            blocks.append(self._carry_sum / self._carry_count.replace(0, float("nan")))
+        blocks = [b for b in blocks if len(b)]
+        if not blocks:
+            return pd.DataFrame()
+        means = pd.concat(blocks)
+        return means.reindex(pd.date_range(means.index[0], means.index[-1], freq="60min", name=means.index.name))
+
+
+class StreamResult(NamedTuple):
+    rows: int
+    chunks: int
+    hourly: pd.DataFrame
+    intervals: dict  # column -> x0 / x1 table of the below-threshold stretches
+
+    def monthly_totals(self, col: str) -> pd.DataFrame:
+        return system_flow.monthly_totals(self.hourly[col])
+
+
+def aggregate_file(path: str, thresholds: dict | None = None, chunk_rows: int = CHUNK_ROWS,
+                   usecols=None) -> StreamResult:
+    """ Hourly means and below-threshold intervals (column -> threshold) of a sensor file, chunk by chunk """
+    hourly = HourlyAccumulator()
+    trackers = {col: IntervalTracker(threshold) for col, threshold in (thresholds or {}).items()}
+    rows = chunks = 0
+    last_ts = None
+
+    for chunk in iter_chunks(path, chunk_rows, usecols):
+        # the archives are in time order - drop repeated or out of order rows as the ingestion does
+        if last_ts is not None:
+            chunk = chunk[chunk.index > last_ts]
+        chunk = chunk[~chunk.index.duplicated(keep="last")].sort_index()
+        if chunk.empty:
+            continue
+        last_ts = chunk.index[-1]
+
+        hourly.update(chunk)
+        for col, tracker in trackers.items():
+            values = chunk[col].dropna()
+            tracker.update(values.index.to_numpy(), values.to_numpy(dtype=float))
+        rows += len(chunk)
+        chunks += 1
+
+    return StreamResult(rows, chunks, hourly.result(), {col: t.intervals() for col, t in trackers.items()})
@@ -0,0 +1,322 @@
+"""
+Persistent on-disk tier of the dataset cache.
+
+Parsed datasets and derived aggregates survive restarts as Parquet (frames, series) and NumPy (arrays) files under
+DISK_CACHE_DIR, one folder per entry with a meta.json describing how to rebuild the value. An entry is keyed by the
+memory cache key, the content hashes of its source files and the code version - a hash of the modules computing the
+entries and the library versions - so a changed file or a deploy with changed analytics code never reads a stale
+entry. Entries computed faster than DISK_MIN_COMPUTE_MS are not written, reading them back would not be faster, and
+neither are entries of files changed within DISK_SETTLE_SEC - files receiving appended readings change too often.
+Once the folder grows past DISK_CACHE_MB the least recently read entries are removed.
+
+Several processes (the app, report workers) can share the folder: entries are written to a temporary folder and
+renamed into place.
+"""
+import glob
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DISK_CACHE_DIR = os.environ.get("DASHBOARD_DISK_CACHE_DIR", os.path.join(".cache", "derived"))
+DISK_CACHE_ENABLED = os.environ.get("DASHBOARD_DISK_CACHE", "1") == "1"
+DISK_CACHE_MB = float(os.environ.get("DASHBOARD_DISK_CACHE_MB", 2048))
+DISK_MIN_COMPUTE_MS = float(os.environ.get("DASHBOARD_DISK_MIN_MS", 20))
+# sources changed less than this many seconds ago are still being written (live ingestion), their entries stay in memory
+DISK_SETTLE_SEC = float(os.environ.get("DASHBOARD_DISK_SETTLE", 60))
+# modules whose code computes the cached values, relative to the repository
+CODE_FILES = ("cache.py", "disk_cache.py", "loaders.py", "chunked.py", "ingest.py", "analytics/*.py")
+HASH_CHUNK = 1 << 20
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def code_version() -> str:
+    """ Hash of the modules computing the cached values and of the versions of the libraries they use """
+    if os.environ.get("DASHBOARD_CODE_VERSION"):
+        return os.environ["DASHBOARD_CODE_VERSION"]
+    h = hashlib.blake2b(digest_size=16)
+    for pattern in CODE_FILES:
+        for path in sorted(glob.glob(os.path.join(_ROOT, pattern))):
+            h.update(os.path.relpath(path, _ROOT).encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+    h.update(f"{np.__version__} {pd.__version__} {pa.__version__}".encode())
+    return h.hexdigest()
+
+
+_hashes = {}  # path -> (file signature, content hash)
+_hashes_lock = threading.Lock()
+
+
+def content_hash(path: str, signature) -> str | None:
+    """ Hash of a file's content, recomputed only when its (mtime, size) signature changes """
+    if signature is None:
+        return None
+    with _hashes_lock:
+        known = _hashes.get(path)
+    if known is not None and known[0] == signature:
+        return known[1]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _hashes_lock:
+        _hashes[path] = (signature, digest)
+    return digest
+
+
+def stable_key(key) -> bool:
+    """ Keys made of plain values have the same repr in every process and can name a disk entry """
+    if isinstance(key, (tuple, list)):
+        return all(stable_key(k) for k in key)
+    return key is None or isinstance(key, (str, int, float, bool))
+
+
+#######################################################################################################
+# Values <-> files. A value is described by a JSON tree, frames / series / arrays are files next to it
+#######################################################################################################
+def _plain(value) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def _encode(value, folder: str, files: list) -> dict:
+    def path(ext):
+        name = f"{len(files)}.{ext}"
+        files.append(name)
+        return os.path.join(folder, name)
+
+    if isinstance(value, pd.DataFrame) and not isinstance(value.columns, pd.MultiIndex) \
+            and all(_plain(c) for c in value.columns) and value.columns.is_unique:
+        # Parquet needs string column names, the labels (e.g. years) are kept in the description
+        frame = value.set_axis([f"c{i}" for i in range(value.shape[1])], axis=1)
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=True), path("parquet"), compression="zstd")
+        freq = getattr(value.index, "freqstr", None)
+        return {"type": "frame", "file": files[-1], "columns": list(value.columns), "freq": freq,
+                "columns_name": value.columns.name if _plain(value.columns.name) else None,
+                "columns_dtype": str(value.columns.dtype)}
+    if isinstance(value, pd.Series) and _plain(value.name):
+        desc = _encode(value.to_frame(), folder, files)
+        return {"type": "series", "frame": desc, "name": value.name}
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        np.save(path("npy"), value, allow_pickle=False)
+        return {"type": "ndarray", "file": files[-1]}
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        cls = type(value)
+        return {"type": "namedtuple", "class": f"{cls.__module__}:{cls.__qualname__}",
+                "fields": [_encode(v, folder, files) for v in value]}
+    if isinstance(value, (tuple, list)):
+        return {"type": type(value).__name__, "items": [_encode(v, folder, files) for v in value]}
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {"type": "dict", "items": {k: _encode(v, folder, files) for k, v in value.items()}}
+    if isinstance(value, np.generic) and _plain(value.item()):
+        return {"type": "scalar", "dtype": value.dtype.str, "value": value.item()}
+    if _plain(value):
+        return {"type": "value", "value": value}
+    # anything else (timedeltas, object arrays, ...) is pickled
+    with open(path("pkl"), "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"type": "pickle", "file": files[-1]}
+
+
+def _decode(desc: dict, folder: str):
+    kind = desc["type"]
+    if kind == "frame":
+        df = pq.read_table(os.path.join(folder, desc["file"]), memory_map=True).to_pandas()
+        df.columns = pd.Index(desc["columns"], dtype=desc["columns_dtype"], name=desc["columns_name"])
+        if desc["freq"]:
+            df.index.freq = desc["freq"]
+        return df
+    if kind == "series":
+        df = _decode(desc["frame"], folder)
+        return df.iloc[:, 0].rename(desc["name"])
+    if kind == "ndarray":
+        return np.load(os.path.join(folder, desc["file"]), allow_pickle=False)
+    if kind == "namedtuple":
+        module, qualname = desc["class"].split(":")
+        cls = importlib.import_module(module)
+        for part in qualname.split("."):
+            cls = getattr(cls, part)
+        return cls(*(_decode(d, folder) for d in desc["fields"]))
+    if kind in ("tuple", "list"):
+        items = [_decode(d, folder) for d in desc["items"]]
+        return tuple(items) if kind == "tuple" else items
+    if kind == "dict":
+        return {k: _decode(d, folder) for k, d in desc["items"].items()}
+    if kind == "scalar":
+        return np.dtype(desc["dtype"]).type(desc["value"])
+    if kind == "value":
+        return desc["value"]
+    with open(os.path.join(folder, desc["file"]), "rb") as f:
+        return pickle.load(f)
+
+
+def _folder_size(folder: str) -> int:
+    return sum(e.stat().st_size for e in os.scandir(folder) if e.is_file())
+
+
+class DiskCache:
+    """ Entries on disk keyed by (memory cache key, source content hashes, code version) """
+    def __init__(self, root: str = DISK_CACHE_DIR, max_bytes: float = DISK_CACHE_MB * 1e6,
+                 min_compute_sec: float = DISK_MIN_COMPUTE_MS / 1000, version: str | None = None):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.min_compute_sec = min_compute_sec
+        self.version = version or code_version()
+        self._lock = threading.Lock()
+        self._used = None  # bytes on disk, scanned on first write
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def entry_id(self, key, sources, signatures) -> str | None:
+        if not stable_key(key):
+            return None
+        settled = time.time_ns() - DISK_SETTLE_SEC * 1e9
+        if any(sig is not None and sig[0] > settled for sig in signatures):
+            return None
+        hashes = [content_hash(p, s) for p, s in zip(sources, signatures)]
+        ident = repr((key, [os.path.basename(p) for p in sources], hashes, self.version))
+        return hashlib.blake2b(ident.encode(), digest_size=20).hexdigest()
+
+    def _folder(self, entry_id: str) -> str:
+        return os.path.join(self.root, entry_id[:2], entry_id)
+
+    def get(self, entry_id: str):
+        """ (True, value) of a stored entry, (False, None) if there is none """
+        folder = self._folder(entry_id)
+        meta_path = os.path.join(folder, "meta.json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            value = _decode(meta["value"], folder)
+            os.utime(meta_path)  # last read time, for the eviction
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False, None
+        except Exception:
+            # unreadable entry (partly evicted by another process, incompatible files) - compute it again
+            with self._lock:
+                self.errors += 1
+                self.misses += 1
+            shutil.rmtree(folder, ignore_errors=True)
+            return False, None
+        with self._lock:
+            self.hits += 1
+        return True, value
+
+    def put(self, entry_id: str, value, key, compute_sec: float):
+        if compute_sec < self.min_compute_sec:
+            return
+        folder = self._folder(entry_id)
+        tmp = f"{folder}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            files = []
+            meta = {"key": repr(key), "value": _encode(value, tmp, files), "files": files,
+                    "compute_sec": compute_sec, "created": time.time(), "version": self.version}
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            size = _folder_size(tmp)
+            try:
+                os.rename(tmp, folder)
+            except OSError:  # written meanwhile by another process
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        with self._lock:
+            self.writes += 1
+            if self._used is not None:
+                self._used += size
+        if self.used_bytes() > self.max_bytes:
+            self.evict()
+
+    def _entries(self) -> list:
+        """ (last read time, size, folder) of every entry """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp") or not entry.is_dir():
+                    continue
+                try:
+                    mtime = os.stat(os.path.join(entry.path, "meta.json")).st_mtime
+                    entries.append((mtime, _folder_size(entry.path), entry.path))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def used_bytes(self) -> int:
+        with self._lock:
+            if self._used is None:
+                self._used = sum(size for _, size, _ in self._entries())
+            return self._used
+
+    def evict(self, target: float = 0.9):
+        """ Remove the least recently read entries until the folder is below target * max_bytes """
+        entries = sorted(self._entries())
+        used = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, folder in entries:
+            if used <= target * self.max_bytes:
+                break
+            shutil.rmtree(folder, ignore_errors=True)
+            used -= size
+            removed += 1
+        with self._lock:
+            self._used = used
+            self.evictions += removed
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        with self._lock:
+            self._used = 0
+
+    def stats(self) -> dict:
+        used = self.used_bytes()
+        with self._lock:
+            return {"disk_hits": self.hits, "disk_misses": self.misses, "disk_writes": self.writes,
+                    "disk_evictions": self.evictions, "disk_errors": self.errors,
+                    "disk_mb": used / 1e6, "disk_budget_mb": self.max_bytes / 1e6}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Size and cleanup of the persistent cache")
+    parser.add_argument("--clear", action="store_true", help="remove every entry")
+    parser.add_argument("--evict", action="store_true", help="shrink the cache below its size limit")
+    args = parser.parse_args()
+
+    disk = DiskCache()
+    if args.clear:
+        disk.clear()
+    elif args.evict:
+        disk.evict()
+    entries = disk._entries()
+    print(f"{DISK_CACHE_DIR}: {len(entries)} entries, {sum(s for _, s, _ in entries) / 1e6:.1f} MB "
+          f"(limit {DISK_CACHE_MB:.0f} MB), code version {disk.version}")
+
+
+if __name__ == "__main__":
+    main()
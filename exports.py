@@ -0,0 +1,152 @@
+"""
+Streaming exports of windowed sensor data.
+
+An export is written chunk by chunk to a file under static/exports - gzip compressed CSV or Parquet (one row group
+per chunk) - so neither the whole table nor the whole file is held in memory. The file is then downloaded through
+Streamlit static file serving, which streams it from disk. Files are keyed by the export parameters and the
+signatures of the source files, a repeated export of unchanged data reuses the file, and files older than
+EXPORT_TTL_SEC are removed.
+
+    frames = exports.window_chunks(df, start, end)
+    path = exports.export_file(("raw_data", start, end), frames, "CSV (gzip)", sources=[...])
+"""
+import gzip
+import hashlib
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+import assets
+import instrumentation
+from cache import file_signature
+
+EXPORTS_DIR = os.path.join(assets.STATIC_DIR, "exports")
+EXPORT_CHUNK_ROWS = int(os.environ.get("DASHBOARD_EXPORT_CHUNK_ROWS", 50_000))
+EXPORT_TTL_SEC = float(os.environ.get("DASHBOARD_EXPORT_TTL", 3600))
+# Streamlit static file serving answers 404 for larger files (MAX_APP_STATIC_FILE_SIZE)
+STATIC_MAX_BYTES = 200 * 1024 * 1024
+# label -> (file extension, mime type)
+FORMATS = {
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def window_chunks(df: pd.DataFrame, start=None, end=None, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """ Row slices (views) of a time-indexed frame between start (inclusive) and end (exclusive) """
+    lo = 0 if start is None else df.index.searchsorted(pd.Timestamp(start), side="left")
+    hi = len(df) if end is None else df.index.searchsorted(pd.Timestamp(end), side="left")
+    for i in range(lo, hi, chunk_rows):
+        yield df.iloc[i:min(i + chunk_rows, hi)]
+
+
+def long_chunks(series: dict[str, pd.Series], start=None, end=None, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """ Readings of several independently timestamped series as timestamp / sensor / value rows, sensor by sensor """
+    for name, ser in series.items():
+        for chunk in window_chunks(ser.to_frame("value"), start, end, chunk_rows):
+            yield pd.DataFrame({"sensor": name, "value": chunk["value"].to_numpy()},
+                               index=chunk.index.rename("timestamp"))
+
+
+def write_csv_gz(frames, f) -> int:
+    """ Gzip compressed CSV of the chunks (header from the first one), returns the number of rows """
+    rows = 0
+    with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6) as gz:
+        for chunk in frames:
+            gz.write(chunk.to_csv(header=rows == 0).encode("utf-8"))
+            rows += len(chunk)
+    return rows
+
+
+def write_parquet(frames, f) -> int:
+    """ Parquet file with one row group per chunk, returns the number of rows """
+    rows = 0
+    writer = None
+    try:
+        for chunk in frames:
+            table = pa.Table.from_pandas(chunk, preserve_index=True)
+            if writer is None:
+                writer = pq.ParquetWriter(f, table.schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+WRITERS = {"CSV (gzip)": write_csv_gz, "Parquet": write_parquet}
+
+
+def _remove_expired(now: float):
+    if not os.path.isdir(EXPORTS_DIR):
+        return
+    for name in os.listdir(EXPORTS_DIR):
+        path = os.path.join(EXPORTS_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > EXPORT_TTL_SEC:
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # removed by another session
+
+
+def export_file(spec: tuple, frames, fmt: str, sources=()) -> str:
+    """
+    Write the chunks to an export file and return its path. `spec` describes the export (dataset, window, ...)
+    and together with the source file signatures names the file, an existing file of the same export is reused.
+    """
+    ext, _ = FORMATS[fmt]
+    key = repr((spec, fmt, [file_signature(p) for p in sources]))
+    name = f"{spec[0]}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.{ext}"
+    path = os.path.join(EXPORTS_DIR, name)
+
+    now = time.time()
+    _remove_expired(now)
+    if os.path.exists(path):
+        os.utime(path)  # keep a reused export alive
+        return path
+
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        WRITERS[fmt](frames, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def static_url(path: str) -> str:
+    rel = os.path.relpath(path, assets.STATIC_DIR)
+    return f"{assets.STATIC_URL}/{rel.replace(os.sep, '/')}"
+
+
+def export_controls(name: str, spec: tuple, make_frames, sources=()):
+    """
+    Format selector and a button writing the export, followed by the download link of the last export of
+    the current spec. `make_frames()` returns the chunk iterator, it is only called when the button is pressed.
+    """
+    col1, col2, sp = st.columns([1, 1, 2])
+    with col1:
+        fmt = st.selectbox("Export format", list(FORMATS), key=f"{name}_export_format")
+    with col2:
+        st.write("")
+        prepare = st.button("Prepare export", key=f"{name}_export")
+    spec = tuple(spec) + (fmt,)
+    if prepare:
+        with instrumentation.timer(f"export {name}"):
+            st.session_state[f"{name}_export_file"] = (spec, export_file(spec, make_frames(), fmt, sources))
+
+    last_spec, path = st.session_state.get(f"{name}_export_file", (None, None))
+    if last_spec == spec and path and os.path.exists(path):
+        ext, _ = FORMATS[fmt]
+        size = os.path.getsize(path)
+        size_mb = size / 1e6
+        if size > STATIC_MAX_BYTES:
+            st.warning(f"The export is {size_mb:.0f} MB, above the {STATIC_MAX_BYTES / 1e6:.0f} MB the app can serve. "
+                       "Select a shorter window or the Parquet format.")
+            return
+        st.markdown(f'<a href="{static_url(path)}" download="{name}.{ext}">Download {name}.{ext}</a> '
+                    f"({size_mb:.1f} MB)", unsafe_allow_html=True)
@@ -0,0 +1,97 @@
+"""
+Fleet summary - the KPIs of every site for the comparison page.
+
+Sites are computed in parallel worker processes (parsing and aggregating the datasets is CPU bound), results are
+kept per site together with the data version they were computed from - the signatures of the site's dataset files -
+so only sites whose files changed are recomputed.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import cache
+import loaders
+import sites
+from analytics import fleet
+
+FLEET_WORKERS = int(os.environ.get("DASHBOARD_FLEET_WORKERS", min(4, os.cpu_count() or 1)))
+DATASETS = ("system_flow", "storage", "backwash", "pump_curves")
+# dataset -> KPIs of its file
+DATASET_KPIS = {
+    "system_flow": lambda path: fleet.consumption_kpis(
+        loaders.read_sensor_csv(path).resample("60min").mean()[loaders.DEMAND_COL]),
+    "storage": lambda path: fleet.storage_kpis(loaders.read_storage_levels(path)),
+    "backwash": lambda path: fleet.backwash_kpis(loaders.read_backwash(path)),
+    "pump_curves": lambda path: fleet.pump_kpis(loaders.hourly_pump_points(loaders.read_pump_curves(path))),
+}
+
+logger = logging.getLogger("fleet_summary")
+
+_results = {}  # site name -> (data version, kpis)
+_results_lock = threading.Lock()
+_compute_lock = threading.Lock()
+_pool = None
+
+
+def data_version(site: sites.Site) -> tuple:
+    return tuple(cache.file_signature(site.path(d)) for d in DATASETS)
+
+
+def compute_site_kpis(files: dict) -> dict:
+    """
+    KPIs of one site from its dataset files, missing datasets leave their KPIs empty. A dataset that fails (malformed
+    file, ...) is logged and leaves its KPIs empty too, its error is in "error". Runs in the workers
+    """
+    kpis, errors = {}, []
+    for dataset, compute in DATASET_KPIS.items():
+        if not os.path.exists(files[dataset]):
+            continue
+        try:
+            kpis.update(compute(files[dataset]))
+        except Exception as e:
+            logger.exception("fleet KPIs of %s failed", files[dataset])
+            errors.append(f"{dataset}: {type(e).__name__}: {e}")
+    if errors:
+        kpis["error"] = "; ".join(errors)
+    return kpis
+
+
+def _executor() -> ProcessPoolExecutor:
+    # spawned rather than forked workers - the app process runs threads (Streamlit, file watcher)
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=FLEET_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _stale(site_list, versions) -> list:
+    with _results_lock:
+        return [s for s in site_list if s.name not in _results or _results[s.name][0] != versions[s.name]]
+
+
+def fleet_kpis(site_list=None) -> pd.DataFrame:
+    """ KPI table of the sites (all registered sites by default), one row per site """
+    site_list = list(sites.all_sites().values()) if site_list is None else site_list
+    versions = {s.name: data_version(s) for s in site_list}
+
+    if _stale(site_list, versions):
+        # a session waits for another session's computation instead of repeating it
+        with _compute_lock:
+            stale = _stale(site_list, versions)
+            files = [dict(s.files) for s in stale]
+            if len(stale) > 1 and FLEET_WORKERS > 1:
+                results = list(_executor().map(compute_site_kpis, files))
+            else:
+                results = [compute_site_kpis(f) for f in files]
+            with _results_lock:
+                for site, kpis in zip(stale, results):
+                    _results[site.name] = (versions[site.name], kpis)
+
+    with _results_lock:
+        rows = {s.name: _results[s.name][1] for s in site_list}
+    columns = fleet.KPI_COLUMNS + (["error"] if any("error" in kpis for kpis in rows.values()) else [])
+    return pd.DataFrame.from_dict(rows, orient="index").reindex(columns=columns)
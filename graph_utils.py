@@ -1,5 +1,7 @@
+import calendar
 import os
 import sys
+import numpy as np
 import pandas as pd
 
 from typing import List
@@ -8,6 +10,7 @@ from plotly.subplots import make_subplots
 import plotly.express as px
 
 import utils
+from analytics import pumps, system_flow
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -21,6 +24,20 @@ COLORS = (["#0F6CB3", "#48ad90", "#6fcfec", "#f3ebb8", "#ade0a3", "#e7d18f", "#7
           )
 
 BAR_COLORS = [COLORS[0], COLORS[1], COLORS[2], COLORS[3]]
+ORANGE = "#bf5700"
+GREY = "#c8cacc"
+
+
+def time_x(index: pd.DatetimeIndex) -> dict:
+    """
+    x of a trace over a time index in its most compact form: x0 / dx (ms) for an evenly spaced index, so no x
+    values are sent at all, else the epoch milliseconds as a typed array. The x axis must be of type "date".
+    """
+    ns = index.asi8
+    step = np.diff(ns)
+    if len(step) and step[0] > 0 and (step == step[0]).all():
+        return dict(x0=index[0], dx=step[0] / 1e6)
+    return dict(x=ns / 1e6)
 
 
 def plot_time_series(
@@ -40,6 +57,9 @@ def plot_time_series(
     else:
         cols = data.columns.tolist()
 
+    line_kw = line_kw or {}
+    x = time_x(data.index)  # shared by the traces
+
     if same_color:
         plot_colors = [COLORS[0] for _ in cols]
     else:
@@ -48,8 +68,8 @@ def plot_time_series(
     if len(cols) > 1:
         fig = make_subplots(rows=len(cols), cols=1, shared_xaxes=sharex, vertical_spacing=vertical_spacing)
         for i, col in enumerate(cols, start=1):
-            fig.add_trace(go.Scatter(x=data.index, y=data[col], name=col, line=dict(color=plot_colors[i-1]), **line_kw),
-                          row=i, col=1)
+            fig.add_trace(go.Scatter(**x, y=data[col].to_numpy(dtype=np.float32), name=col,
+                                     line=dict(color=plot_colors[i-1]), **line_kw), row=i, col=1)
             fig.update_yaxes(title=col, secondary_y=False, row=i, col=1)
         fig.update_layout(height=height_single * len(cols))
         # fig.update_xaxes(rangeslider={'visible': False, "bordercolor": "black", "borderwidth": 1},
@@ -58,7 +78,8 @@ def plot_time_series(
     else:
         fig = make_subplots(rows=1, cols=1, shared_xaxes=sharex, vertical_spacing=vertical_spacing)
         for i, col in enumerate(cols):
-            fig.add_trace(go.Scatter(x=data.index, y=data[col], zorder=5, line=dict(color=plot_colors[0]), **line_kw))
+            fig.add_trace(go.Scatter(**x, y=data[col].to_numpy(dtype=np.float32), zorder=5,
+                                     line=dict(color=plot_colors[0]), **line_kw))
             fig.update_yaxes(title=col, secondary_y=False, row=1, col=1)
         fig.update_layout(height=height_single * 2.5)
         if range_slider:
@@ -66,8 +87,468 @@ def plot_time_series(
                              row=len(cols), col=1, rangeslider_thickness=0.18)
 
     fig.update_layout(showlegend=False, margin=dict(r=50, l=50))
+    fig.update_xaxes(type="date")
+    fig.update_xaxes(tickfont=dict(size=utils.GRAPHS_FONT_SIZE))
+    fig.update_yaxes(tickfont=dict(size=utils.GRAPHS_FONT_SIZE))
+    fig.update_xaxes(title_font=dict(size=utils.GRAPHS_FONT_SIZE))
+    fig.update_yaxes(title_font=dict(size=utils.GRAPHS_FONT_SIZE))
+    return fig
+
+
+def _apply_font_sizes(fig):
     fig.update_xaxes(tickfont=dict(size=utils.GRAPHS_FONT_SIZE))
     fig.update_yaxes(tickfont=dict(size=utils.GRAPHS_FONT_SIZE))
     fig.update_xaxes(title_font=dict(size=utils.GRAPHS_FONT_SIZE))
     fig.update_yaxes(title_font=dict(size=utils.GRAPHS_FONT_SIZE))
     return fig
+
+
+PROFILE_AXIS_TITLES = {
+    "Weekly": "Hour of week (0–167)",
+    "Monthly": "Hour of month (0–744)",
+    "Annually": "Hour of year (0–8759)",
+}
+
+
+def hourly_profiles_figure(profiles: dict, freq_label: str):
+    """ Overlay the aligned hourly profiles of the selected periods, keyed by period option """
+    fig = go.Figure()
+    for i, (p, hourly_ser) in enumerate(profiles.items()):
+        trace_kw = {}
+        if freq_label != "Daily":
+            trace_kw["hovertemplate"] = '(%{x:.1f}, %{y:.1f})<br>%{fullData.name}<extra></extra>'
+        fig.add_trace(
+            go.Scatter(
+                x0=0, dx=1,  # hours since the start of the period
+                y=hourly_ser.to_numpy(dtype=np.float32),
+                mode="lines",
+                line=dict(color=COLORS[i % len(COLORS)]),
+                name=system_flow.period_label(freq_label, p),
+                **trace_kw
+            )
+        )
+
+    if freq_label in PROFILE_AXIS_TITLES:
+        fig.update_xaxes(title=PROFILE_AXIS_TITLES[freq_label])
+    fig.update_layout(
+        yaxis_title="Consumption (GPM)",
+        yaxis=dict(tickformat=",.0f"),
+    )
+    _apply_font_sizes(fig)
+    fig.update_layout(margin=dict(t=5))
+    return fig
+
+
+def stats_table_figure(df: pd.DataFrame, col_width=120):
+    # Build header + cells
+    header_vals = ([df.index.name or "Period"] + list(df.columns))
+    cells_vals = [df.index.astype(str).to_numpy()] + [df[c].to_numpy() for c in df.columns]
+
+    fig = go.Figure(data=[go.Table(
+        columnwidth=[col_width] * len(header_vals),
+        header=dict(values=header_vals,
+                    align="center",
+                    font=dict(size=16, weight='bold'),
+                    height=36),
+        cells=dict(values=cells_vals,
+                   align="center",
+                   height=36,
+                   format=[None] + [",.2f"] * len(df.columns),
+                   font=dict(size=14))
+    )])
+    # Auto height: ~row_count * row_height + header
+    fig.update_layout(margin=dict(l=0, r=0, t=0, b=0),
+                      height=min(250, int((len(df) + 1) * 32 + 40))
+                      )
+    return fig
+
+
+def monthly_totals_figure(pivot_df: pd.DataFrame, coverage: pd.DataFrame | None = None, low_coverage: float = 0.8):
+    """
+    Grouped bars of the monthly totals (rows = months, columns = years).
+    With a coverage table of the same layout, the coverage is shown on hover and months below `low_coverage`
+    are drawn faded.
+    """
+    fig = go.Figure()
+    months = pivot_df.index
+    month_names = np.array([calendar.month_name[m] for m in months])
+    for i, year in enumerate(pivot_df.columns):
+        color = BAR_COLORS[i % len(BAR_COLORS)]
+
+        if coverage is not None:
+            cov = coverage.reindex(index=months, columns=[year]).iloc[:, 0].fillna(0.0).to_numpy()
+            customdata = np.round(cov * 100, 1)
+            opacity = np.where(cov < low_coverage, 0.35, 1.0)
+            hover = (
+                f"<span style='color:{color};'>"
+                "%{x} %{fullData.name}: %{y:,.0f} GPM<br>data coverage %{customdata}%"
+                "</span><extra></extra>"
+            )
+        else:
+            customdata = None
+            opacity = 1.0
+            hover = (
+                f"<span style='color:{color};'>"
+                "%{x} %{fullData.name}: %{y:,.0f} GPM"
+                "</span><extra></extra>"
+            )
+
+        fig.add_trace(
+            go.Bar(
+                x=month_names,
+                y=pivot_df[year].to_numpy(),
+                name=str(year),
+                customdata=customdata,
+                hovertemplate=hover,
+                marker=dict(
+                    color=color,
+                    opacity=opacity,
+                    line=dict(
+                        color="black",  # edge color
+                        width=1  # edge thickness
+                    )
+                )
+            )
+        )
+
+    # Update layout
+    fig.update_layout(
+        barmode="group",  # side-by-side grouped bars
+        yaxis_title="Monthly Consumption<br>(MG)",
+        yaxis=dict(tickformat=",.0f")
+    )
+    _apply_font_sizes(fig)
+    fig.update_layout(margin=dict(t=0))
+    return fig
+
+
+def add_shapes(fig, shapes: list):
+    """ Add many shapes in one layout update - every add_shape call revalidates all the shapes added before """
+    if shapes:
+        fig.update_layout(shapes=list(fig.layout.shapes) + shapes)
+    return fig
+
+
+def shade_intervals(fig, intervals: pd.DataFrame, row: int | None = None, max_shapes: int = 100):
+    """ Grey bands over the x0..x1 intervals (e.g. data gaps), only the `max_shapes` longest are drawn """
+    if intervals.empty:
+        return fig
+    longest = intervals.assign(length=intervals["x1"] - intervals["x0"]).nlargest(max_shapes, "length")
+    for x0, x1 in zip(longest["x0"], longest["x1"]):
+        fig.add_vrect(x0=x0, x1=x1, fillcolor=GREY, opacity=0.25, line_width=0, layer="below",
+                      row=row, col=1 if row is not None else None)
+    return fig
+
+
+def demand_forecast_figure(history: pd.Series, fc: pd.DataFrame):
+    """ Recent hourly demand and the forecast of the next hours (forecast.DemandForecaster.predict) with its band """
+    band = time_x(fc.index)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(**band, y=fc["upper"].to_numpy(dtype=np.float32), mode="lines", line_width=0,
+                             showlegend=False, hoverinfo="skip"))
+    fig.add_trace(go.Scatter(**band, y=fc["lower"].to_numpy(dtype=np.float32), mode="lines", line_width=0,
+                             fill="tonexty", fillcolor="rgba(191,87,0,0.15)", name="95% band", hoverinfo="skip"))
+    fig.add_trace(go.Scatter(**time_x(history.index), y=history.to_numpy(dtype=np.float32), mode="lines",
+                             line=dict(color=COLORS[0], width=1.6), name="Measured",
+                             hovertemplate="%{y:,.1f} GPM"))
+    fig.add_trace(go.Scatter(**band, y=fc["baseline"].to_numpy(dtype=np.float32), mode="lines",
+                             line=dict(color=GREY, width=1.4, dash="dot"), name="Weekday x hour average",
+                             hovertemplate="%{y:,.1f} GPM"))
+    fig.add_trace(go.Scatter(**band, y=fc["forecast"].to_numpy(dtype=np.float32), mode="lines",
+                             line=dict(color=ORANGE, width=2), name="Forecast",
+                             hovertemplate="%{y:,.1f} GPM"))
+    fig.update_xaxes(type="date")
+    fig.update_layout(
+        yaxis_title="Consumption (GPM)",
+        yaxis=dict(tickformat=",.0f"),
+        hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0),
+        margin=dict(t=30),
+    )
+    _apply_font_sizes(fig)
+    return fig
+
+
+def storage_level_figure(filtered_data: pd.DataFrame, threshold: float, violation_ranges: pd.DataFrame):
+    fig = plot_time_series(
+        data=filtered_data,
+        data_col_names=["water_level_ft"],
+        line_kw=dict(line_width=1.6))
+
+    fig.add_hline(
+        y=threshold,
+        line=dict(color="red", dash="dash"),
+        annotation_text=f"Critical ({threshold:.2f} ft)",
+        annotation_position="top left",
+        annotation_font_color="red",
+    )
+
+    add_shapes(fig, [dict(
+        type="rect",
+        x0=x0, x1=x1,
+        xref="x",
+        y0=0, y1=1,
+        yref="paper",  # 0–1 = full vertical span
+        fillcolor="white",  # translucent red
+        line_width=0,
+        opacity=0.2,
+        layer="below"
+    ) for x0, x1 in zip(violation_ranges["x0"], violation_ranges["x1"])])
+
+    fig.update_xaxes(
+        title_text="Time",
+        title_font_size=16,
+        tickfont_size=14,
+    )
+    fig.update_yaxes(
+        title_text="Water Level (ft)",
+        title_font_size=16,
+        tickfont_size=16,
+    )
+
+    fig.update_layout(
+        hovermode="x unified"
+    )
+    return _apply_font_sizes(fig)
+
+
+def _density_heatmap(counts: np.ndarray, edges: tuple[np.ndarray, np.ndarray], color: str, **trace_kw) -> go.Heatmap:
+    """
+    Heatmap of a Q-H histogram (counts[flow bin, head bin]) shaded from transparent to `color`, cropped to its
+    non-empty bins so the payload depends on the area covered, not the number of points
+    """
+    filled_x, filled_y = np.nonzero(counts)
+    x0, x1, y0, y1 = filled_x.min(), filled_x.max() + 1, filled_y.min(), filled_y.max() + 1
+    z = counts[x0:x1, y0:y1].T.astype(np.float32)
+    z[z == 0] = np.nan  # empty bins are left out of the colors and the hover
+    centers = [(e[1:] + e[:-1]) / 2 for e in edges]
+    r, g, b = px.colors.hex_to_rgb(color)
+    return go.Heatmap(
+        x=centers[0][x0:x1].astype(np.float32), y=centers[1][y0:y1].astype(np.float32), z=z,
+        colorscale=[[0, f"rgba({r},{g},{b},0.25)"], [1, f"rgb({r},{g},{b})"]], zmin=0,
+        showscale=False, hoverongaps=False,
+        hovertemplate="%{fullData.name}<br>%{x:.1f} GPM, %{y:.1f} ft<br>%{z:.0f} h<extra></extra>",
+        **trace_kw
+    )
+
+
+def pump_curves_figure(df: pd.DataFrame, dfv: pd.DataFrame, density: dict | None = None,
+                       edges: tuple[np.ndarray, np.ndarray] | None = None, fitted_curves: bool = False):
+    """
+    Left: Q-H operating points of each speed cluster in the selected window (dfv), or with `density`
+    (pumps.qh_density of dfv over `edges`) their 2-D histograms, optionally with the fitted curves of the clusters.
+    Right: first point of every month colored by cluster. `df` is the full series, used for a stable cluster order.
+    """
+    monthly_view = dfv.resample('ME').first()  # respects selected date window
+
+    fig = make_subplots(rows=1, cols=2, subplot_titles=("Pump Curve (Q-H)", "System Pressure (PSI)"),
+                        column_widths=[0.65, 0.35])
+    legend_items = pumps.LEGEND_ITEMS
+    for i, cl in enumerate(df["cluster"].unique()):
+        sub_all = df[df["cluster"] == cl]  # for legend item spanning full series
+        sub_view = dfv[dfv["cluster"] == cl]  # respects selected date window
+
+        ts_sub_view = monthly_view[monthly_view["cluster"] == cl]
+
+        if sub_all.empty:
+            continue
+
+        color = COLORS[i]
+        llegend_label = f"cluster-{legend_items[int(cl)]}"  # legend group name
+
+        # left: pump curve
+        if density is None:
+            fig.add_trace(
+                go.Scatter(
+                    x=sub_view["flow_gpm"], y=sub_view["pump_head_ft"],
+                    mode="markers",
+                    marker=dict(color=color, size=6, line=dict(width=0.2, color="DarkSlateGrey")),
+                    name=f"Cluster {legend_items[int(cl)]}",
+                    legendgroup=llegend_label,
+                    showlegend=False
+                ),
+                row=1, col=1
+            )
+        elif int(cl) in density:
+            fig.add_trace(_density_heatmap(density[int(cl)], edges, color, name=f"Cluster {legend_items[int(cl)]}",
+                                           legendgroup=llegend_label, showlegend=False),
+                          row=1, col=1)
+        if fitted_curves and not sub_view.empty:
+            flow = np.linspace(sub_view["flow_gpm"].min(), sub_view["flow_gpm"].max(), 25)
+            fig.add_trace(
+                go.Scatter(
+                    x=flow, y=pumps.fitted_head(int(cl), flow),
+                    mode="lines",
+                    line=dict(color=color, width=2, dash="dash"),
+                    name=f"Cluster {legend_items[int(cl)]} fitted curve",
+                    legendgroup=llegend_label,
+                    showlegend=False,
+                    hoverinfo="name"
+                ),
+                row=1, col=1
+            )
+
+        # Right: time series
+        fig.add_trace(
+            go.Scatter(
+                x=ts_sub_view["Date"], y=ts_sub_view["pressure_psi"],
+                mode="markers",
+                marker=dict(color=color, size=8, line=dict(width=0.2, color="DarkSlateGrey")),
+                name=f"Cluster {legend_items[int(cl)]}",
+                legendgroup=llegend_label,
+                showlegend=True,
+                legendrank=legend_items[int(cl)]
+            ),
+            row=1, col=2,
+        )
+
+    fig.update_xaxes(title_text="Flow Rate (GPM)", row=1, col=1)
+    fig.update_yaxes(title_text="Pump Head (ft)", row=1, col=1)
+
+    fig.update_xaxes(title_text="Date", row=1, col=2)
+    fig.update_yaxes(title_text="System Pressure (PSI)", row=1, col=2)
+
+    fig.update_layout(height=600)
+    fig.update_layout(
+        legend=dict(
+            orientation="h",  # Set legend orientation to horizontal
+            xanchor="center",  # Anchor the legend's horizontal position to its center
+            x=0.5,  # Position the legend horizontally at the center of the figure
+            y=-0.4  # Position the legend vertically below the plot area
+        )
+    )
+    fig.update_layout(margin=dict(l=10, r=10, t=50, b=1))
+
+    _apply_font_sizes(fig)
+    fig.update_annotations(font=dict(size=utils.GRAPHS_FONT_SIZE))
+    return fig
+
+
+def backwash_figure(event_pairs: pd.DataFrame, duration_pairs: pd.DataFrame):
+    """ Backwash process spans (grey, phase 1) and backwash events sized by volume (orange, phase 2) """
+    # For a neat y-axis limit
+    y_max = 1.0 * event_pairs["volume_ft3"].max()
+
+    fig = go.Figure()
+    span_start = duration_pairs.iloc[:, 0].to_numpy()
+    span_end = duration_pairs.iloc[:, 1].to_numpy()
+    start = event_pairs.iloc[:, 0].to_numpy()
+    end = event_pairs.iloc[:, 1].to_numpy()
+    vol = event_pairs["volume_ft3"].to_numpy(dtype=float)
+
+    # ---------------- Phase 1 : grey background spans ----------------------------
+    # the bands are shapes, one invisible marker per band carries their hover
+    fig.add_trace(
+        go.Scatter(
+            x=span_start, y=np.full(len(span_start), y_max),
+            mode="markers",
+            marker=dict(size=20, color="rgba(0,0,0,0)"),  # invisible
+            customdata=np.stack([span_start, span_end], axis=-1),
+            hovertemplate=(
+                f"<span style='color:{GREY};'>"
+                "<b>Phase 1 : Backwash Process Duration</b><br>"
+                "Start : %{customdata[0]|%Y-%m-%d %H:%M}<br>"
+                "End   : %{customdata[1]|%Y-%m-%d %H:%M}"
+                "</span>"
+                "<extra></extra>"
+
+            ),
+            showlegend=False,
+            name=""
+        )
+    )
+    shapes = [dict(type="rect", x0=s0, x1=s1, y0=0, y1=y_max, xref="x", yref="y", fillcolor=GREY, line_width=0,
+                   layer="below") for s0, s1 in zip(span_start, span_end)]
+
+    # ---------------- Phase 2 : orange rectangles --------------------------------
+    # 1) true-duration orange rectangles as shapes
+    shapes += [dict(type="rect", x0=s0, x1=s1, y0=0, y1=v, xref="x", yref="y", fillcolor=ORANGE, line_width=0,
+                    layer="below") for s0, s1, v in zip(start, end, vol)]
+    add_shapes(fig, shapes)
+
+    # 2) a visible vertical line at each event start (pixel-wide, easy to see), NaN breaks the segment between events
+    line_x = np.repeat(start, 3)
+    line_y = np.stack([np.zeros(len(vol)), vol, np.full(len(vol), np.nan)], axis=-1).ravel()
+
+    # 3) invisible hover markers at the midpoints (for nice tooltips)
+    hover_x = start + (end - start) / 2
+    hover_y = vol  # doesn’t matter much; we use customdata
+    hover_cd = event_pairs.to_numpy(dtype=object)  # start, end, volume
+
+    # trace for visible orange lines (no hover)
+    fig.add_trace(
+        go.Scatter(
+            x=line_x,
+            y=line_y,
+            mode="lines",
+            line=dict(color=ORANGE, width=2.5),
+            hoverinfo="skip",  # <– no hover from these, only for visual
+            showlegend=False,
+            name=""
+        )
+    )
+
+    # trace for hover only (invisible markers)
+    fig.add_trace(
+        go.Scatter(
+            x=hover_x,
+            y=hover_y,
+            mode="markers",
+            marker=dict(size=20, color="rgba(0,0,0,0)"),  # invisible
+            customdata=hover_cd,
+            hovertemplate=(
+                f"<span style='color:{ORANGE};'>"
+                "<b>Phase 2 : Backwash Event</b><br>"
+                "Start : %{customdata[0]|%Y-%m-%d %H:%M}<br>"
+                "End   : %{customdata[1]|%Y-%m-%d %H:%M}<br>"
+                "Volume: %{customdata[2]:.2f} m³"
+                "</span>"
+                "<extra></extra>"
+            ),
+            showlegend=False,
+            name=""
+        )
+    )
+
+    # ---------------- Dummy traces for legend icons ------------------------------
+    fig.add_trace(go.Scatter(
+        x=[None], y=[None],
+        mode="markers",
+        marker=dict(size=10, color=GREY),
+        name="Phase 1 : Backwash Process Duration"
+    ))
+    fig.add_trace(go.Scatter(
+        x=[None], y=[None],
+        mode="markers",
+        marker=dict(size=10, color=ORANGE),
+        name="Phase 2 : Backwash Event"
+    ))
+
+    fig.update_yaxes(
+    title_text="Backwash Volume (ft³)",
+    title_font_size=16,
+    range=[0, y_max],
+    tickfont_size=16,
+    )
+
+    fig.update_xaxes(
+    title_text="Date",
+    title_font_size=16,
+    tickfont_size=16,
+    )
+
+    fig.update_layout(
+    font=dict(size=16),
+    height=500,
+    legend=dict(
+        orientation="h",
+        yanchor="bottom", y=1.02,
+        xanchor="left", x=0,
+        font=dict(size=14)
+    ),
+    margin=dict(l=80, r=40, t=80, b=60),
+    hovermode="x",
+    yaxis=dict(showgrid=False)
+    )
+
+    return _apply_font_sizes(fig)
@@ -0,0 +1,307 @@
+"""
+Incremental ingestion of the raw sensor CSV files.
+
+New readings are appended to the files under `data/1_raw sensor data/`. Instead of re-reading a whole file after
+every change, the ingestion service keeps a byte offset per file, parses only the rows appended since the last
+read and appends them to an in-memory columnar store. The dependent aggregates - hourly means and monthly
+totals - are updated from the new rows only. The Storage page's below-threshold intervals depend on the window and
+threshold chosen on the page and are recomputed from its levels (storage.violation_intervals).
+
+A watchdog observer triggers the reads when files change, readers can also call `refresh` to catch up
+synchronously before using the data.
+"""
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+import sites
+from analytics.units import DERIVED_COLUMNS
+
+RAW_DIR = sites.ARCTIC_VILLAGE.raw_dir
+# use a polling observer where native file events are unreliable (network drives, some containers)
+USE_POLLING = os.environ.get("DASHBOARD_INGEST_POLLING") == "1"
+
+# a rewritten file is detected by a change of its first bytes (see TailReader)
+HEAD_BYTES = 4096
+
+
+class TailReader:
+    """ Reads the complete lines appended to a CSV file since the previous call """
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.header = None
+        self.size = 0
+        self.mtime = None
+        self.identity = None  # (device, inode) of the file read so far
+        self.head = b""  # its first HEAD_BYTES bytes (at most up to the offset)
+
+    def read_new(self) -> pd.DataFrame | None:
+        """
+        Parse the rows appended since the last call, None if nothing new.
+        Raises FileTruncated if the file was rewritten - it shrank, is another file (inode), its first bytes changed
+        or the read offset is no longer at the end of a line - and has to be reloaded from scratch.
+        """
+        stat = os.stat(self.path)
+        identity = (stat.st_dev, stat.st_ino)
+        if stat.st_size < self.size or (self.identity is not None and identity != self.identity):
+            raise FileTruncated(self.path)
+        if stat.st_size == self.offset and stat.st_mtime_ns == self.mtime:
+            return None
+
+        with open(self.path, "rb") as f:
+            if self.offset:
+                # a re-export of the same or a larger size, written in place
+                if f.read(len(self.head)) != self.head:
+                    raise FileTruncated(self.path)
+                f.seek(self.offset - 1)
+                if f.read(1) != b"\n":
+                    raise FileTruncated(self.path)
+            f.seek(self.offset)
+            chunk = f.read(stat.st_size - self.offset)
+            if len(self.head) < HEAD_BYTES:
+                f.seek(0)
+                head = f.read(HEAD_BYTES)
+        self.size, self.mtime, self.identity = stat.st_size, stat.st_mtime_ns, identity
+
+        # only complete lines - a row that is still being written is picked up by the next read
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return None
+        chunk = chunk[:end + 1]
+        self.offset += len(chunk)
+        if len(self.head) < HEAD_BYTES:
+            self.head = head[:self.offset]
+
+        if self.header is None:
+            header_end = chunk.find(b"\n") + 1
+            self.header, chunk = chunk[:header_end], chunk[header_end:]
+        if not chunk.strip():
+            return None
+
+        df = pd.read_csv(io.BytesIO(self.header + chunk), index_col=0)
+        df.index = pd.to_datetime(df.index)
+        return df
+
+
+class FileTruncated(Exception):
+    pass
+
+
+class SensorSeries:
+    """
+    Columnar in-memory store of one sensor file with incrementally maintained aggregates.
+    Columns are float32 NumPy arrays grown by doubling, so appends are amortized O(rows appended).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.version = 0
+        self.listeners = []  # called with the appended rows, with None when the file was rewritten
+        self._reset()
+
+    def _reset(self):
+        self.reader = TailReader(self.path)
+        self.n = 0
+        self.ts = np.empty(0, dtype="datetime64[ns]")
+        self.columns = {}
+        self.index_name = None
+        # hourly sums / counts per column, kept as a list of blocks that is compacted when read
+        self._sum_blocks = []
+        self._count_blocks = []
+        # total of the hourly means per month (x60 gives gallons for GPM columns), rows are monthly periods
+        self.monthly_hourly_sum = pd.DataFrame()
+        self._frame = None
+        self._hourly = None
+
+    def refresh(self) -> int:
+        """ Ingest the rows appended since the last refresh, returns the number of new rows """
+        with self.lock:
+            if not os.path.exists(self.path):
+                return 0
+            try:
+                df = self.reader.read_new()
+            except FileTruncated:
+                self._reset()
+                for listener in self.listeners:
+                    listener(None)
+                df = self.reader.read_new()
+            if df is None or df.empty:
+                return 0
+            return self.append(df)
+
+    def subscribe(self, listener) -> None:
+        """
+        Call `listener` with the rows ingested so far and then with every block of appended rows, in order
+        (listeners run under the series lock and must not wait for readers of the series)
+        """
+        with self.lock:
+            self.listeners.append(listener)
+            if self.n:
+                listener(self.frame())
+
+    def append(self, df: pd.DataFrame) -> int:
+        with self.lock:
+            if self.n:
+                # the store is append-only - drop re-exported or out of order rows
+                df = df[df.index > self.ts[self.n - 1]]
+            df = df[~df.index.duplicated(keep="last")].sort_index()
+            df = df.drop(columns=[c for c in df.columns if c in DERIVED_COLUMNS])  # derived on demand
+            if df.empty:
+                return 0
+            self.index_name = df.index.name
+            self._append_arrays(df)
+            self._update_aggregates(df)
+            self.version += 1
+            self._frame = None
+            self._hourly = None
+            for listener in self.listeners:
+                listener(df)
+            return len(df)
+
+    def _append_arrays(self, df: pd.DataFrame):
+        k = len(df)
+        if self.n + k > len(self.ts):
+            capacity = max(1024, 2 * (self.n + k))
+            self.ts = np.resize(self.ts, capacity)
+            for col in self.columns:
+                self.columns[col] = np.resize(self.columns[col], capacity)
+        self.ts[self.n:self.n + k] = df.index.to_numpy(dtype="datetime64[ns]")
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns[col] = np.full(len(self.ts), np.nan, dtype=np.float32)
+            self.columns[col][self.n:self.n + k] = df[col].to_numpy(dtype=np.float32)
+        self.n += k
+
+    def _update_aggregates(self, df: pd.DataFrame):
+        values = df.astype(float)
+        hours = values.index.floor("h")
+        new_sum = values.groupby(hours).sum(min_count=1)
+        new_count = values.groupby(hours).count()
+
+        old_means = pd.DataFrame(columns=new_sum.columns, dtype=float)
+        if self._sum_blocks and new_sum.index[0] == self._sum_blocks[-1].index[-1]:
+            # rows are appended in time order, so only the last (partially filled) hour can be continued
+            last_sum, last_count = self._sum_blocks[-1], self._count_blocks[-1]
+            old_means = last_sum.iloc[-1:] / last_count.iloc[-1:].replace(0, np.nan)
+            new_sum = pd.concat([last_sum.iloc[-1:].add(new_sum.iloc[:1], fill_value=0), new_sum.iloc[1:]])
+            new_count = pd.concat([last_count.iloc[-1:].add(new_count.iloc[:1], fill_value=0), new_count.iloc[1:]])
+            self._sum_blocks[-1], self._count_blocks[-1] = last_sum.iloc[:-1], last_count.iloc[:-1]
+        self._sum_blocks.append(new_sum)
+        self._count_blocks.append(new_count)
+
+        # the monthly totals change by the difference of the hourly means of the touched hours
+        new_means = new_sum / new_count.replace(0, np.nan)
+        delta = new_means.sub(old_means.reindex(index=new_means.index, columns=new_means.columns), fill_value=0.0)
+        delta_monthly = delta.fillna(0.0).groupby(delta.index.to_period("M")).sum()
+        self.monthly_hourly_sum = delta_monthly.add(self.monthly_hourly_sum, fill_value=0.0) \
+            if len(self.monthly_hourly_sum) else delta_monthly
+
+    def frame(self) -> pd.DataFrame:
+        """ All readings as a frame (shared - do not modify) """
+        with self.lock:
+            if self._frame is None:
+                index = pd.DatetimeIndex(self.ts[:self.n], name=self.index_name)
+                self._frame = pd.DataFrame({c: v[:self.n] for c, v in self.columns.items()}, index=index)
+            return self._frame
+
+    def hourly(self) -> pd.DataFrame:
+        """ Hourly means on a regular hourly index, same as frame().resample("60min").mean() """
+        with self.lock:
+            if self._hourly is None:
+                if len(self._sum_blocks) > 1:
+                    self._sum_blocks = [pd.concat(self._sum_blocks)]
+                    self._count_blocks = [pd.concat(self._count_blocks)]
+                if not self._sum_blocks:
+                    return pd.DataFrame()
+                means = self._sum_blocks[0] / self._count_blocks[0].replace(0, np.nan)
+                full = pd.date_range(means.index[0], means.index[-1], freq="60min", name=self.index_name)
+                self._hourly = means.reindex(full)
+            return self._hourly
+
+    def monthly_totals(self, col: str) -> pd.DataFrame:
+        """ Monthly totals of a per-minute rate column (e.g. GPM -> gallons), rows = months, columns = years """
+        with self.lock:
+            totals = self.monthly_hourly_sum[col] * 60.0
+            df = pd.DataFrame({"month": totals.index.month, "year": totals.index.year, "total": totals.to_numpy()})
+            return df.pivot(index="month", columns="year", values="total")
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, service):
+        self.service = service
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.service.refresh(event.src_path)
+
+    on_created = on_modified
+
+
+class IngestionService:
+    """ Watches the raw data folder and keeps a SensorSeries per CSV file up to date """
+    def __init__(self, data_dir: str = RAW_DIR):
+        self.data_dir = data_dir
+        self.series = {}
+        self._lock = threading.Lock()
+        self._observer = None
+
+    def _key(self, path: str) -> str:
+        return os.path.normpath(os.path.abspath(path))
+
+    def tracks(self, path: str) -> bool:
+        return os.path.dirname(self._key(path)) == self._key(self.data_dir) and path.endswith(".csv")
+
+    def get(self, path: str) -> SensorSeries:
+        key = self._key(path)
+        with self._lock:
+            if key not in self.series:
+                self.series[key] = SensorSeries(path)
+        return self.series[key]
+
+    def refresh(self, path: str) -> int:
+        if not self.tracks(path):
+            return 0
+        return self.get(path).refresh()
+
+    def start(self):
+        for name in sorted(os.listdir(self.data_dir)):
+            self.refresh(os.path.join(self.data_dir, name))
+        self._observer = PollingObserver(timeout=5) if USE_POLLING else Observer()
+        self._observer.schedule(_Handler(self), self.data_dir, recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        return self
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    @property
+    def running(self) -> bool:
+        return self._observer is not None and self._observer.is_alive()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def start_service(data_dir: str = RAW_DIR) -> IngestionService:
+    """ Start the process-wide ingestion service (once) """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = IngestionService(data_dir).start()
+        return _service
+
+
+def active_service() -> IngestionService | None:
+    return _service
@@ -0,0 +1,213 @@
+"""
+Lightweight timing of the page hot paths.
+
+Pages wrap their data loading, computations and chart rendering in `timer(...)` blocks (or use `timed` /
+`plotly_chart`), every block appends a record to the current run. The debug sidebar (enabled with `?debug=1`
+or DASHBOARD_DEBUG=1) shows the per-stage breakdown of the last run, and records can be exported to JSON/CSV.
+
+Page sections decorated with `fragment` rerun on their own when one of their widgets changes. Such a partial
+rerun starts a new run holding only the fragment's records, with the fragment's total under kind 'fragment'.
+"""
+import csv
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import cache
+import prefetch
+import warmer
+
+# every run is appended to this CSV file when set
+TIMINGS_LOG = os.environ.get("DASHBOARD_TIMINGS_LOG")
+LOG_DIR = "logs"
+FIELDS = ["run_id", "started", "page", "stage", "kind", "seconds", "bytes"]
+
+_headless_run = {"run_id": 0, "page": "", "started": "", "records": []}
+
+
+def _current_run() -> dict:
+    # one run per session in the app, a module-level run when the pages are used without Streamlit
+    if st.runtime.exists():
+        if "_timings_run" not in st.session_state:
+            st.session_state["_timings_run"] = {"run_id": 0, "page": "", "started": "", "records": []}
+        return st.session_state["_timings_run"]
+    return _headless_run
+
+
+def debug_enabled() -> bool:
+    if os.environ.get("DASHBOARD_DEBUG") == "1":
+        return True
+    return st.runtime.exists() and st.query_params.get("debug") == "1"
+
+
+def start_run(page: str):
+    """ Reset the records at the start of a script run """
+    run = _current_run()
+    run["run_id"] += 1
+    run["page"] = page
+    run["started"] = datetime.now().isoformat(timespec="seconds")
+    run["records"] = []
+
+
+def record(stage: str, kind: str, seconds: float, nbytes: int | None = None):
+    run = _current_run()
+    run["records"].append({
+        "run_id": run["run_id"],
+        "started": run["started"],
+        "page": run["page"],
+        "stage": stage,
+        "kind": kind,
+        "seconds": seconds,
+        "bytes": nbytes,
+    })
+
+
+@contextmanager
+def timer(stage: str, kind: str = "compute"):
+    """ Time the enclosed block, kind is one of 'load', 'compute', 'render', 'page' or 'fragment' """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, kind, time.perf_counter() - t0)
+
+
+def timed(stage: str | None = None, kind: str = "compute"):
+    """ Decorator version of `timer`, the stage defaults to the function name """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage or fn.__name__, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _fragment_rerun() -> bool:
+    """ True while a fragment reruns on its own (the page script around it is not executed) """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx is not None and bool(ctx.fragment_ids_this_run)
+
+
+def fragment(stage: str):
+    """
+    st.fragment with every run timed: widgets inside the decorated function rerun only the function.
+    The arguments of the last full run are passed again on partial reruns, so the data loaded by the page
+    is passed in rather than loaded inside.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            partial = _fragment_rerun()
+            if partial:
+                start_run(_current_run()["page"])
+            try:
+                with timer(stage, "fragment"):
+                    return fn(*args, **kwargs)
+            finally:
+                if partial and TIMINGS_LOG:
+                    export_timings(TIMINGS_LOG)
+        return st.fragment(wrapper)
+    return decorator
+
+
+def plotly_chart(fig, stage: str, **kwargs):
+    """
+    st.plotly_chart with its rendering time recorded.
+    With the debug panel on, the figure is serialized once more to record its JSON payload size and
+    serialization time separately.
+    """
+    if debug_enabled():
+        t0 = time.perf_counter()
+        payload = pio.to_json(fig, validate=False)
+        record(f"{stage} (serialize)", "render", time.perf_counter() - t0, len(payload.encode("utf-8")))
+
+    with timer(stage, "render"):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def records_frame(records=None) -> pd.DataFrame:
+    records = _current_run()["records"] if records is None else records
+    return pd.DataFrame(records, columns=FIELDS)
+
+
+def export_timings(path: str, records=None):
+    """ Append the records to a CSV file, or to a JSON-lines file if the path ends with .jsonl / .json """
+    records = _current_run()["records"] if records is None else records
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith((".jsonl", ".json")):
+        with open(path, "a") as f:
+            for r in records:
+                f.write(json.dumps(r) + "\n")
+        return
+
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(records)
+
+
+def finish_run():
+    """ Called at the end of every script run - logs the run and draws the debug sidebar """
+    if TIMINGS_LOG:
+        export_timings(TIMINGS_LOG)
+    if debug_enabled():
+        render_debug_sidebar()
+
+
+def render_debug_sidebar():
+    run = _current_run()
+    df = records_frame()
+    with st.sidebar:
+        st.subheader("Timings")
+        st.caption(f"{run['page']} - run {run['run_id']}")
+        if df.empty:
+            st.text("No timed stages")
+        else:
+            by_kind = df[~df["kind"].isin(["page", "fragment"])].groupby("kind")["seconds"].sum()
+            st.dataframe(by_kind.rename("seconds").to_frame().style.format("{:.3f}"))
+            view = df[["stage", "kind", "seconds", "bytes"]].copy()
+            view["ms"] = view.pop("seconds") * 1000
+            view["kB"] = view.pop("bytes") / 1000
+            st.dataframe(view.style.format({"ms": "{:.1f}", "kB": "{:.1f}"}, na_rep=""), hide_index=True)
+
+        st.subheader("Cache")
+        stats = cache.get_cache().stats()
+        st.dataframe(pd.Series(stats, name="value").to_frame(), use_container_width=True)
+        active_warmer = warmer.active_warmer()
+        if active_warmer is not None:
+            state = active_warmer.status()
+            st.caption(f"Warmer: {state['state']} {state['site'] or ''} {state['done']}/{state['total']}"
+                       f"{' - ' + state['task'] if state['task'] else ''}")
+            if state["errors"]:
+                st.caption(f"Warmer errors: {'; '.join(state['errors'])}")
+        active_prefetcher = prefetch.active_prefetcher()
+        if active_prefetcher is not None:
+            state = active_prefetcher.status()
+            st.caption(f"Prefetch: {state['prefetched']} pages, {state['queued']} queued"
+                       f"{' - ' + state['page'] if state['page'] else ''}")
+            if state["errors"]:
+                st.caption(f"Prefetch errors: {'; '.join(state['errors'])}")
+        with st.expander("Cache entries"):
+            st.dataframe(cache.get_cache().report().style.format({"mb": "{:.2f}"}), hide_index=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("JSON", data=df.to_json(orient="records", indent=2), file_name="timings.json",
+                               mime="application/json")
+        with col2:
+            st.download_button("CSV", data=df.to_csv(index=False), file_name="timings.csv", mime="text/csv")
+        if st.button("Append to log"):
+            path = os.path.join(LOG_DIR, "timings.csv")
+            export_timings(path)
+            st.caption(f"Appended {len(df)} records to {path}")
@@ -0,0 +1,323 @@
+import functools
+import inspect
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import chunked
+import ingest
+import sites
+from analytics import align, cleaning, forecast, quality, storage, system_flow
+from analytics.units import DERIVED_COLUMNS, M3_TO_FT3, M3HR_TO_GPM
+from cache import get_cache
+
+DEMAND_COL = "Master Meter Flow Rate, GPM"
+TANK_LEVEL_COL = "WST Height, ft"
+# sensors of the Raw Data page: label -> (dataset, column)
+RAW_SENSORS = {
+    "Treated Flow<br>(GPM)": ("treated_flow", "Filtered Water Flow Rate, GPM"),
+    "Tank Level<br>(ft)": ("tank_level", TANK_LEVEL_COL),
+    "System Flow<br>(GPM)": ("system_flow", DEMAND_COL),
+    "System Pressure<br>(PSI)": ("pressure", "Distribution System Pressure, psi"),
+}
+RAW_DATASETS = tuple(dataset for dataset, _ in RAW_SENSORS.values())
+SENSOR_COLUMNS = {dataset: col for dataset, col in RAW_SENSORS.values()}
+# datasets of this many recently used sites are kept in the cache, older sites are dropped from it
+RECENT_SITES = int(os.environ.get("DASHBOARD_RECENT_SITES", 3))
+# hourly data of raw files larger than this is aggregated chunk by chunk without loading the whole file
+STREAM_THRESHOLD_MB = float(os.environ.get("DASHBOARD_STREAM_MB", 64))
+# kept as float64: the tank levels are compared against the critical threshold, float32 rounding would move
+# readings sitting on the threshold to the other side
+PRECISE_COLUMNS = {"water_level_m", "critical_threshold_m"}
+# object columns with at most this share of distinct values are stored as categoricals
+CATEGORY_RATIO = 0.5
+# residual model of the demand forecast (see analytics.forecast.MODELS), refit after this many new hours
+FORECAST_MODEL = os.environ.get("DASHBOARD_FORECAST_MODEL", "ridge")
+FORECAST_REFIT_HOURS = int(os.environ.get("DASHBOARD_FORECAST_REFIT_HOURS", 24))
+
+
+def compact(df: pd.DataFrame, precise=PRECISE_COLUMNS) -> pd.DataFrame:
+    """ Downcast float64 columns to float32 (except `precise`) and repeated labels to categoricals, in place """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if dtype == "float64" and col not in precise:
+            df[col] = df[col].astype("float32")
+        elif dtype == "object" and len(df) and df[col].nunique() <= CATEGORY_RATIO * len(df):
+            df[col] = df[col].astype("category")
+    return df
+
+
+#######################################################################################################
+# Parsers - read a dataset file into the frame the pages expect
+#######################################################################################################
+def read_sensor_csv(path: str) -> pd.DataFrame:
+    """ Sensor readings in the US units only - the SI duplicates are derived on demand (units.derived_column) """
+    data = pd.read_csv(path, index_col=0)
+    data.index = pd.to_datetime(data.index)
+    data = data.drop(columns=[c for c in data.columns if c in DERIVED_COLUMNS])
+    return compact(data)
+
+
+def read_storage_levels(path: str) -> pd.DataFrame:
+    """ Tank levels in m (ft with units.derived_column), indexed by the parsed timestamps """
+    data = pd.read_csv(path, index_col=0)
+    data.index = pd.to_datetime(data.index)
+    data["Date"] = data.index
+    return compact(data)
+
+
+def read_pump_curves(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path, index_col=0)
+
+    # Filter clusters with at least 10 points
+    df = df[df.groupby("cluster")["cluster"].transform("count") >= 10].copy()
+
+    # Change units, the SI columns are derived on demand
+    df["flow_gpm"] = df["Master Meter Flow Rate_m3hr"] * M3HR_TO_GPM  # m3/hr to GPM
+    df["Date"] = pd.to_datetime(df.pop("Timestamp"))
+    df = df.rename(columns={"Distribution System Pressure Head, psi": "pressure_psi"})
+    df = df.drop(columns=["Master Meter Flow Rate_m3hr", "Distribution System Pressure Head, m", "pump_head_m"])
+    df["cluster"] = df["cluster"].astype("int8")
+    return compact(df)
+
+
+def read_backwash(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df["paired_timestamp"] = pd.to_datetime(df["paired_timestamp"])
+    df["Date"] = df["timestamp"]
+    df["volume_ft3"] = df.pop("volume_m3") * M3_TO_FT3  # m3 to ft3
+    return compact(df)
+
+
+def hourly_pump_points(df: pd.DataFrame, resample_hr: int = 1) -> pd.DataFrame:
+    df = df.sort_values(["Date", "cluster"])
+    df.index = df["Date"]
+    df = df.resample(f"{resample_hr}h").first()
+    return df.dropna(subset=["cluster"])  # the aggregation may produce NaNs
+
+
+#######################################################################################################
+# Cached loaders - frames are shared by every session through the process-wide cache, do not modify them.
+# Every loader takes an optional `site` (name), the site selected in the session by default.
+#######################################################################################################
+_recent_sites = OrderedDict()
+_recent_lock = threading.Lock()
+_forecasters = {}
+_forecasters_lock = threading.Lock()
+
+
+def _use_site(site) -> sites.Site:
+    """ Resolve the site and mark it as recently used, dropping the cache entries of the least recent site """
+    site = site if isinstance(site, sites.Site) else sites.get_site(site)
+    with _recent_lock:
+        _recent_sites[site.name] = site
+        _recent_sites.move_to_end(site.name)
+        evicted = []
+        while len(_recent_sites) > RECENT_SITES:
+            evicted.append(_recent_sites.popitem(last=False)[1])
+    for old in evicted:
+        for path in old.files.values():
+            get_cache().invalidate(path)
+        with _forecasters_lock:
+            for key in [k for k in _forecasters if k[0] == old.name]:
+                del _forecasters[key]
+    return site
+
+
+def recent_sites() -> list[sites.Site]:
+    """ The sites whose datasets are kept in the cache, least recently used first """
+    with _recent_lock:
+        return list(_recent_sites.values())
+
+
+def site_cached(*datasets: str):
+    """
+    Like cache.cached for the loaders of a site's datasets: the key includes the site, the entry is rebuilt
+    when any of the site's `datasets` files changes. The function receives the resolved Site as `site`.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, site=None, **kwargs):
+            site = _use_site(site)
+            # the same call gets the same key whether arguments are passed by position, name or left at default
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = tuple((k, v) for k, v in bound.arguments.items() if k != "site")
+            key = (fn.__module__, fn.__qualname__, site.name, arguments)
+            sources = [site.path(d) for d in datasets]
+            return get_cache().get_or_compute(key, sources, lambda: fn(*args, site=site, **kwargs))
+        return wrapper
+    return decorator
+
+
+def _ingested(path: str):
+    """ The live SensorSeries of a raw sensor file when the ingestion service is running, else None """
+    service = ingest.active_service()
+    if service is None or not service.tracks(path) or not os.path.exists(path):
+        return None
+    series = service.get(path)
+    series.refresh()  # catch up with rows appended since the last file event
+    return series
+
+
+def load_sensor(dataset: str, site=None, clean: bool = False) -> pd.DataFrame:
+    """
+    Readings of a raw sensor file. With clean=True the outliers (see analytics.cleaning) are NaN and every
+    cleaned column has a '<column> flags' column with the reasons.
+    """
+    site = _use_site(site)
+    path = site.path(dataset)
+    if clean:
+        return get_cache().get_or_compute(("load_clean_sensor", path), [path],
+                                          lambda: compact(cleaning.clean_frame(load_sensor(dataset, site))))
+    series = _ingested(path)
+    if series is not None:
+        return series.frame()
+    return get_cache().get_or_compute(("load_sensor", path), [path], lambda: read_sensor_csv(path))
+
+
+def _value_columns(df: pd.DataFrame) -> pd.DataFrame:
+    return df[[c for c in df.columns if not c.endswith(" flags")]]
+
+
+def load_hourly_sensor(dataset: str, site=None, clean: bool = False) -> pd.DataFrame:
+    site = _use_site(site)
+    path = site.path(dataset)
+    series = _ingested(path) if not clean else None
+    if series is not None:
+        return series.hourly()
+
+    def compute():
+        if not clean and os.path.getsize(path) > STREAM_THRESHOLD_MB * 1e6:
+            return compact(chunked.aggregate_file(path).hourly)
+        return compact(_value_columns(load_sensor(dataset, site, clean)).astype(float).resample("60min").mean())
+    return get_cache().get_or_compute(("load_hourly_sensor", path, clean), [path], compute)
+
+
+def load_quality_index(dataset: str, site=None) -> quality.QualityIndex:
+    """ Gaps, dropouts, stuck runs and daily / monthly coverage of the sensor's main column """
+    site = _use_site(site)
+    path = site.path(dataset)
+    col = SENSOR_COLUMNS[dataset]
+
+    def compute():
+        return quality.quality_index(load_sensor(dataset, site)[col], quality.QUALITY[col])
+    return get_cache().get_or_compute(("load_quality_index", path), [path], compute)
+
+
+def load_treated_flow(site=None) -> pd.DataFrame:
+    return load_sensor("treated_flow", site)
+
+
+def load_tank_level(site=None) -> pd.DataFrame:
+    return load_sensor("tank_level", site)
+
+
+def load_system_flow(site=None) -> pd.DataFrame:
+    return load_sensor("system_flow", site)
+
+
+def load_pressure(site=None) -> pd.DataFrame:
+    return load_sensor("pressure", site)
+
+
+def load_hourly_system_flow(site=None, clean: bool = False) -> pd.DataFrame:
+    return load_hourly_sensor("system_flow", site, clean)  # ensure regular 1-h intervals
+
+
+def load_demand_forecast(site=None, clean: bool = False) -> pd.DataFrame:
+    """
+    Hourly demand forecast of the next week (baseline, forecast, lower, upper). The fitted model of every site is
+    kept between runs and takes the hours appended to the series since the last call, see forecast.DemandForecaster.
+    """
+    site = _use_site(site)
+    with _forecasters_lock:
+        forecaster = _forecasters.get((site.name, clean))
+        if forecaster is None:
+            forecaster = _forecasters[(site.name, clean)] = forecast.DemandForecaster(FORECAST_MODEL,
+                                                                                      FORECAST_REFIT_HOURS)
+    return forecaster.predict(load_hourly_system_flow(site, clean)[DEMAND_COL])
+
+
+def demand_forecaster(site=None, clean: bool = False) -> forecast.DemandForecaster | None:
+    """ The forecaster behind load_demand_forecast, None before the first forecast of the site """
+    with _forecasters_lock:
+        return _forecasters.get((_use_site(site).name, clean))
+
+
+@site_cached(*RAW_DATASETS)
+def load_aligned_sensors(freq: str, how: str = "mean", clean: bool = False, site=None) -> pd.DataFrame:
+    """
+    The Raw Data sensors on a common regular grid of `freq` (see align.RESOLUTIONS), one column per available sensor.
+    Sensors whose file is missing are left out, see load_sensor_coverage.
+    """
+    series = {label: load_sensor(dataset, site, clean)[col] for label, (dataset, col) in RAW_SENSORS.items()
+              if os.path.exists(site.path(dataset))}
+    return compact(align.align_sensors(series, freq, how))
+
+
+@site_cached(*RAW_DATASETS)
+def load_sensor_coverage(freq: str, how: str = "mean", clean: bool = False, site=None) -> pd.DataFrame:
+    return align.coverage(load_aligned_sensors(freq, how, clean, site=site), RAW_SENSORS)
+
+
+@site_cached("system_flow")
+def load_period_profile(freq_label: str, period: str, clean: bool = False, site=None) -> pd.Series:
+    demand = load_hourly_system_flow(site, clean)[DEMAND_COL].astype(float)
+    return system_flow.period_profile(demand, freq_label, period)
+
+
+def load_period_profiles(freq_label: str, periods, clean: bool = False, site=None) -> dict[str, pd.Series]:
+    """ Same as system_flow.period_profiles, with every period's profile cached separately """
+    profiles = {p: load_period_profile(freq_label, p, clean, site=site) for p in periods}
+    return {p: ser for p, ser in profiles.items() if not ser.empty}
+
+
+def load_monthly_totals(site=None, clean: bool = False) -> pd.DataFrame:
+    site = _use_site(site)
+    path = site.path("system_flow")
+    series = _ingested(path) if not clean else None
+    if series is not None:
+        return series.monthly_totals(DEMAND_COL)  # maintained incrementally
+
+    def compute():
+        return system_flow.monthly_totals(load_hourly_system_flow(site, clean)[DEMAND_COL])
+    return get_cache().get_or_compute(("load_monthly_totals", path, clean), [path], compute)
+
+
+@site_cached("storage")
+def load_storage_levels(clean: bool = False, site=None) -> pd.DataFrame:
+    """ Tank levels, with clean=True the outliers of water_level_m are NaN and flagged in 'water_level_m flags' """
+    data = read_storage_levels(site.path("storage"))
+    if clean:
+        level, flags = cleaning.clean_series(data["water_level_m"].set_axis(data["Date"]),
+                                             cleaning.CLEANING["water_level_m"])
+        data["water_level_m"] = level.to_numpy()
+        data["water_level_m flags"] = flags.to_numpy()
+    return data
+
+
+@site_cached("storage")
+def load_storage_metrics(threshold: float, clean: bool = False, site=None) -> storage.StorageMetrics:
+    """ Reliability / resilience / vulnerability of the whole level series for a threshold in ft """
+    return storage.storage_metrics(load_storage_levels(clean, site=site)["water_level_m"], threshold)
+
+
+@site_cached("pump_curves")
+def load_pump_curves(site=None) -> pd.DataFrame:
+    return read_pump_curves(site.path("pump_curves"))
+
+
+@site_cached("pump_curves")
+def load_hourly_pump_points(resample_hr: int = 1, site=None) -> pd.DataFrame:
+    return hourly_pump_points(load_pump_curves(site=site), resample_hr)
+
+
+@site_cached("backwash")
+def load_backwash(site=None) -> pd.DataFrame:
+    return read_backwash(site.path("backwash"))
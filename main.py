@@ -1,6 +1,14 @@
 import streamlit as st
 
+import alerts
+import ingest
+import instrumentation
+import prefetch
+import query_service
+import sites
 import utils
+import warmer
+from pages.fleet import fleet_page
 from pages.main_page import main_page
 from pages.raw_data import raw_data_page
 from pages.pump_curves import pump_curves_page
@@ -10,12 +18,22 @@ from pages.system_flow import system_flow_page
 
 st.set_page_config(page_title="Alaska Dashboard", layout="wide")
 
+# keep the raw sensor data up to date as rows are appended to the files (started once per process)
+ingest.start_service()
+# fill the cache for every page off the request path, and again when the data changes
+warmer.start_warmer()
+# serve the sensor data to scripts and notebooks from the app's cache when DASHBOARD_QUERY_PORT is set
+query_service.start_service()
+# evaluate the alert rules on the rows appended to the data files, alerts go to logs/alerts.sqlite
+alerts.start_engine()
+
 pg_main = st.Page(main_page, title="Home")
 pg_raw = st.Page(raw_data_page, title="Raw Data")
 pg_sys_flow = st.Page(system_flow_page, title="System Flow")
 pg_pumps = st.Page(pump_curves_page, title="Pump Curves")
 pg_water_losses = st.Page(water_losses_page, title="Water Losses")
 pg_storage = st.Page(storage_page, title="Storage")
+pg_fleet = st.Page(fleet_page, title="Fleet Summary")
 
 # force font size also if theme is changed by users
 st.markdown("""
@@ -27,13 +45,18 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
-nav = st.navigation([pg_main, pg_raw, pg_sys_flow, pg_pumps, pg_water_losses, storage_page])
+nav = st.navigation([pg_main, pg_raw, pg_sys_flow, pg_pumps, pg_water_losses, pg_storage, pg_fleet])
 
 # Track current page in session_state
 if "current_page" not in st.session_state:
     st.session_state.current_page = "Dashboard"
 
+instrumentation.start_run(nav.title)
+
+site = sites.site_selector()
+
 st.title("Alaska WDS Data Dashboard")
+st.caption(site.name)
 col1, col2, col3, col4, col5 = st.columns(5)
 st.divider()
 
@@ -59,4 +82,10 @@ with col5:
     if clicked == "tank":
         st.switch_page(pg_storage)
 
-nav.run()
+with instrumentation.timer(nav.title, "page"):
+    nav.run()
+
+# load the data of the pages this session is likely to open next, off the request path
+prefetch.page_view(nav.title, site)
+
+instrumentation.finish_run()
@@ -4,6 +4,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 
 import graph_utils
+import instrumentation
 
 WEEKDAY_COLORS = {"Monday": "#00a9b7", "Tuesday": "#f8971f", "Wednesday": "#9cadb7", "Thursday": "#bf5700",
                   "Friday": "purple", "Saturday": "brown", "Sunday": "pink"}
@@ -12,7 +13,8 @@ WEEKDAY_COLORS = {"Monday": "#00a9b7", "Tuesday": "#f8971f", "Wednesday": "#9cad
 def demands_page():
     st.title("Demand Patterns")
 
-    data = pd.read_csv("data/median_demand_plotted_points.csv")  # replace with pd.read_csv("file.csv")
+    with instrumentation.timer("load median demand", "load"):
+        data = pd.read_csv("data/median_demand_plotted_points.csv")  # replace with pd.read_csv("file.csv")
     data["time_dt"] = pd.to_datetime("2000-01-01 " + data["time"])  # dummy date
 
     daw_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
@@ -51,12 +53,13 @@ def demands_page():
 
     col1, spacer = st.columns([1, 0.2])
     with col1:
-        st.plotly_chart(fig, use_container_width=True)
+        instrumentation.plotly_chart(fig, "demand patterns chart", use_container_width=True)
 
     # Demands Anomalies
     st.text("\n")
     st.title("Demand Drift Detection")
-    data = pd.read_csv("data/real_time_results.csv", index_col=0)
+    with instrumentation.timer("load demand drift", "load"):
+        data = pd.read_csv("data/real_time_results.csv", index_col=0)
     fig = graph_utils.plot_time_series(
         data=data,
         data_col_names=["Flow (m³/hr)"],
@@ -109,7 +112,7 @@ def demands_page():
 
     col1, spacer = st.columns([1, 0.2])
     with col1:
-        st.plotly_chart(fig, use_container_width=True)
+        instrumentation.plotly_chart(fig, "demand drift chart", use_container_width=True)
 
 
 
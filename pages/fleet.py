@@ -0,0 +1,33 @@
+import streamlit as st
+
+import fleet_summary
+import instrumentation
+
+COLUMN_CONFIG = {
+    "months": st.column_config.NumberColumn("Months", format="%d"),
+    "avg_monthly_gal": st.column_config.NumberColumn("Avg. Monthly Use (gal)", format="%.0f"),
+    "last_month_gal": st.column_config.NumberColumn("Last Month (gal)", format="%.0f"),
+    "reliability": st.column_config.NumberColumn("Reliability", format="%.3f"),
+    "resilience": st.column_config.NumberColumn("Resilience", format="%.3f"),
+    "vulnerability": st.column_config.NumberColumn("Vulnerability", format="%.3f"),
+    "backwash_events": st.column_config.NumberColumn("Backwash Events", format="%d"),
+    "backwash_ft3_per_month": st.column_config.NumberColumn("Backwash Water (ft³/month)", format="%.1f"),
+    "avg_backwash_ft3": st.column_config.NumberColumn("Avg. Backwash (ft³)", format="%.2f"),
+    "top_cluster": st.column_config.NumberColumn("Most Used Pump Cluster", format="%d"),
+    "top_cluster_share": st.column_config.ProgressColumn("Share of Hours", format="%.2f", min_value=0, max_value=1),
+    "clusters_used": st.column_config.NumberColumn("Clusters Used", format="%d"),
+    "error": st.column_config.TextColumn("Error"),
+}
+
+
+def fleet_page():
+    st.title("Fleet Summary")
+
+    with instrumentation.timer("fleet kpis"):
+        df = fleet_summary.fleet_kpis()
+
+    st.text("Key indicators of every community, click a column header to sort.")
+    if "error" in df.columns:
+        failed = df.index[df["error"].notna()]
+        st.warning(f"Some data of {', '.join(failed)} could not be read, their KPIs are left empty (see Error).")
+    st.dataframe(df, column_config=COLUMN_CONFIG, use_container_width=True)
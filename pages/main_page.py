@@ -1,5 +1,11 @@
 import streamlit as st
 
+import assets
+import instrumentation
+import sites
+
+PHOTO_HEIGHT = 720
+
 
 def main_page():
     st.title("About")
@@ -10,8 +16,9 @@ def main_page():
     st.markdown("Paper (to update later) [link](%s)" %"https://sites.utexas.edu/selalina/")
     st.text(" ")
 
-    col1, col2 = st.columns(2)
-    with col1:
-        st.image("resources/unalakleet1.jpg", caption="")
-    with col2:
-        st.image("resources/unalakleet2.jpg", caption="")
\ No newline at end of file
+    with instrumentation.timer("photos", "load"):
+        photos = [assets.thumbnail_bytes(p, PHOTO_HEIGHT) for p in sites.get_site().photos]
+
+    for col, photo in zip(st.columns(len(photos)), photos):
+        with col:
+            st.image(photo, caption="")
\ No newline at end of file
@@ -1,32 +1,74 @@
+import os
+
 import pandas as pd
 import streamlit as st
-from PIL import Image
 
+import assets
+import exports
 import graph_utils
-import utils
+import instrumentation
+import loaders
+import sites
+from analytics import align, quality
 
 def raw_data_page():
     st.title("Raw Data")
 
-    treated_flow = pd.read_csv("data/1_raw sensor data/1_treated_water.csv", index_col=0, parse_dates=True)
-    tank = pd.read_csv("data/1_raw sensor data/2_tank_water_level.csv", index_col=0, parse_dates=True)
-    system_flow = pd.read_csv("data/1_raw sensor data/3_system_flow.csv", index_col=0, parse_dates=True)
-    pressure = pd.read_csv("data/1_raw sensor data/4_system_pressure.csv", index_col=0, parse_dates=True)
+    col1, col2, sp = st.columns([1, 1, 3])
+    with col1:
+        resolution = st.selectbox("Resolution", list(align.RESOLUTIONS), index=0)
+    with col2:
+        how = st.selectbox("Aggregation", align.AGGREGATIONS, index=0)
+    freq = align.RESOLUTIONS[resolution]
+    clean = st.toggle("Filter outliers", value=True,
+                      help="Remove readings outside the sensor range, Hampel outliers and isolated spikes")
+
+    with instrumentation.timer("load aligned sensors", "load"):
+        data = loaders.load_aligned_sensors(freq, how, clean)  # shared between sessions - do not modify
+        sensor_coverage = loaders.load_sensor_coverage(freq, how, clean)
+
+    missing = sensor_coverage.index[sensor_coverage["filled"] == 0].str.replace("<br>", " ").tolist()
+    if missing:
+        st.info(f"No data available for: {', '.join(missing)}")
+    with st.expander("Sensor coverage"):
+        view = sensor_coverage.copy()
+        view.index = view.index.str.replace("<br>", " ")
+        st.dataframe(view, column_config={
+            "coverage": st.column_config.ProgressColumn("coverage", format="%.2f", min_value=0, max_value=1)})
+    if data.empty:
+        return
+    raw_window_section(data, resolution, freq, how, clean)
+
+    st.text(" ")
+    st.text(" ")
+    st.divider()
+
+    target_height = 250
+    with instrumentation.timer("photos", "load"):
+        img1 = assets.thumbnail_bytes("resources/1_treated_flow_sensor.jpg", target_height)
+        img2 = assets.thumbnail_bytes("resources/2_demand_sensor.jpg", target_height)
+        img3 = assets.thumbnail_bytes("resources/3_tank_level_sensor.jpg", target_height)
+        img4 = assets.thumbnail_bytes("resources/4_pressure_sensor.jpg", target_height)
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.image(img1, caption="Treated Water Flow Rate Meter")
+    with col2:
+        st.image(img2, caption="System Flow Meter")
+    with col3:
+        st.image(img3, caption="Tank Water Level Sensor")
+    with col4:
+        st.image(img4, caption="System Pressure Sensor")
 
-    data = pd.concat([
-        treated_flow["Filtered Water Flow Rate, GPM"].rename("Treated Flow<br>(GPM)"),
-        tank["WST Height, ft"].rename("Tank Level<br>(ft)"),
-        system_flow["Master Meter Flow Rate, GPM"].rename("System Flow<br>(GPM)"),
-        pressure["Distribution System Pressure, psi"].rename("System Pressure<br>(PSI)"),
-                          ], axis=1)
 
-    data["Date"] = data.index
-    data["Date"] = pd.to_datetime(data["Date"])
-    min_d, max_d = data["Date"].min().date(), data["Date"].max().date()
+@instrumentation.fragment("raw data window")
+def raw_window_section(data: pd.DataFrame, resolution: str, freq: str, how: str, clean: bool):
+    """ Date window, sensor charts and export - rerun without realigning the sensors when the window changes """
+    min_d, max_d = data.index.min().date(), data.index.max().date()
     date_win = st.slider(r"$\textsf{\Large Select window}$", min_value=min_d, max_value=max_d, value=(min_d, max_d))
     st.divider()
-    mask = (data["Date"] >= pd.Timestamp(date_win[0])) & (data["Date"] <= pd.Timestamp(date_win[1]))
-    filtered_data = data.loc[mask].copy().drop(columns=["Date"])
+    mask = (data.index >= pd.Timestamp(date_win[0])) & (data.index <= pd.Timestamp(date_win[1]))
+    filtered_data = data.loc[mask]
 
     st.text(" ")
     st.markdown("""
@@ -45,31 +87,31 @@ def raw_data_page():
         vertical_spacing=0.08,
         line_kw=dict(line_width=1.6))
 
-    # customized the y limits of the last plot - artifically ignore outlier
-    fig.update_yaxes(range=[0, 100], row=4, col=1)
+    # shade the gaps and sensor dropouts longer than a day
+    with instrumentation.timer("gap annotations"):
+        window = (pd.Timestamp(date_win[0]), pd.Timestamp(date_win[1]))
+        for row, label in enumerate(filtered_data.columns, start=1):
+            gaps = quality.intervals_frame(loaders.load_quality_index(loaders.RAW_SENSORS[label][0]), min_hours=24)
+            gaps = gaps[(gaps["x1"] >= window[0]) & (gaps["x0"] <= window[1])]
+            graph_utils.shade_intervals(fig, gaps, row=row)
     fig.update_layout(margin=dict(t=0))
-    st.plotly_chart(fig)
-
-    st.text(" ")
-    st.text(" ")
-    st.divider()
+    instrumentation.plotly_chart(fig, "raw data chart")
 
-    target_height = 250
-    img1 = Image.open("resources/1_treated_flow_sensor.jpg")
-    img2 = Image.open("resources/2_demand_sensor.jpg")
-    img3 = Image.open("resources/3_tank_level_sensor.jpg")
-    img4 = Image.open("resources/4_pressure_sensor.jpg")
-    img1_resized = utils.resize_to_height(img1, target_height)
-    img2_resized = utils.resize_to_height(img2, target_height)
-    img3_resized = utils.resize_to_height(img3, target_height)
-    img4_resized = utils.resize_to_height(img4, target_height)
-
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.image(img1_resized, caption="Treated Water Flow Rate Meter")
-    with col2:
-        st.image(img2_resized, caption="System Flow Meter")
-    with col3:
-        st.image(img3_resized, caption="Tank Water Level Sensor")
-    with col4:
-        st.image(img4_resized, caption="System Pressure Sensor")
\ No newline at end of file
+    with st.expander("Export"):
+        readings = st.radio("Data", [f"{resolution} {how}", "Raw readings"], horizontal=True, key="raw_export_data")
+        start, end = pd.Timestamp(date_win[0]), pd.Timestamp(date_win[1]) + pd.Timedelta(days=1)
+        site = sites.get_site()
+        sources = [site.path(dataset) for dataset in loaders.RAW_DATASETS]
+        if readings == "Raw readings":
+            def make_frames():
+                series = {label.replace("<br>", " "): loaders.load_sensor(dataset, clean=clean)[col]
+                          for label, (dataset, col) in loaders.RAW_SENSORS.items()
+                          if os.path.exists(site.path(dataset))}
+                return exports.long_chunks(series, start, end)
+            spec = ("raw_readings", site.name, start, end, clean)
+        else:
+            def make_frames():
+                return (chunk.rename(columns=lambda c: c.replace("<br>", " "))
+                        for chunk in exports.window_chunks(data, start, end))
+            spec = ("raw_data", site.name, freq, how, start, end, clean)
+        exports.export_controls(spec[0], spec, make_frames, sources)
@@ -0,0 +1,172 @@
+"""
+Predictive prefetch of the pages a session is likely to open next.
+
+Every page change of a session (previous page -> page) is counted in a navigation history shared by all sessions and
+kept in `DASHBOARD_NAV_HISTORY` across restarts. Once a page has rendered, the data behind the default view of the
+`DASHBOARD_PREFETCH_PAGES` pages most often opened after it (PRIOR_NEXT until the history has some) is loaded into
+the shared cache for the session's site by a background thread, so the next navigation reads it from there. The
+cache warmer only covers the default and recently used sites on its own schedule; this follows the sessions.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import Counter
+
+import streamlit as st
+
+import sites
+import warmer
+
+PREFETCH_ENABLED = os.environ.get("DASHBOARD_PREFETCH", "1") == "1"
+# number of likely next pages prefetched after every page view
+PREFETCH_PAGES = int(os.environ.get("DASHBOARD_PREFETCH_PAGES", 2))
+NAV_HISTORY = os.environ.get("DASHBOARD_NAV_HISTORY", os.path.join(".cache", "navigation.json"))
+# next pages before any navigation was recorded, the heaviest ones first
+PRIOR_NEXT = ["System Flow", "Raw Data", "Storage", "Pump Curves", "Water Losses"]
+
+
+class NavigationHistory:
+    """ Counts of the page changes of all sessions, page -> next page -> count, saved to a JSON file """
+    def __init__(self, path: str | None = NAV_HISTORY):
+        self.path = path
+        self._lock = threading.Lock()
+        self.transitions = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.transitions = {page: Counter(nxt) for page, nxt in json.load(f).items()}
+            except (OSError, ValueError):
+                traceback.print_exc()
+
+    def record(self, previous: str, page: str):
+        with self._lock:
+            self.transitions.setdefault(previous, Counter())[page] += 1
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.transitions, f, indent=1)
+        os.replace(tmp, self.path)  # readers never see a partial file
+
+    def likely_next(self, page: str, k: int = PREFETCH_PAGES) -> list[str]:
+        """ The k pages most often opened after `page`, completed with PRIOR_NEXT """
+        with self._lock:
+            ranked = [p for p, _ in self.transitions.get(page, Counter()).most_common()]
+        ranked += [p for p in PRIOR_NEXT if p not in ranked]
+        return [p for p in ranked if p != page][:k]
+
+
+class Prefetcher:
+    """ Loads the data of the likely next pages on one background thread, its progress is read with `status()` """
+    def __init__(self, history: NavigationHistory, pages: int = PREFETCH_PAGES):
+        self.history = history
+        self.pages = pages
+        self._queue = queue.Queue()
+        self._pending = set()  # (site name, page) queued or running
+        self._lock = threading.Lock()
+        self._thread = None
+        self._state = {"page": None, "prefetched": 0, "last_prefetch_sec": None, "errors": []}
+
+    def status(self) -> dict:
+        with self._lock:
+            state = dict(self._state, queued=len(self._pending))
+            state["errors"] = list(state["errors"])
+            return state
+
+    def page_viewed(self, site: sites.Site, previous: str | None, page: str) -> list[str]:
+        """ Count the page change and queue the likely next pages of the site, returns them """
+        if previous is not None:
+            self.history.record(previous, page)
+        pages = self.history.likely_next(page, self.pages)
+        for nxt in pages:
+            self.submit(site, nxt)
+        return pages
+
+    def submit(self, site: sites.Site, page: str):
+        key = (site.name, page)
+        with self._lock:
+            if key in self._pending:  # another session already asked for it
+                return
+            self._pending.add(key)
+        self._queue.put((site, page))
+
+    def prefetch(self, site: sites.Site, page: str):
+        tasks = warmer.page_tasks(site).get(page, [])
+        with self._lock:
+            self._state["page"] = f"{site.name} / {page}"
+        t0 = time.perf_counter()
+        for name, fn in tasks:
+            try:
+                fn()  # entries already cached return at once
+            except Exception as e:
+                with self._lock:
+                    self._state["errors"] = (self._state["errors"] + [f"{site.name} / {name}: {e!r}"])[-10:]
+                traceback.print_exc()
+        with self._lock:
+            self._state.update(page=None, prefetched=self._state["prefetched"] + 1,
+                               last_prefetch_sec=time.perf_counter() - t0)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            site, page = item
+            try:
+                self.prefetch(site, page)
+            finally:
+                with self._lock:
+                    self._pending.discard((site.name, page))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def start_prefetcher() -> Prefetcher | None:
+    """ Start the process-wide prefetcher (once), None when disabled with DASHBOARD_PREFETCH=0 """
+    global _prefetcher
+    if not PREFETCH_ENABLED:
+        return None
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher(NavigationHistory()).start()
+        return _prefetcher
+
+
+def active_prefetcher() -> Prefetcher | None:
+    return _prefetcher
+
+
+def page_view(page: str, site: sites.Site):
+    """ Called once the page has rendered - records the page change of the session and prefetches the next pages """
+    prefetcher = start_prefetcher()
+    if prefetcher is None:
+        return
+    previous_site, previous = st.session_state.get("prefetch_view", (None, None))
+    if (previous_site, previous) == (site.name, page):  # widget rerun of the same page
+        return
+    st.session_state["prefetch_view"] = (site.name, page)
+    prefetcher.page_viewed(site, previous if previous != page else None, page)
@@ -0,0 +1,59 @@
+"""
+Python client of the local query service (see query_service).
+
+    client = QueryClient("http://127.0.0.1:8766")
+    df = client.series("Arctic Village", ["system_flow", "pressure"], start="2024-01-01", end="2024-02-01",
+                       resolution="60min", how="max")
+"""
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import requests
+
+
+def decode(payload: bytes, fmt: str = "arrow") -> pa.Table:
+    """ Arrow table of a query response, its columns reference the payload """
+    buf = pa.py_buffer(payload)
+    if fmt == "parquet":
+        return pq.read_table(pa.BufferReader(buf))
+    return ipc.open_stream(buf).read_all()
+
+
+class QueryClient:
+    def __init__(self, base_url: str = "http://127.0.0.1:8766", timeout: float = 60):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()  # keeps the connection alive between queries
+
+    def _get(self, path: str, **params) -> requests.Response:
+        resp = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+        if resp.status_code != 200:
+            try:
+                message = resp.json()["message"]
+            except ValueError:
+                message = resp.text
+            raise ValueError(f"{resp.status_code}: {message}")
+        return resp
+
+    def sites(self) -> dict[str, list]:
+        """ Site name -> sensor datasets available for the site """
+        return self._get("/api/v1/sites").json()["data"]
+
+    def table(self, site: str | None = None, sensors=None, start=None, end=None, resolution: str = "raw",
+              how: str = "mean", clean: bool = False, fmt: str = "arrow") -> pa.Table:
+        """ Query result as an Arrow table """
+        params = {"resolution": resolution, "how": how, "clean": int(clean), "format": fmt}
+        if site:
+            params["site"] = site
+        if sensors:
+            params["sensors"] = ",".join([sensors] if isinstance(sensors, str) else sensors)
+        if start is not None:
+            params["start"] = str(start)
+        if end is not None:
+            params["end"] = str(end)
+        return decode(self._get("/api/v1/series", **params).content, fmt)
+
+    def series(self, *args, **kwargs) -> pd.DataFrame:
+        """ Query result as a time-indexed frame, see `table` for the arguments """
+        return self.table(*args, **kwargs).to_pandas().set_index("timestamp")
@@ -0,0 +1,271 @@
+"""
+Local HTTP query service for the sensor data of the dashboard.
+
+Serves windowed, resampled sensor data from the same loaders and process-wide cache as the pages, as Arrow IPC
+stream or Parquet bytes:
+
+    GET /api/v1/sites
+    GET /api/v1/series?site=Arctic Village&sensors=system_flow,pressure&start=2024-01-01&end=2024-02-01
+                      &resolution=15min&how=mean&clean=1&format=arrow
+
+- sensors: comma separated datasets of loaders.SENSOR_COLUMNS, all of the site's sensors by default
+- resolution: one of align.RESOLUTIONS' frequencies (15min, 60min, 1D), or raw for the readings as recorded
+- how: aggregation of the readings falling into one slot (align.AGGREGATIONS)
+- start (inclusive), end (exclusive): timestamps, the whole series by default
+- format: arrow (IPC stream) or parquet
+
+Resampled data is one row per grid slot with a column per sensor, raw data is one row per reading with the columns
+timestamp / sensor / value. Empty slots are NaN. Arrow columns are built on the cached NumPy buffers without copies,
+the one copy is the serialized payload handed to tornado.
+
+Run it on its own (`python query_service.py --port 8766`), or inside the app with DASHBOARD_QUERY_PORT set so that it
+shares the app's cache.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import tornado.httpserver
+import tornado.netutil
+import tornado.web
+
+import loaders
+import sites
+from analytics import align
+
+QUERY_PORT = int(os.environ.get("DASHBOARD_QUERY_PORT", 0))  # 0: not started with the app
+QUERY_HOST = os.environ.get("DASHBOARD_QUERY_HOST", "127.0.0.1")
+QUERY_WORKERS = int(os.environ.get("DASHBOARD_QUERY_WORKERS", 4))
+BATCH_ROWS = 65_536  # rows per Arrow record batch / Parquet row group
+RAW = "raw"
+FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+# dataset -> Raw Data label (column of the aligned frames)
+LABELS = {dataset: label for label, (dataset, _) in loaders.RAW_SENSORS.items()}
+
+logger = logging.getLogger("query_service")
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _window(index: pd.DatetimeIndex, start, end) -> slice:
+    lo = 0 if start is None else index.searchsorted(start, side="left")
+    hi = len(index) if end is None else index.searchsorted(end, side="left")
+    return slice(lo, max(lo, hi))
+
+
+def _column(values: np.ndarray) -> pa.Array:
+    # a contiguous NumPy array becomes the Arrow data buffer as is (NaN stays NaN, no validity bitmap)
+    return pa.array(np.ascontiguousarray(values))
+
+
+def resampled_table(site: sites.Site, sensors, freq: str, how: str, clean: bool, start, end) -> pa.Table:
+    data = loaders.load_aligned_sensors(freq, how, clean, site=site)
+    window = _window(data.index, start, end)
+    columns = {"timestamp": _column(data.index.to_numpy()[window])}
+    for dataset in sensors:
+        label = LABELS[dataset]
+        if label in data.columns:
+            columns[dataset] = _column(data[label].to_numpy()[window])
+        else:
+            columns[dataset] = pa.nulls(window.stop - window.start, pa.float32())
+    return pa.table(columns)
+
+
+def raw_table(site: sites.Site, sensors, clean: bool, start, end) -> pa.Table:
+    parts = []
+    for dataset in sensors:
+        if not os.path.exists(site.path(dataset)):
+            continue
+        ser = loaders.load_sensor(dataset, site, clean)[loaders.SENSOR_COLUMNS[dataset]]
+        window = _window(ser.index, start, end)
+        n = window.stop - window.start
+        parts.append(pa.table({
+            "timestamp": _column(ser.index.to_numpy()[window]),
+            "sensor": pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype=np.int8)), pa.array([dataset])),
+            "value": _column(ser.to_numpy()[window].astype(np.float32, copy=False)),
+        }))
+    if not parts:
+        return pa.table({"timestamp": pa.array([], pa.timestamp("ns")),
+                         "sensor": pa.array([], pa.dictionary(pa.int8(), pa.string())),
+                         "value": pa.array([], pa.float32())})
+    return pa.concat_tables(parts, promote_options="permissive")  # concatenates the chunks, no copy
+
+
+def parse_query(args: dict) -> dict:
+    """ Validated query parameters from the request arguments (name -> str) """
+    names = sites.all_sites()
+    site = args.get("site", sites.DEFAULT_SITE)
+    if site not in names:
+        raise QueryError(f"unknown site {site!r}, one of {list(names)}")
+    sensors = [s for s in args.get("sensors", ",".join(LABELS)).split(",") if s]
+    unknown = [s for s in sensors if s not in LABELS]
+    if unknown or not sensors:
+        raise QueryError(f"unknown sensors {unknown}, one of {list(LABELS)}")
+    resolution = args.get("resolution", RAW)
+    if resolution != RAW and resolution not in align.RESOLUTIONS.values():
+        raise QueryError(f"unknown resolution {resolution!r}, one of {[RAW, *align.RESOLUTIONS.values()]}")
+    how = args.get("how", "mean")
+    if how not in align.AGGREGATIONS:
+        raise QueryError(f"unknown aggregation {how!r}, one of {align.AGGREGATIONS}")
+    fmt = args.get("format", "arrow")
+    if fmt not in FORMATS:
+        raise QueryError(f"unknown format {fmt!r}, one of {list(FORMATS)}")
+    try:
+        start = pd.Timestamp(args["start"]) if args.get("start") else None
+        end = pd.Timestamp(args["end"]) if args.get("end") else None
+    except ValueError as e:
+        raise QueryError(f"invalid timestamp: {e}") from None
+    return {"site": names[site], "sensors": sensors, "resolution": resolution, "how": how,
+            "clean": args.get("clean", "0") in ("1", "true"), "start": start, "end": end, "format": fmt}
+
+
+def query_table(query: dict) -> pa.Table:
+    if query["resolution"] == RAW:
+        return raw_table(query["site"], query["sensors"], query["clean"], query["start"], query["end"])
+    return resampled_table(query["site"], query["sensors"], query["resolution"], query["how"], query["clean"],
+                           query["start"], query["end"])
+
+
+def serialize(table: pa.Table, fmt: str) -> bytes:
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        pq.write_table(table, sink, row_group_size=BATCH_ROWS, compression="zstd")
+    else:
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=BATCH_ROWS)
+    return sink.getvalue().to_pybytes()
+
+
+class _Handler(tornado.web.RequestHandler):
+    def initialize(self, executor: ThreadPoolExecutor):
+        self.executor = executor
+
+    def error(self, code: int, message: str):
+        self.set_status(code)
+        self.finish({"status": "error", "message": message})
+
+
+class SitesHandler(_Handler):
+    def get(self):
+        self.finish({"status": "success", "data": {
+            name: [d for d in LABELS if os.path.exists(site.path(d))] for name, site in sites.all_sites().items()}})
+
+
+class SeriesHandler(_Handler):
+    async def get(self):
+        args = {k: self.get_argument(k) for k in self.request.arguments}
+        try:
+            query = parse_query(args)
+        except QueryError as e:
+            self.error(400, str(e))
+            return
+
+        def compute():
+            table = query_table(query)
+            return table.num_rows, serialize(table, query["format"])
+
+        # loading and serializing run on the worker threads, the event loop only moves bytes
+        rows, payload = await asyncio.get_running_loop().run_in_executor(self.executor, compute)
+        self.set_header("Content-Type", FORMATS[query["format"]])
+        self.set_header("X-Rows", str(rows))
+        self.finish(payload)
+
+
+def make_app(workers: int = QUERY_WORKERS) -> tornado.web.Application:
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+    return tornado.web.Application([
+        (r"/api/v1/sites", SitesHandler, {"executor": executor}),
+        (r"/api/v1/series", SeriesHandler, {"executor": executor}),
+    ])
+
+
+class QueryService:
+    """ The query service on its own event loop in a daemon thread """
+    def __init__(self, host: str = QUERY_HOST, port: int = 0, workers: int = QUERY_WORKERS):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+
+    def _run(self, sockets):
+        async def main():
+            self._loop = asyncio.get_running_loop()
+            self._server = tornado.httpserver.HTTPServer(make_app(self.workers))
+            self._server.add_sockets(sockets)
+            self._stopped = asyncio.Event()
+            self._ready.set()
+            await self._stopped.wait()
+        asyncio.run(main())
+
+    def start(self):
+        # bound on the calling thread, so a busy port raises OSError here instead of killing the service thread
+        sockets = tornado.netutil.bind_sockets(self.port, address=self.host)
+        self.port = sockets[0].getsockname()[1]  # the free port picked when port is 0
+        threading.Thread(target=self._run, args=(sockets,), name="query-service", daemon=True).start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.stop)
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+
+_service = None
+_service_failed = False
+_service_lock = threading.Lock()
+
+
+def start_service(port: int = QUERY_PORT) -> QueryService | None:
+    """
+    Start the process-wide query service (once), None when no port is configured or the port could not be bound
+    (logged once, the app runs without the service)
+    """
+    global _service, _service_failed
+    if not port:
+        return None
+    with _service_lock:
+        if _service is None and not _service_failed:
+            try:
+                _service = QueryService(port=port).start()
+            except OSError as e:
+                _service_failed = True
+                logger.error("query service not started, cannot bind %s:%s: %s", QUERY_HOST, port, e)
+        return _service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local query service for the dashboard's sensor data")
+    parser.add_argument("--host", default=QUERY_HOST)
+    parser.add_argument("--port", type=int, default=QUERY_PORT or 8766)
+    parser.add_argument("--workers", type=int, default=QUERY_WORKERS)
+    args = parser.parse_args()
+
+    async def serve():
+        make_app(args.workers).listen(args.port, address=args.host)
+        print(f"serving on http://{args.host}:{args.port}/api/v1/series")
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
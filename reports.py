@@ -0,0 +1,336 @@
+"""
+Batch reports - every page's figures, tables and metrics for a date range, rendered headlessly to static files.
+
+    python -m reports --sites "Arctic Village" --start 2024-01-01 --end 2024-02-01 --out reports/2024-01
+
+writes one bundle per site, viewable offline from the file system:
+
+    reports/2024-01/
+        index.html                      sites, fleet KPI table, build times
+        manifest.json                   parameters, files and metrics of every page
+        plotly.min.js                   shared by all pages
+        fleet.csv
+        arctic_village/
+            index.html                  all pages of the site
+            system_flow/monthly_totals.json, statistics.csv, metrics.json, ...
+
+Every (site, page) is one task of a process pool. A task computes the page through the cached loaders, so the
+aggregates the pages share (aligned sensors, hourly flow, quality indices) are computed once per worker and the
+site's fleet KPIs come from the frames the page has already loaded. Every figure is serialized once - the JSON file
+and the inlined HTML are the same string.
+"""
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import plotly.io as pio
+import plotly.offline
+
+import graph_utils
+import loaders
+import sites
+from analytics import align, backwash, fleet, pumps, quality, storage, system_flow, units
+
+REPORT_WORKERS = int(os.environ.get("DASHBOARD_REPORT_WORKERS", min(4, os.cpu_count() or 1)))
+LOW_COVERAGE = 0.8  # as on the System Flow page
+PAGE_TITLES = {
+    "raw_data": "Raw Data",
+    "system_flow": "System Flow",
+    "pump_curves": "Pump Curves",
+    "water_losses": "Water Losses",
+    "storage": "Storage",
+}
+
+
+def slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def _window(df: pd.DataFrame, start, end, column: str | None = None) -> pd.DataFrame:
+    """ Rows between start (inclusive) and end (exclusive), by the index or by a date column """
+    ts = df.index if column is None else df[column]
+    return df.loc[(ts >= start) & (ts < end)]
+
+
+def _has(site: sites.Site, *datasets: str) -> bool:
+    return any(os.path.exists(site.path(d)) for d in datasets)
+
+
+#######################################################################################################
+# Page reports - (figures, tables, metrics) of a page for a window, None when the site lacks its data
+#######################################################################################################
+def raw_data_report(site: sites.Site, start, end, clean: bool, resolution: str):
+    if not _has(site, *loaders.RAW_DATASETS):
+        return None
+    freq = align.RESOLUTIONS[resolution]
+    data = _window(loaders.load_aligned_sensors(freq, "mean", clean, site=site), start, end)
+    coverage = loaders.load_sensor_coverage(freq, "mean", clean, site=site).rename(
+        index=lambda label: label.replace("<br>", " "))  # a copy, the cached frame is shared
+    figures = {}
+    if len(data):
+        fig = graph_utils.plot_time_series(data=data.copy(), height_single=300, vertical_spacing=0.08,
+                                           line_kw=dict(line_width=1.6))
+        for row, label in enumerate(data.columns, start=1):
+            gaps = quality.intervals_frame(loaders.load_quality_index(loaders.RAW_SENSORS[label][0], site),
+                                           min_hours=24)
+            graph_utils.shade_intervals(fig, gaps[(gaps["x1"] >= start) & (gaps["x0"] < end)], row=row)
+        fig.update_layout(margin=dict(t=0))
+        figures["sensors"] = fig
+    return figures, {"sensor_coverage": coverage}, {"resolution": resolution, "rows": len(data)}
+
+
+def system_flow_report(site: sites.Site, start, end, clean: bool, resolution: str):
+    if not _has(site, "system_flow"):
+        return None
+    hourly = _window(loaders.load_hourly_system_flow(site, clean), start, end)
+    quality_index = loaders.load_quality_index("system_flow", site)
+    monthly_coverage = quality_index.monthly_coverage
+    monthly_coverage = monthly_coverage[(monthly_coverage.index >= start.to_period("M").to_timestamp())
+                                        & (monthly_coverage.index < end)]
+    totals = system_flow.monthly_totals(hourly[loaders.DEMAND_COL])
+    figures = {"monthly_totals": graph_utils.monthly_totals_figure(
+        totals, quality.monthly_coverage_pivot(monthly_coverage), LOW_COVERAGE)}
+
+    periods = system_flow.build_period_options(hourly.index, "Monthly") if len(hourly) else []
+    profiles = loaders.load_period_profiles("Monthly", periods, clean, site=site)
+    coverage = {p: quality.coverage_between(quality_index.daily_coverage, *system_flow.period_bounds("Monthly", p))
+                for p in profiles}
+    stats = system_flow.period_statistics(profiles, coverage)
+    figures["hourly_profiles"] = graph_utils.hourly_profiles_figure(profiles, "Monthly")
+    figures["statistics"] = graph_utils.stats_table_figure(stats)
+    total_gal = float((hourly[loaders.DEMAND_COL].astype(float) * 60.0).sum())
+    return figures, {"monthly_totals": totals, "statistics": stats}, {"total_gal": total_gal}
+
+
+def pump_curves_report(site: sites.Site, start, end, clean: bool, resolution: str):
+    if not _has(site, "pump_curves"):
+        return None
+    df = loaders.load_hourly_pump_points(1, site=site)
+    dfv = _window(df, start, end, "Date")
+    usage = dfv["cluster"].value_counts(normalize=True).rename("share_of_hours")
+    usage.index = [pumps.LEGEND_ITEMS[int(c)] for c in usage.index]
+    return ({"pump_curves": graph_utils.pump_curves_figure(df, dfv)}, {"cluster_usage": usage.to_frame()},
+            fleet.pump_kpis(dfv))
+
+
+def water_losses_report(site: sites.Site, start, end, clean: bool, resolution: str):
+    if not _has(site, "backwash"):
+        return None
+    df = _window(loaders.load_backwash(site=site), start, end, "Date")
+    event_pairs, duration_pairs = backwash.backwash_pairs(df)
+    metrics = backwash.backwash_metrics(df)
+    return {"backwash": graph_utils.backwash_figure(event_pairs, duration_pairs)}, {}, metrics._asdict()
+
+
+def storage_report(site: sites.Site, start, end, clean: bool, resolution: str):
+    if not _has(site, "storage"):
+        return None
+    levels = loaders.load_storage_levels(clean, site=site)
+    threshold = storage.critical_threshold_ft(levels)  # the page's default, the threshold of the whole dataset
+    full = loaders.load_storage_metrics(threshold, clean, site=site)
+    metrics = {"threshold_ft": threshold, **{f"{k}_all": v for k, v in full._asdict().items()}}
+    data = _window(levels, start, end, "Date")
+    if data.empty:  # the tank data ends before the window or starts after it
+        return {}, {}, metrics
+    level_ft = units.derived_column(data, "water_level_ft")
+    violations = storage.violation_intervals(level_ft, threshold)
+    window = storage.storage_metrics(data["water_level_m"], threshold)
+    metrics.update({f"{k}_window": v for k, v in window._asdict().items()})
+    return ({"storage_level": graph_utils.storage_level_figure(level_ft.to_frame(), threshold, violations)},
+            {"violations": violations}, metrics)
+
+
+PAGES = {
+    "raw_data": raw_data_report,
+    "system_flow": system_flow_report,
+    "pump_curves": pump_curves_report,
+    "water_losses": water_losses_report,
+    "storage": storage_report,
+}
+# page -> fleet KPIs (whole dataset, as on the Fleet Summary page) from the frames the page has loaded
+PAGE_KPIS = {
+    "system_flow": lambda site: fleet.consumption_kpis(loaders.load_hourly_system_flow(site)[loaders.DEMAND_COL]),
+    "pump_curves": lambda site: fleet.pump_kpis(loaders.load_hourly_pump_points(1, site=site)),
+    "water_losses": lambda site: fleet.backwash_kpis(loaders.load_backwash(site=site)),
+    "storage": lambda site: fleet.storage_kpis(loaders.load_storage_levels(site=site)),
+}
+
+
+#######################################################################################################
+# Rendering
+#######################################################################################################
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _figure_html(fig_id: str, fig_json: str) -> str:
+    return (f'<div id="{fig_id}"></div>\n<script>(function() {{ var f = {fig_json}; '
+            f'Plotly.newPlot("{fig_id}", f.data, f.layout, {{responsive: true}}); }})();</script>')
+
+
+def _metrics_html(metrics: dict) -> str:
+    rows = "".join(f"<tr><th>{html.escape(str(k))}</th><td>{v:.3f}</td></tr>" if isinstance(v, float)
+                   else f"<tr><th>{html.escape(str(k))}</th><td>{html.escape(str(v))}</td></tr>"
+                   for k, v in metrics.items())
+    return f'<table class="metrics">{rows}</table>'
+
+
+def render_page(site_name: str, page: str, start, end, clean: bool, resolution: str, out_dir: str) -> dict:
+    """
+    Compute one page of a site and write its files, returns its manifest entry and HTML section. Runs in the workers;
+    a page that fails is reported in its manifest entry (`error`) and section, the other pages are still built
+    """
+    t0 = time.perf_counter()
+    entry = {"site": site_name, "page": page, "files": [], "metrics": {}}
+    section = [f'<h2 id="{page}">{PAGE_TITLES[page]}</h2>']
+    kpis = {}
+    try:
+        kpis = _render_page(site_name, page, pd.Timestamp(start), pd.Timestamp(end), clean, resolution, out_dir,
+                            entry, section)
+    except Exception as e:
+        traceback.print_exc()
+        entry["error"] = f"{type(e).__name__}: {e}"
+        section.append(f"<p>Failed: {html.escape(entry['error'])}</p>")
+    entry["seconds"] = time.perf_counter() - t0
+    return {"entry": entry, "html": "\n".join(section), "kpis": kpis}
+
+
+def _render_page(site_name: str, page: str, start, end, clean: bool, resolution: str, out_dir: str,
+                 entry: dict, section: list) -> dict:
+    """ Fills the manifest entry and the HTML section of the page, returns its fleet KPIs """
+    site = sites.get_site(site_name)
+    entry["site"] = site.name
+    result = PAGES[page](site, start, end, clean, resolution)
+    kpis = {}
+    if result is None:
+        section.append("<p>No data for this site.</p>")
+    else:
+        if page in PAGE_KPIS:
+            kpis = PAGE_KPIS[page](site)
+        figures, tables, metrics = result
+        page_dir = os.path.join(out_dir, slug(site.name), page)
+        os.makedirs(page_dir, exist_ok=True)
+        for name, fig in figures.items():
+            fig_json = pio.to_json(fig, validate=False)  # serialized once, for the file and the HTML
+            with open(os.path.join(page_dir, f"{name}.json"), "w") as f:
+                f.write(fig_json)
+            entry["files"].append(f"{page}/{name}.json")
+            section.append(_figure_html(f"{page}-{name}", fig_json))
+        for name, df in tables.items():
+            df.to_csv(os.path.join(page_dir, f"{name}.csv"))
+            entry["files"].append(f"{page}/{name}.csv")
+            section.append(f"<h3>{html.escape(name.replace('_', ' ').capitalize())}</h3>"
+                           f"{df.to_html(float_format=lambda v: f'{v:,.3f}', na_rep='', border=0)}")
+        entry["metrics"] = {k: (float(v) if isinstance(v, float) else v) for k, v in metrics.items()}
+        with open(os.path.join(page_dir, "metrics.json"), "w") as f:
+            json.dump(entry["metrics"], f, indent=2, default=_json_default)
+        entry["files"].append(f"{page}/metrics.json")
+        if not figures and not tables:
+            section.append("<p>No data in this window.</p>")
+        section.append(_metrics_html(entry["metrics"]))
+    return kpis
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<script src="{plotly_js}"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+th, td {{ padding: 2px 10px; text-align: right; border-bottom: 1px solid #ddd; }}
+</style></head>
+<body><h1>{title}</h1>
+{body}
+</body></html>
+"""
+
+
+def _write_html(path: str, title: str, body: str, plotly_js: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HTML_TEMPLATE.format(title=html.escape(title), plotly_js=plotly_js, body=body))
+
+
+def build_reports(site_names, start, end, out_dir: str, clean: bool = False, resolution: str = "1 hour",
+                  pages=None, workers: int = REPORT_WORKERS) -> dict:
+    """ Write the report bundles of the sites for start (inclusive) .. end (exclusive), returns the manifest """
+    t0 = time.perf_counter()
+    pages = list(pages or PAGES)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "plotly.min.js"), "w", encoding="utf-8") as f:
+        f.write(plotly.offline.get_plotlyjs())
+
+    tasks = [(name, page) for name in site_names for page in pages]
+    args = (str(start), str(end), clean, resolution, out_dir)
+    if workers > 1:
+        # spawned rather than forked workers, like the fleet summary - the caller may run threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            rendered = list(pool.map(render_page, *zip(*tasks), *[[a] * len(tasks) for a in args]))
+    else:
+        rendered = [render_page(name, page, *args) for name, page in tasks]
+
+    period = f"{start.date()} - {(end - pd.Timedelta(days=1)).date()}"
+    kpis = {name: {} for name in site_names}
+    for name in site_names:
+        parts = [r for r in rendered if r["entry"]["site"] == sites.get_site(name).name]
+        for r in parts:
+            kpis[name].update(r["kpis"])
+        toc = " | ".join(f'<a href="#{r["entry"]["page"]}">{PAGE_TITLES[r["entry"]["page"]]}</a>' for r in parts)
+        site_dir = os.path.join(out_dir, slug(name))
+        os.makedirs(site_dir, exist_ok=True)
+        _write_html(os.path.join(site_dir, "index.html"), f"{name}, {period}",
+                    f"<p>{toc}</p>\n" + "\n".join(r["html"] for r in parts), "../plotly.min.js")
+
+    fleet_df = pd.DataFrame.from_dict(kpis, orient="index").reindex(columns=fleet.KPI_COLUMNS)
+    fleet_df.to_csv(os.path.join(out_dir, "fleet.csv"))
+    manifest = {
+        "start": str(start), "end": str(end), "clean": clean, "resolution": resolution,
+        "sites": {name: slug(name) for name in site_names},
+        "pages": [r["entry"] for r in rendered],
+        "seconds": time.perf_counter() - t0,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, default=_json_default)
+    links = "".join(f'<li><a href="{slug(name)}/index.html">{html.escape(name)}</a></li>' for name in site_names)
+    _write_html(os.path.join(out_dir, "index.html"), f"Dashboard report, {period}",
+                f"<ul>{links}</ul>\n<h2>Fleet Summary</h2>\n"
+                f"{fleet_df.to_html(float_format=lambda v: f'{v:,.3f}', na_rep='', border=0)}\n"
+                f"<p>Built in {manifest['seconds']:.1f} s.</p>", "plotly.min.js")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every page of the dashboard to static report files")
+    parser.add_argument("--sites", nargs="+", default=None, help="all registered sites by default")
+    parser.add_argument("--start", required=True, help="first day of the report")
+    parser.add_argument("--end", required=True, help="day after the last day of the report")
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=None)
+    parser.add_argument("--resolution", choices=list(align.RESOLUTIONS), default="1 hour",
+                        help="of the Raw Data charts")
+    parser.add_argument("--clean", action="store_true", help="filter outliers")
+    parser.add_argument("--workers", type=int, default=REPORT_WORKERS)
+    args = parser.parse_args()
+
+    registered = sites.all_sites()
+    names = args.sites or list(registered)
+    unknown = [n for n in names if n not in registered]
+    if unknown:
+        parser.error(f"unknown sites {unknown}, one of {list(registered)}")
+    manifest = build_reports(names, args.start, args.end, args.out, args.clean, args.resolution, args.pages,
+                             args.workers)
+    for entry in manifest["pages"]:
+        print(f"{entry['site']:<20} {entry['page']:<13} {entry['seconds']:6.2f}s  {len(entry['files'])} files"
+              + (f"  FAILED {entry['error']}" if "error" in entry else ""))
+    print(f"{len(manifest['pages'])} pages in {manifest['seconds']:.1f}s, report in {args.out}/index.html")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Registry of the communities shown by the dashboard.
+
+Every site's datasets live in their own folder with the same layout (`LAYOUT`):
+
+    data/sites/<site>/1_raw sensor data/3_system_flow.csv
+    data/sites/<site>/water_level_data.csv
+    ...
+
+An optional `site.json` in the folder sets the display name and home page photos. Arctic Village predates the
+partitioned layout and keeps its files directly under `data/`. Discovering the sites only lists folders - no
+dataset is read until a page asks the loaders for it - and the registry is kept until the folders change.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import streamlit as st
+
+SITES_DIR = "data/sites"
+DEFAULT_SITE = "Arctic Village"
+# the registry is kept until a site folder is added or removed; site.json edits are picked up after this many seconds
+SITES_CHECK_SEC = float(os.environ.get("DASHBOARD_SITES_CHECK", 5))
+
+# dataset -> file, relative to the site folder
+LAYOUT = {
+    "treated_flow": "1_raw sensor data/1_treated_water.csv",
+    "tank_level": "1_raw sensor data/2_tank_water_level.csv",
+    "system_flow": "1_raw sensor data/3_system_flow.csv",
+    "pressure": "1_raw sensor data/4_system_pressure.csv",
+    "storage": "water_level_data.csv",
+    "pump_curves": "2_pump curves/pressure_pump_curves.csv",
+    "backwash": "backwash_plot_data_comprehensive.csv",
+}
+RAW_SENSOR_DIR = "1_raw sensor data"
+DEFAULT_PHOTOS = ("resources/unalakleet1.jpg", "resources/unalakleet2.jpg")
+
+
+class Site(NamedTuple):
+    name: str
+    root: str
+    files: dict
+    photos: tuple = DEFAULT_PHOTOS
+
+    def path(self, dataset: str) -> str:
+        return self.files[dataset]
+
+    @property
+    def raw_dir(self) -> str:
+        return os.path.dirname(self.files["system_flow"])
+
+
+ARCTIC_VILLAGE = Site(
+    name="Arctic Village",
+    root="data",
+    files={**{k: f"data/{v}" for k, v in LAYOUT.items()}, "storage": "data/Arctic Village_water_level_data.csv"},
+)
+
+
+def read_site(folder: str) -> Site:
+    """ Site of a partitioned folder, `site.json` may set {"name": ..., "photos": [...]} """
+    config = {}
+    config_path = os.path.join(folder, "site.json")
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = json.load(f)
+
+    photos = config.get("photos")
+    if photos is None:
+        photos = sorted(glob.glob(os.path.join(folder, "photos", "*.jpg")))
+    else:
+        photos = [os.path.join(folder, p) for p in photos]
+    return Site(
+        name=config.get("name", os.path.basename(folder)),
+        root=folder,
+        files={k: os.path.join(folder, v) for k, v in LAYOUT.items()},
+        photos=tuple(photos) or DEFAULT_PHOTOS,
+    )
+
+
+def _scan_sites(sites_dir: str) -> dict[str, Site]:
+    sites = {ARCTIC_VILLAGE.name: ARCTIC_VILLAGE}
+    if os.path.isdir(sites_dir):
+        for entry in sorted(os.scandir(sites_dir), key=lambda e: e.name):
+            if entry.is_dir():
+                site = read_site(entry.path)
+                sites.setdefault(site.name, site)
+    return sites
+
+
+def _mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _config_signature(sites_dir: str) -> tuple:
+    """ mtimes of the site.json files and photo folders """
+    if not os.path.isdir(sites_dir):
+        return ()
+    return tuple((entry.name, _mtime(os.path.join(entry.path, "site.json")), _mtime(os.path.join(entry.path, "photos")))
+                 for entry in sorted(os.scandir(sites_dir), key=lambda e: e.name) if entry.is_dir())
+
+
+_registry = {}  # sites dir -> (folder mtime, config signature, time the signature was taken, sites)
+_registry_lock = threading.Lock()
+
+
+def _registry_sites(sites_dir: str) -> dict[str, Site]:
+    """
+    The scanned sites of a folder, scanned again when a site folder is added or removed (the folder's mtime) or,
+    checked at most every SITES_CHECK_SEC, when a site.json or photos folder changed
+    """
+    now = time.monotonic()
+    mtime = _mtime(sites_dir)
+    with _registry_lock:
+        cached = _registry.get(sites_dir)
+        if cached is not None and cached[0] == mtime:
+            if now - cached[2] < SITES_CHECK_SEC:
+                return cached[3]
+            signature = _config_signature(sites_dir)
+            if signature == cached[1]:
+                _registry[sites_dir] = (mtime, signature, now, cached[3])
+                return cached[3]
+        signature = _config_signature(sites_dir)
+        sites = _scan_sites(sites_dir)
+        _registry[sites_dir] = (mtime, signature, now, sites)
+        return sites
+
+
+def all_sites(sites_dir: str | None = None) -> dict[str, Site]:
+    """ Site name -> Site, the default site first and the partitioned sites in name order """
+    return dict(_registry_sites(sites_dir or SITES_DIR))
+
+
+def get_site(name: str | None = None) -> Site:
+    """ The named site, the one selected in the current session if no name is given """
+    sites = _registry_sites(SITES_DIR)
+    name = name or selected()
+    return sites.get(name, sites[DEFAULT_SITE])
+
+
+def selected() -> str:
+    if st.runtime.exists():
+        return st.session_state.get("site", DEFAULT_SITE)
+    return DEFAULT_SITE
+
+
+def site_selector():
+    """ Sidebar selector of the site shown by every page, the choice is kept in st.session_state["site"] """
+    names = list(all_sites())
+    if st.session_state.get("site") not in names:
+        st.session_state["site"] = DEFAULT_SITE
+    if len(names) > 1:
+        st.sidebar.selectbox("Community", names, key="site")
+    return get_site()
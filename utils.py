@@ -1,13 +1,14 @@
 import streamlit as st
-import base64
+
+import assets
 
 GRAPHS_FONT_SIZE = 24
+ICON_HEIGHT = 100
 
 
 def custom_button(png_path: str, label: str, button_id: str):
-    with open(png_path, "rb") as f:
-        data = f.read()
-    encoded = base64.b64encode(data).decode()
+    # the icon is served as a static file, so nothing is read or encoded on reruns
+    icon_url = assets.static_url(png_path, ICON_HEIGHT)
 
     # CSS + HTML template
     button_html = f"""
@@ -30,11 +31,11 @@ def custom_button(png_path: str, label: str, button_id: str):
 
         }}
         .custom-button-{button_id} img {{
-            height: 100px;
+            height: {ICON_HEIGHT}px;
         }}
         </style>
         <a class="custom-button-{button_id}" target="_self" href="?clicked={button_id}">
-            <img src="data:image/png;base64,{encoded}">
+            <img src="{icon_url}">
             {label}
         </a>
     """
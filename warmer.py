@@ -0,0 +1,178 @@
+"""
+Background cache warmer.
+
+A daemon thread started with the app fills the process-wide cache with everything the pages load on their first
+run - parsed datasets, hourly resamples, monthly totals, quality indices, aligned sensors, storage metrics, pump
+points - so that the first session after a deploy or a data update does not pay for it. It then polls the dataset
+files and warms a site again when one of its files changes.
+
+Only the default site and the sites sessions have used recently are warmed, warming more would evict the cache
+entries of the sites in use (see loaders.RECENT_SITES). A session asking for an entry the warmer is computing waits
+for that entry only, the warmer holds no other lock.
+"""
+import os
+import threading
+import time
+import traceback
+from functools import partial
+
+import loaders
+import sites
+from analytics import align, storage
+from cache import file_signature
+
+WARM_ON_START = os.environ.get("DASHBOARD_WARM", "1") == "1"
+# seconds between two checks of the dataset files for changes
+WARM_INTERVAL_SEC = float(os.environ.get("DASHBOARD_WARM_INTERVAL", 30))
+
+
+def page_tasks(site: sites.Site) -> dict[str, list]:
+    """ Page title -> (name, fn) of the loader calls behind its default view, for the datasets the site has """
+    def exists(dataset):
+        return os.path.exists(site.path(dataset))
+
+    pages = {}
+    raw = [d for d in loaders.RAW_DATASETS if exists(d)]
+    if raw:
+        # Raw Data page default: first resolution, mean, outliers filtered
+        freq = next(iter(align.RESOLUTIONS.values()))
+        pages["Raw Data"] = (
+            [(f"sensor {d}", partial(loaders.load_sensor, d, site)) for d in raw]
+            + [(f"quality index {d}", partial(loaders.load_quality_index, d, site)) for d in raw]
+            + [("aligned sensors", partial(loaders.load_aligned_sensors, freq, "mean", True, site=site)),
+               ("sensor coverage", partial(loaders.load_sensor_coverage, freq, "mean", True, site=site))])
+    if exists("system_flow"):
+        pages["System Flow"] = [
+            ("sensor system_flow", partial(loaders.load_sensor, "system_flow", site)),
+            ("quality index system_flow", partial(loaders.load_quality_index, "system_flow", site)),
+            ("hourly system flow", partial(loaders.load_hourly_system_flow, site)),
+            ("monthly totals", partial(loaders.load_monthly_totals, site)),
+            ("demand forecast", partial(loaders.load_demand_forecast, site)),
+        ]
+    if exists("pump_curves"):
+        pages["Pump Curves"] = [("pump points", partial(loaders.load_hourly_pump_points, 1, site=site))]
+    if exists("backwash"):
+        pages["Water Losses"] = [("backwash", partial(loaders.load_backwash, site=site))]
+    if exists("storage"):
+        def storage_metrics():
+            threshold = storage.critical_threshold_ft(loaders.load_storage_levels(site=site))
+            return loaders.load_storage_metrics(threshold, site=site)
+        pages["Storage"] = [("storage metrics", storage_metrics)]
+    return pages
+
+
+def site_tasks(site: sites.Site) -> list:
+    """ (name, fn) of the loader calls behind the default view of every page, each once """
+    tasks = {}
+    for page in page_tasks(site).values():
+        for name, fn in page:
+            tasks.setdefault(name, fn)
+    return list(tasks.items())
+
+
+def data_signature(site: sites.Site) -> tuple:
+    return tuple(file_signature(site.path(d)) for d in sorted(site.files))
+
+
+class CacheWarmer:
+    """ Warms the cache on start and after data changes, its progress is read with `status()` """
+    def __init__(self, interval: float = WARM_INTERVAL_SEC):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._warmed = {}  # site name -> data signature it was warmed with
+        self._state = {
+            "state": "idle",  # idle / warming / stopped
+            "site": None,
+            "task": None,
+            "done": 0,
+            "total": 0,
+            "last_warm_sec": None,
+            "last_finished": None,
+            "warm_runs": 0,
+            "errors": [],
+        }
+
+    def _set(self, **kwargs):
+        with self._lock:
+            self._state.update(kwargs)
+
+    def status(self) -> dict:
+        with self._lock:
+            state = dict(self._state)
+            state["errors"] = list(state["errors"])
+            return state
+
+    def _sites_to_warm(self) -> list:
+        default = sites.get_site(sites.DEFAULT_SITE)
+        return [default] + [s for s in loaders.recent_sites() if s.name != default.name]
+
+    def warm_site(self, site: sites.Site):
+        tasks = site_tasks(site)
+        self._set(state="warming", site=site.name, done=0, total=len(tasks))
+        t0 = time.perf_counter()
+        signature = data_signature(site)
+        for i, (name, fn) in enumerate(tasks):
+            if self._stop.is_set():
+                return
+            self._set(task=name)
+            try:
+                fn()
+            except Exception as e:
+                with self._lock:
+                    self._state["errors"] = (self._state["errors"] + [f"{site.name} / {name}: {e!r}"])[-10:]
+                traceback.print_exc()
+            self._set(done=i + 1)
+        self._warmed[site.name] = signature
+        with self._lock:
+            self._state.update(state="idle", task=None, last_warm_sec=time.perf_counter() - t0,
+                               last_finished=time.strftime("%Y-%m-%d %H:%M:%S"),
+                               warm_runs=self._state["warm_runs"] + 1)
+
+    def check(self):
+        """ Warm every site that was not warmed yet or whose dataset files changed since """
+        for site in self._sites_to_warm():
+            if self._stop.is_set():
+                return
+            if self._warmed.get(site.name) != data_signature(site):
+                self.warm_site(site)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
+        self._set(state="stopped", task=None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def start_warmer() -> CacheWarmer | None:
+    """ Start the process-wide cache warmer (once), None when disabled with DASHBOARD_WARM=0 """
+    global _warmer
+    if not WARM_ON_START:
+        return None
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = CacheWarmer().start()
+        return _warmer
+
+
+def active_warmer() -> CacheWarmer | None:
+    return _warmer